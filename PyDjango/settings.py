@@ -41,6 +41,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # per primo, così misura anche gli altri middleware (Server-Timing e /metrics)
+    'RistorantiRicetteIngredienti.middleware.PerformanceMiddleware',
+    # 503 oltre MAX_IN_FLIGHT richieste in corso, 429 per client oltre RATE_LIMITS
+    'RistorantiRicetteIngredienti.middleware.LimitiMiddleware',
+    # instradamento delle letture sulle repliche e cookie di read-your-writes
+    'RistorantiRicetteIngredienti.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,13 +80,68 @@ WSGI_APPLICATION = 'PyDjango.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Le connessioni sono persistenti (CONN_MAX_AGE) e verificate prima del riuso
+# (CONN_HEALTH_CHECKS); i PRAGMA di SQLite sono in SQLITE_PRAGMAS dell'app.
+# transaction_mode IMMEDIATE prende il lock di scrittura all'inizio delle
+# transazioni, così con WAL non si ottiene "database is locked" a metà.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # replica di sola lettura, copiata dal primario con `manage.py replicate_db`;
+    # nei test punta al database di test del primario
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+# Le letture delle viste di REPLICA_VIEWS vanno sulle repliche se sono
+# aggiornate (vedi RistorantiRicetteIngredienti/replica.py), il resto sul primario
+DATABASE_ROUTERS = ['RistorantiRicetteIngredienti.replica.RouterReplica']
+
+READ_REPLICAS = ['replica']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# 'default' contiene le risposte delle viste *_per_*, 'versioni' le loro versioni
+# (vedi RistorantiRicetteIngredienti/caching.py). Le risposte possono stare in
+# una cache locale a ogni processo, le versioni no: le invalidazioni fatte dai
+# processi run_workers e dagli altri processi web devono valere per tutti.
+# Con più server serve una cache di rete (Redis, Memcached) per entrambe.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ristoranti-ricette-ingredienti',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'versioni': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'versioni',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
+CACHE_VERSION_ALIAS = 'versioni'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -118,6 +179,47 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+# I record vengono messi in coda dalle viste e scritti su file e console da un
+# thread in background, così le richieste non attendono l'I/O su disco.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s - %(levelname)s - %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'level': 'INFO',
+            'formatter': 'standard',
+        },
+        'file': {
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'app.log',
+            'delay': True,
+            'level': 'DEBUG',
+            'formatter': 'standard',
+        },
+        'queue': {
+            'class': 'RistorantiRicetteIngredienti.log.BackgroundQueueHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
+        },
+    },
+    'loggers': {
+        'RistorantiRicetteIngredienti': {
+            'handlers': ['queue'],
+            'level': 'DEBUG',
+            'propagate': False,
+        },
+    },
+}
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,28 @@
+"""
+Profilo di deployment ASGI per PyDjango.
+
+Estende settings.py attivando le viste di lettura asincrone (ASYNC_VIEWS), che
+usano l'ORM asincrono di Django. È il profilo predefinito di asgi.py, ad esempio:
+
+    uvicorn PyDjango.asgi:application --workers 4
+    gunicorn PyDjango.asgi:application -k uvicorn.workers.UvicornWorker --workers 4
+
+Note:
+- Le viste di scrittura restano sincrone e sotto ASGI vengono eseguite in un
+  thread separato; i middleware di Django usati qui supportano entrambe le modalità.
+- L'ORM asincrono esegue comunque le query in un thread (uno per richiesta):
+  il vantaggio è che l'event loop non resta bloccato durante l'attesa del
+  database, non che le query diventino più veloci.
+- CONN_MAX_AGE è riportato a 0: sotto ASGI ogni richiesta usa un thread diverso,
+  quindi le connessioni persistenti non verrebbero riutilizzate.
+
+Il confronto con il deployment WSGI (PyDjango.wsgi) si fa con:
+
+    python manage.py compare_wsgi_asgi
+"""
+
+from .settings import *  # noqa: F401,F403
+
+ASYNC_VIEWS = True
+
+DATABASES = {alias: {**configurazione, 'CONN_MAX_AGE': 0} for alias, configurazione in DATABASES.items()}
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from RistorantiRicetteIngredienti import views as ristoranti_views
+
 urlpatterns = [
     path('RistorantiRicetteIngredienti/', include("RistorantiRicetteIngredienti.urls")),
     path('admin/', admin.site.urls),
+    path('metrics', ristoranti_views.metriche, name='metrics'),
 ]
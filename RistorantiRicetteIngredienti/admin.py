@@ -1,26 +1,158 @@
+"""
+Admin del catalogo, pensato per tabelle con centinaia di migliaia di righe:
+
+- le chiavi esterne usano il widget di autocompletamento invece di un <select>
+  con l'intera tabella;
+- la ricerca (casella degli elenchi e autocompletamento) usa l'indice full-text
+  di ricerca.py invece di LIKE '%...%' su tutta la tabella;
+- gli inline mostrano i collegamenti una pagina alla volta;
+- gli elenchi non filtrati di tabelle grandi mostrano un conteggio stimato
+  invece di eseguire COUNT(*).
+"""
+import math
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from . import ricerca
+from . import settings as app_settings
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, Lavoro
+
+class PaginatoreStimato(Paginator):
+    """
+    Paginatore degli elenchi: per un queryset senza filtri su SQLite il numero
+    di righe è stimato con MAX(id), che legge solo l'ultima pagina del b-tree.
+    Il filtro del manager predefinito (deleted_at nullo, vedi CatalogoManager)
+    non conta come filtro: MAX(id) è letto senza, dal manager di base.
+    La stima può superare il numero reale se ci sono state eliminazioni (le
+    ultime pagine risultano allora vuote); sotto ADMIN_COUNT_ESTIMATE_THRESHOLD
+    o con un filtro attivo il conteggio è esatto.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = queryset.query
+        modello = queryset.model
+        non_filtrato = query.where == modello._default_manager.all().query.where
+        if non_filtrato and not query.distinct and connections[queryset.db].vendor == 'sqlite':
+            stima = modello._base_manager.using(queryset.db).aggregate(stima=Max('pk'))['stima']
+            if stima is not None and stima > app_settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+                return stima
+        return super().count
+
+class AdminCatalogo(admin.ModelAdmin):
+    paginator = PaginatoreStimato
+    # niente secondo COUNT(*) sull'intera tabella per "N risultati (M totali)"
+    show_full_result_count = False
+    # ordinamento esplicito anche per l'autocompletamento (l'elenco userebbe comunque -pk)
+    ordering = ('-pk',)
+    # tipo dell'oggetto nell'indice full-text (vedi ricerca.TIPI); None = ricerca di Django
+    tipo_ricerca = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if self.tipo_ricerca is None:
+            return super().get_search_results(request, queryset, search_term)
+        if not search_term.strip():
+            return queryset, False
+        risultati = ricerca.cerca(search_term, tipi=[self.tipo_ricerca], limite=app_settings.ADMIN_SEARCH_LIMIT)
+        return queryset.filter(pk__in=[risultato['id'] for risultato in risultati]), False
+
+class InlinePaginato(admin.TabularInline):
+    """
+    Inline che mostra ADMIN_INLINE_PER_PAGE collegamenti per volta; la pagina
+    è scelta con il parametro GET <prefisso>-pagina, che resta nell'url anche
+    quando il modulo viene inviato, così le righe salvate sono quelle mostrate.
+    I link tra le pagine cambiano solo il parametro del proprio inline: restano
+    i filtri dell'elenco (_changelist_filters) e la pagina degli altri inline.
+    """
+    extra = 0
+    template = 'admin/RistorantiRicetteIngredienti/tabular_paginato.html'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        per_pagina = app_settings.ADMIN_INLINE_PER_PAGE
+
+        class FormsetPaginato(formset):
 
-from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente
+            def get_queryset(self):
+                if not hasattr(self, '_pagina'):
+                    queryset = super().get_queryset()
+                    self.totale = queryset.count()
+                    self.pagine = max(1, math.ceil(self.totale / per_pagina))
+                    try:
+                        self.pagina = int(request.GET.get(f'{self.prefix}-pagina', 1))
+                    except ValueError:
+                        self.pagina = 1
+                    self.pagina = min(max(self.pagina, 1), self.pagine)
+                    inizio = (self.pagina - 1) * per_pagina
+                    self._pagina = queryset[inizio:inizio + per_pagina]
+                return self._pagina
 
-class RistoranteToRicettaInline(admin.TabularInline):
+            def _url_pagina(self, pagina):
+                parametri = request.GET.copy()
+                parametri[f'{self.prefix}-pagina'] = pagina
+                return parametri.urlencode()
+
+            def url_precedente(self):
+                return self._url_pagina(self.pagina - 1)
+
+            def url_successiva(self):
+                return self._url_pagina(self.pagina + 1)
+
+        return FormsetPaginato
+
+class RistoranteToRicettaInline(InlinePaginato):
     model = RistoranteToRicetta
-    extra = 1
+    autocomplete_fields = ('ristorante', 'ricetta')
 
-class RicettaToIngredienteInline(admin.TabularInline):
+class RicettaToIngredienteInline(InlinePaginato):
     model = RicettaToIngrediente
-    extra = 1
+    autocomplete_fields = ('ricetta', 'ingrediente')
 
-class RistoranteAdmin(admin.ModelAdmin):
+class RistoranteAdmin(AdminCatalogo):
     inlines = (RistoranteToRicettaInline,)
+    search_fields = ('ristorante_text',)
+    tipo_ricerca = 'ristorante'
 
-class RicettaAdmin(admin.ModelAdmin):
+class RicettaAdmin(AdminCatalogo):
     inlines = (RistoranteToRicettaInline, RicettaToIngredienteInline,)
+    search_fields = ('ricetta_text',)
+    tipo_ricerca = 'ricetta'
 
-class IngredienteAdmin(admin.ModelAdmin):
+class IngredienteAdmin(AdminCatalogo):
     inlines = (RicettaToIngredienteInline,)
+    search_fields = ('ingrediente_text',)
+    tipo_ricerca = 'ingrediente'
+
+class RistoranteToRicettaAdmin(AdminCatalogo):
+    list_display = ('id', 'ristorante', 'ricetta')
+    list_select_related = ('ristorante', 'ricetta')
+    autocomplete_fields = ('ristorante', 'ricetta')
+
+class RicettaToIngredienteAdmin(AdminCatalogo):
+    list_display = ('id', 'ricetta', 'ingrediente')
+    list_select_related = ('ricetta', 'ingrediente')
+    autocomplete_fields = ('ricetta', 'ingrediente')
+
+class LavoroAdmin(admin.ModelAdmin):
+    """Sola lettura: i lavori si creano con lavori.accoda() e li aggiornano i worker."""
+    list_display = ('id', 'task', 'status', 'attempts', 'run_after', 'locked_by', 'finished_at')
+    list_filter = ('status', 'task')
+    ordering = ('-pk',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 admin.site.register(Ristorante, RistoranteAdmin)
 admin.site.register(Ricetta, RicettaAdmin)
 admin.site.register(Ingrediente, IngredienteAdmin)
-admin.site.register(RistoranteToRicetta)
-admin.site.register(RicettaToIngrediente)
\ No newline at end of file
+admin.site.register(RistoranteToRicetta, RistoranteToRicettaAdmin)
+admin.site.register(RicettaToIngrediente, RicettaToIngredienteAdmin)
+admin.site.register(Lavoro, LavoroAdmin)
@@ -0,0 +1,155 @@
+"""
+Manutenzione della tabella materializzata RistoranteIngrediente.
+
+Per ogni coppia (ristorante, ingrediente) la tabella contiene il numero di
+ricette del ristorante che usano l'ingrediente: è il risultato della join
+RistoranteToRicetta -> RicettaToIngrediente letta da ingredienti_per_ristorante.
+Ristoranti, ricette e ingredienti eliminati in modo logico non contano:
+elimina_logicamente() ricalcola le righe dei loro collegamenti.
+
+Le modifiche ai collegamenti (segnali dei modelli e operazioni bulk, vedi
+signals.py) ricalcolano solo le righe interessate: per un insieme di ristoranti
+e uno di ingredienti le righe vengono eliminate e reinserite con una
+INSERT ... SELECT sulla join, ristretta a quei ristoranti e ingredienti. Il
+ricalcolo non dipende dallo stato precedente, quindi resta corretto anche
+quando un segnale riporta collegamenti già esistenti o già eliminati.
+
+ricostruisci() rigenera l'intera tabella (comando rebuild_ingredient_rollup),
+verifica() la confronta con la join (comando check_ingredient_rollup).
+"""
+from django.db import connection, transaction
+
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, RistoranteIngrediente
+
+# numero massimo di id per clausola IN
+BLOCCO = 500
+
+_TABELLA = RistoranteIngrediente._meta.db_table
+_RISTORANTI_RICETTE = RistoranteToRicetta._meta.db_table
+_RICETTE_INGREDIENTI = RicettaToIngrediente._meta.db_table
+
+# collegamenti ristorante -> ricetta -> ingrediente tra righe non eliminate in modo logico
+_COLLEGAMENTI = f"""
+    "{_RISTORANTI_RICETTE}" rr
+    JOIN "{_RICETTE_INGREDIENTI}" ri ON ri.ricetta_id = rr.ricetta_id
+    JOIN "{Ristorante._meta.db_table}" r ON r.id = rr.ristorante_id AND r.deleted_at IS NULL
+    JOIN "{Ricetta._meta.db_table}" c ON c.id = rr.ricetta_id AND c.deleted_at IS NULL
+    JOIN "{Ingrediente._meta.db_table}" i ON i.id = ri.ingrediente_id AND i.deleted_at IS NULL
+"""
+
+_JOIN = f"""
+    SELECT rr.ristorante_id AS ristorante_id, ri.ingrediente_id AS ingrediente_id, COUNT(*) AS recipe_count
+    FROM {_COLLEGAMENTI}
+"""
+_RAGGRUPPA = 'GROUP BY rr.ristorante_id, ri.ingrediente_id'
+
+# coppie attese con una riga mancante o un conteggio diverso: (ristorante, ingrediente, atteso, trovato)
+_ERRATE = f"""
+    SELECT a.ristorante_id, a.ingrediente_id, a.recipe_count, m.recipe_count
+    FROM ({_JOIN} {_RAGGRUPPA}) a
+    LEFT JOIN "{_TABELLA}" m ON m.ristorante_id = a.ristorante_id AND m.ingrediente_id = a.ingrediente_id
+    WHERE m.recipe_count IS NULL OR m.recipe_count <> a.recipe_count
+"""
+
+# righe per coppie che non compaiono nella join: (ristorante, ingrediente, None, trovato)
+_IN_ECCESSO = f"""
+    SELECT m.ristorante_id, m.ingrediente_id, NULL, m.recipe_count
+    FROM "{_TABELLA}" m
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {_COLLEGAMENTI}
+        WHERE rr.ristorante_id = m.ristorante_id AND ri.ingrediente_id = m.ingrediente_id
+    )
+"""
+
+
+def _blocchi(ids):
+    ids = sorted(ids)
+    for inizio in range(0, len(ids), BLOCCO):
+        yield ids[inizio:inizio + BLOCCO]
+
+
+def _segnaposto(ids):
+    return ', '.join(['%s'] * len(ids))
+
+
+def aggiorna(ristoranti, ingredienti):
+    """Ricalcola le righe di tutte le coppie (ristorante, ingrediente) dei due insiemi."""
+    ristoranti, ingredienti = set(ristoranti), set(ingredienti)
+    if not ristoranti or not ingredienti:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        for blocco_ristoranti in _blocchi(ristoranti):
+            for blocco_ingredienti in _blocchi(ingredienti):
+                in_ristoranti = _segnaposto(blocco_ristoranti)
+                in_ingredienti = _segnaposto(blocco_ingredienti)
+                parametri = blocco_ristoranti + blocco_ingredienti
+                cursor.execute(
+                    f'DELETE FROM "{_TABELLA}" '
+                    f'WHERE ristorante_id IN ({in_ristoranti}) AND ingrediente_id IN ({in_ingredienti})',
+                    parametri,
+                )
+                cursor.execute(
+                    f'INSERT INTO "{_TABELLA}" (ristorante_id, ingrediente_id, recipe_count) {_JOIN} '
+                    f'WHERE rr.ristorante_id IN ({in_ristoranti}) AND ri.ingrediente_id IN ({in_ingredienti}) '
+                    f'{_RAGGRUPPA}',
+                    parametri,
+                )
+
+
+def aggiorna_collegamenti(modello, coppie):
+    """
+    Ricalcola le righe interessate da collegamenti creati, spostati o
+    eliminati, indicati come coppie di id nell'ordine dei campi del modello.
+    """
+    coppie = set(coppie)
+    if not coppie:
+        return
+    if modello is RistoranteToRicetta:
+        ristoranti = {ristorante for ristorante, _ in coppie}
+        ingredienti = RicettaToIngrediente.objects.filter(
+            ricetta_id__in={ricetta for _, ricetta in coppie}
+        ).values_list('ingrediente_id', flat=True).distinct()
+    else:
+        ristoranti = RistoranteToRicetta.objects.filter(
+            ricetta_id__in={ricetta for ricetta, _ in coppie}
+        ).values_list('ristorante_id', flat=True).distinct()
+        ingredienti = {ingrediente for _, ingrediente in coppie}
+    aggiorna(ristoranti, ingredienti)
+
+
+def coppie_della_ricetta(ricetta):
+    """(ristoranti, ingredienti) della ricetta: le righe che dipendono dai suoi collegamenti."""
+    ristoranti = list(RistoranteToRicetta.objects.filter(ricetta_id=ricetta).values_list('ristorante_id', flat=True))
+    ingredienti = list(RicettaToIngrediente.objects.filter(ricetta_id=ricetta).values_list('ingrediente_id', flat=True))
+    return ristoranti, ingredienti
+
+
+def ricostruisci():
+    """Rigenera l'intera tabella dalla join; restituisce il numero di righe."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{_TABELLA}"')
+        cursor.execute(
+            f'INSERT INTO "{_TABELLA}" (ristorante_id, ingrediente_id, recipe_count) {_JOIN} {_RAGGRUPPA}'
+        )
+    return RistoranteIngrediente.objects.count()
+
+
+def verifica(esempi=10):
+    """
+    Confronta la tabella con la join. Restituisce (errate, in_eccesso, differenze):
+    il numero di coppie attese con una riga mancante o un conteggio diverso,
+    il numero di righe per coppie che non dovrebbero esserci, e fino a `esempi`
+    differenze come (ristorante, ingrediente, atteso, trovato), con None per
+    una riga assente.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM ({_ERRATE}) d')
+        errate = cursor.fetchone()[0]
+        cursor.execute(f'SELECT COUNT(*) FROM ({_IN_ECCESSO}) d')
+        in_eccesso = cursor.fetchone()[0]
+        differenze = []
+        for sql, quante in ((_ERRATE, errate), (_IN_ECCESSO, in_eccesso)):
+            if quante and len(differenze) < esempi:
+                cursor.execute(f'{sql} LIMIT %s', [esempi - len(differenze)])
+                differenze += cursor.fetchall()
+    return errate, in_eccesso, differenze
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RistorantiricetteingredientiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'RistorantiRicetteIngredienti'
+
+    def ready(self):
+        # collega i ricevitori dei segnali dei modelli e della creazione delle connessioni
+        # e registra i compiti della coda dei lavori
+        from . import signals, database, compiti  # noqa: F401
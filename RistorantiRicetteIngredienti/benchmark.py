@@ -0,0 +1,244 @@
+"""
+Suite di benchmark degli endpoint, eseguita in-process con il client di test di Django.
+
+Per ogni caso (almeno uno per ogni url di urls.py) vengono misurati latenza
+(p50, p95, p99), numero di query SQL e byte della risposta. I risultati si
+confrontano con una baseline salvata in JSON (benchmark_baseline.json): una
+query in più, una risposta più grande o una latenza (p50, p95) peggiore oltre
+la tolleranza sono regressioni.
+
+Le richieste di scrittura vengono eseguite in una transazione annullata alla
+fine, così il catalogo resta lo stesso per tutte le ripetizioni. Prima di ogni
+richiesta la cache delle risposte viene svuotata, per misurare l'accesso al
+database e non la cache. I limiti di richieste (RATE_LIMITS) sono disattivati
+durante l'esecuzione.
+
+Uso: python manage.py run_benchmarks (vedi anche seed_catalog per i dati).
+"""
+import json
+import statistics
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.cache import caches
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import settings as app_settings
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente
+
+BASELINE = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+# argomenti di seed_catalog con cui è stata registrata la baseline
+CATALOGO_BASELINE = {
+    'ristoranti': 100,
+    'ricette': 2000,
+    'ingredienti': 500,
+    'ricette_per_ristorante': 20,
+    'ingredienti_per_ricetta': 10,
+    'seed': 42,
+}
+
+# sotto questa soglia (in millisecondi) le differenze di latenza sono rumore
+SOGLIA_LATENZA_MS = 2.0
+
+
+def _id_centrale(modello):
+    """Id dell'oggetto a metà della tabella: stabile per un catalogo generato con lo stesso seed."""
+    ids = modello.objects.order_by('id').values_list('id', flat=True)
+    totale = ids.count()
+    return ids[totale // 2] if totale else 1
+
+
+def _ids(modello, quanti):
+    return list(modello.objects.order_by('id').values_list('id', flat=True)[:quanti])
+
+
+def casi():
+    """
+    Restituisce i casi del benchmark come lista di
+    (nome, url name, metodo, parametri GET, corpo JSON o None, scrittura), con
+    in coda, per le url con parametri nel percorso, il dizionario dei parametri.
+    Gli id usati sono letti dal catalogo corrente.
+    """
+    ristorante = _id_centrale(Ristorante)
+    # una ricetta del ristorante, così ha sia ristoranti che (di norma) ingredienti
+    ricetta = RistoranteToRicetta.objects.filter(ristorante_id=ristorante).order_by('ricetta_id').values_list(
+        'ricetta_id', flat=True
+    ).first() or _id_centrale(Ricetta)
+    ingrediente = _id_centrale(Ingrediente)
+    ristoranti = _ids(Ristorante, 50)
+    ricette = _ids(Ricetta, 50)
+    ingredienti = _ids(Ingrediente, 50)
+    parola = (Ingrediente.objects.filter(id=ingrediente).values_list('ingrediente_text', flat=True).first() or 'a').split()[0]
+    dispensa = list(RicettaToIngrediente.objects.filter(ricetta_id=ricetta).values_list('ingrediente_id', flat=True))
+    dispensa += ingredienti[:20]
+
+    return [
+        ('index', 'index', 'GET', {}, None, False),
+        ('lista_ristoranti', 'lista_ristoranti', 'GET', {}, None, False),
+        ('lista_ristoranti[limit]', 'lista_ristoranti', 'GET', {'limit': '100'}, None, False),
+        ('lista_ristoranti[stream]', 'lista_ristoranti', 'GET', {'stream': '1'}, None, False),
+        ('lista_ristoranti[fields]', 'lista_ristoranti', 'GET', {'fields': 'ristorante_text'}, None, False),
+        ('menu_ristoranti', 'menu_ristoranti', 'GET', {}, None, False),
+        ('menu_ristoranti[depth=1]', 'menu_ristoranti', 'GET', {'depth': '1', 'limit': '50'}, None, False),
+        ('menu_ristorante', 'menu_ristorante', 'GET', {}, None, False, {'ristorante_id': ristorante}),
+        ('ristoranti_per_ricetta', 'ristoranti_per_ricetta', 'GET', {'ricetta_id': ricetta}, None, False),
+        ('ristoranti_per_ricetta[batch]', 'ristoranti_per_ricetta', 'GET',
+         {'ricetta_id': ','.join(map(str, ricette[:10]))}, None, False),
+        ('ricette_per_ristorante', 'ricette_per_ristorante', 'GET', {'ristorante_id': ristorante}, None, False),
+        ('ricette_per_ristorante[batch]', 'ricette_per_ristorante', 'POST', {}, ristoranti, False),
+        ('ricette_per_ristorante[fields]', 'ricette_per_ristorante', 'GET',
+         {'ristorante_id': ristorante, 'fields': 'id'}, None, False),
+        ('ricette_per_ingrediente', 'ricette_per_ingrediente', 'GET', {'ingrediente_id': ingrediente}, None, False),
+        ('ingredienti_per_ricetta', 'ingredienti_per_ricetta', 'GET', {'ricetta_id': ricetta}, None, False),
+        ('ingredienti_per_ristorante', 'ingredienti_per_ristorante', 'GET', {'ristorante_id': ristorante}, None, False),
+        ('ingredienti_per_ristorante[recipe_count]', 'ingredienti_per_ristorante', 'GET',
+         {'ristorante_id': ristorante, 'recipe_count': '1'}, None, False),
+        ('ricerca', 'ricerca', 'GET', {'q': parola[:4]}, None, False),
+        ('dispensa', 'dispensa', 'GET', {'ingredienti': ','.join(map(str, dispensa)), 'max_mancanti': '2'}, None, False),
+        ('match_ricette', 'match_ricette', 'GET', {'ingredienti': ','.join(map(str, dispensa))}, None, False),
+        ('match_ricette[jaccard]', 'match_ricette', 'GET',
+         {'ingredienti': ','.join(map(str, dispensa)), 'punteggio': 'jaccard'}, None, False),
+        ('statistiche_ingredienti', 'statistiche_ingredienti', 'GET', {}, None, False),
+        ('statistiche_ricette', 'statistiche_ricette', 'GET', {'limit': '100'}, None, False),
+        ('statistiche_ristoranti', 'statistiche_ristoranti', 'GET', {'offset': '10'}, None, False),
+        ('modifiche_catalogo', 'modifiche_catalogo', 'GET', {}, None, False),
+        ('modifiche_catalogo[since]', 'modifiche_catalogo', 'GET', {'since': '0'}, None, False),
+        ('create_ristorante', 'create_ristorante', 'GET', {'ristorante_text': 'Benchmark'}, None, True),
+        ('update_ristorante', 'update_ristorante', 'GET', {'ristorante_id': ristorante, 'ristorante_text': 'Benchmark'}, None, True),
+        ('delete_ristorante', 'delete_ristorante', 'GET', {'ristorante_id': ristorante}, None, True),
+        ('create_ricetta', 'create_ricetta', 'GET', {'ricetta_text': 'Benchmark'}, None, True),
+        ('update_ricetta', 'update_ricetta', 'GET', {'ricetta_id': ricetta, 'ricetta_text': 'Benchmark'}, None, True),
+        ('delete_ricetta', 'delete_ricetta', 'GET', {'ricetta_id': ricetta}, None, True),
+        ('create_ingrediente', 'create_ingrediente', 'GET', {'ingrediente_text': 'Benchmark'}, None, True),
+        ('update_ingrediente', 'update_ingrediente', 'GET', {'ingrediente_id': ingrediente, 'ingrediente_text': 'Benchmark'}, None, True),
+        ('delete_ingrediente', 'delete_ingrediente', 'GET', {'ingrediente_id': ingrediente}, None, True),
+        ('delete_ingrediente[soft]', 'delete_ingrediente', 'GET', {'ingrediente_id': ingrediente, 'soft': '1'}, None, True),
+        ('bulk_ristoranti', 'bulk_ristoranti', 'POST', {},
+         [{'op': 'create', 'ristorante_text': f'Benchmark {i}', 'ricette': ricette[:5]} for i in range(25)]
+         + [{'op': 'update', 'id': i, 'ristorante_text': 'Benchmark'} for i in ristoranti[:25]], True),
+        ('bulk_ricette', 'bulk_ricette', 'POST', {},
+         [{'op': 'create', 'ricetta_text': f'Benchmark {i}', 'ingredienti': ingredienti[:8]} for i in range(25)]
+         + [{'op': 'update', 'id': i, 'ricetta_text': 'Benchmark'} for i in ricette[:25]], True),
+        ('bulk_ingredienti', 'bulk_ingredienti', 'POST', {},
+         [{'op': 'create', 'ingrediente_text': f'Benchmark {i}'} for i in range(25)]
+         + [{'op': 'update', 'id': i, 'ingrediente_text': 'Benchmark'} for i in ingredienti[:25]], True),
+        ('bulk_ristoranti_ricette', 'bulk_ristoranti_ricette', 'POST', {},
+         [{'op': 'create', 'ristorante_id': ristorante, 'ricetta_id': i} for i in ricette[:40]]
+         + [{'op': 'delete', 'ristorante_id': ristorante, 'ricetta_id': ricetta}], True),
+        ('bulk_ricette_ingredienti', 'bulk_ricette_ingredienti', 'POST', {},
+         [{'op': 'create', 'ricetta_id': ricetta, 'ingrediente_id': i} for i in ingredienti[:40]]
+         + [{'op': 'delete', 'ricetta_id': ricetta, 'ingrediente_id': dispensa[0]}], True),
+    ]
+
+
+def _richiesta(client, url, metodo, parametri, corpo):
+    if metodo == 'POST':
+        risposta = client.post(url, json.dumps(corpo), content_type='application/json')
+    else:
+        risposta = client.get(url, parametri)
+    if risposta.streaming:
+        return risposta, len(b''.join(risposta.streaming_content))
+    return risposta, len(risposta.content)
+
+
+def _centile(valori, centile):
+    if len(valori) == 1:
+        return valori[0]
+    return statistics.quantiles(valori, n=100, method='inclusive')[centile - 1]
+
+
+@contextmanager
+def _senza_limiti():
+    """Disattiva i limiti di richieste: tutte le richieste del benchmark vengono dallo stesso client."""
+    limiti = app_settings.RATE_LIMITS
+    app_settings.RATE_LIMITS = {}
+    try:
+        yield
+    finally:
+        app_settings.RATE_LIMITS = limiti
+
+
+def esegui(client, ripetizioni=50, con_cache=False):
+    """
+    Esegue tutti i casi e restituisce {nome: {'status', 'p50_ms', 'p95_ms',
+    'p99_ms', 'queries', 'bytes'}}. queries e bytes sono quelli dell'ultima
+    ripetizione.
+    """
+    with _senza_limiti():
+        return _esegui(client, ripetizioni, con_cache)
+
+
+def _esegui(client, ripetizioni, con_cache):
+    cache = caches[app_settings.CACHE_ALIAS]
+    risultati = {}
+    for nome, url_name, metodo, parametri, corpo, scrittura, *percorso in casi():
+        url = reverse(url_name, kwargs=percorso[0] if percorso else None)
+        latenze = []
+        # la prima esecuzione non è misurata: carica l'indice della dispensa e le cache di Django
+        for ripetizione in range(ripetizioni + 1):
+            if not con_cache:
+                cache.clear()
+            reset_queries()
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as contesto:
+                    inizio = time.perf_counter()
+                    risposta, dimensione = _richiesta(client, url, metodo, parametri, corpo)
+                    durata = (time.perf_counter() - inizio) * 1000
+                if ripetizione:
+                    latenze.append(durata)
+                if scrittura:
+                    transaction.set_rollback(True)
+        risultati[nome] = {
+            'status': risposta.status_code,
+            'p50_ms': round(_centile(latenze, 50), 3),
+            'p95_ms': round(_centile(latenze, 95), 3),
+            'p99_ms': round(_centile(latenze, 99), 3),
+            'queries': len(contesto.captured_queries),
+            'bytes': dimensione,
+        }
+    return risultati
+
+
+def carica_baseline(percorso=BASELINE):
+    with open(percorso, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def salva_baseline(risultati, percorso=BASELINE):
+    dati = {'catalogo': CATALOGO_BASELINE, 'risultati': risultati}
+    with open(percorso, 'w', encoding='utf-8') as file:
+        json.dump(dati, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def confronta(risultati, baseline, tolleranza=0.5, latenza=True, dimensioni=True):
+    """
+    Confronta i risultati con la baseline e restituisce la lista delle regressioni
+    (stringhe leggibili). Il numero di query e lo status devono coincidere o
+    migliorare; byte e latenza (p50 e p95) possono peggiorare al più della tolleranza.
+    """
+    regressioni = []
+    riferimento = baseline['risultati']
+    for nome, attuale in sorted(risultati.items()):
+        if nome not in riferimento:
+            continue
+        atteso = riferimento[nome]
+        if attuale['status'] != atteso['status']:
+            regressioni.append(f"{nome}: status {attuale['status']} invece di {atteso['status']}")
+        if attuale['queries'] > atteso['queries']:
+            regressioni.append(f"{nome}: {attuale['queries']} query invece di {atteso['queries']}")
+        if dimensioni and attuale['bytes'] > atteso['bytes'] * (1 + tolleranza):
+            regressioni.append(f"{nome}: risposta di {attuale['bytes']} byte invece di {atteso['bytes']}")
+        if latenza:
+            # p99 è registrato ma non confrontato: con poche ripetizioni è troppo rumoroso
+            for chiave in ('p50_ms', 'p95_ms'):
+                limite = max(atteso[chiave] * (1 + tolleranza), atteso[chiave] + SOGLIA_LATENZA_MS)
+                if attuale[chiave] > limite:
+                    regressioni.append(f"{nome}: {chiave} {attuale[chiave]:.2f} ms invece di {atteso[chiave]:.2f} ms")
+    mancanti = sorted(set(riferimento) - set(risultati))
+    regressioni += [f"{nome}: caso non più eseguito" for nome in mancanti]
+    return regressioni
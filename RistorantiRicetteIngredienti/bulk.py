@@ -0,0 +1,241 @@
+"""
+Operazioni in blocco (create/update/delete) su ristoranti, ricette, ingredienti
+e sulle tabelle di collegamento, applicate in un'unica transazione.
+
+Ogni operazione riceve una lista di elementi e restituisce una lista di esiti,
+uno per elemento e nello stesso ordine: {'index', 'op', 'status', ...}.
+Gli elementi non validi vengono segnalati con status 'error' e non impediscono
+l'applicazione degli altri.
+"""
+from django.db import transaction
+
+from . import eliminazione
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente
+from .signals import entita_create, entita_aggiornate, collegamenti_creati
+
+# per ogni modello: campo di testo e collegamenti che è possibile creare insieme
+# all'elemento, come chiave -> (tabella di collegamento, campo verso l'elemento,
+# campo verso l'altro modello, altro modello)
+ENTITA = {
+    Ristorante: ('ristorante_text', {
+        'ricette': (RistoranteToRicetta, 'ristorante_id', 'ricetta_id', Ricetta),
+    }),
+    Ricetta: ('ricetta_text', {
+        'ristoranti': (RistoranteToRicetta, 'ricetta_id', 'ristorante_id', Ristorante),
+        'ingredienti': (RicettaToIngrediente, 'ricetta_id', 'ingrediente_id', Ingrediente),
+    }),
+    Ingrediente: ('ingrediente_text', {
+        'ricette': (RicettaToIngrediente, 'ingrediente_id', 'ricetta_id', Ricetta),
+    }),
+}
+
+# per ogni tabella di collegamento: i due campi e i modelli a cui puntano
+COLLEGAMENTI = {
+    RistoranteToRicetta: (('ristorante_id', Ristorante), ('ricetta_id', Ricetta)),
+    RicettaToIngrediente: (('ricetta_id', Ricetta), ('ingrediente_id', Ingrediente)),
+}
+
+
+def _is_id(valore):
+    return isinstance(valore, int) and not isinstance(valore, bool)
+
+
+def _ids_esistenti(modello, ids):
+    """Restituisce il sottoinsieme degli ids che esistono nella tabella del modello."""
+    if not ids:
+        return set()
+    return set(modello.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
+def _coppie_esistenti(modello, campo_a, campo_b, coppie):
+    """
+    Restituisce {(a, b): [id dei collegamenti]} per le coppie già presenti
+    nella tabella di collegamento, con una sola query.
+    """
+    if not coppie:
+        return {}
+    righe = modello.objects.filter(**{
+        f'{campo_a}__in': {a for a, _ in coppie},
+        f'{campo_b}__in': {b for _, b in coppie},
+    }).values_list('id', campo_a, campo_b)
+    esistenti = {}
+    for id_collegamento, a, b in righe:
+        if (a, b) in coppie:
+            esistenti.setdefault((a, b), []).append(id_collegamento)
+    return esistenti
+
+
+def _crea_collegamenti(modello, campo_a, campo_b, coppie):
+    """Crea con bulk_create i collegamenti non ancora presenti; restituisce quanti ne ha creati."""
+    coppie = set(coppie)
+    nuove = coppie - set(_coppie_esistenti(modello, campo_a, campo_b, coppie))
+    # ignore_conflicts copre i collegamenti creati nel frattempo da un'altra richiesta
+    modello.objects.bulk_create([modello(**{campo_a: a, campo_b: b}) for a, b in nuove], ignore_conflicts=True)
+    # bulk_create non invia i segnali dei modelli
+    (campo_primo, _), _ = COLLEGAMENTI[modello]
+    collegamenti_creati.send(modello, coppie=nuove if campo_a == campo_primo else {(b, a) for a, b in nuove})
+    return len(nuove)
+
+
+def _errore(indice, op, messaggio):
+    return {'index': indice, 'op': op, 'status': 'error', 'error': messaggio}
+
+
+def _valida_elemento(item, campo, collegamenti):
+    """Controlla la forma di un elemento; restituisce il messaggio di errore oppure None."""
+    if not isinstance(item, dict):
+        return "Item must be an object"
+    op = item.get('op')
+    if op not in ('create', 'update', 'delete'):
+        return "Invalid 'op' (expected create, update or delete)"
+    if op in ('update', 'delete') and not _is_id(item.get('id')):
+        return "Missing or invalid 'id'"
+    if op in ('create', 'update'):
+        testo = item.get(campo)
+        if not isinstance(testo, str) or not testo:
+            return f"Missing '{campo}'"
+        for chiave in collegamenti:
+            ids = item.get(chiave, [])
+            if not isinstance(ids, list) or not all(_is_id(v) for v in ids):
+                return f"Invalid '{chiave}' (expected a list of ids)"
+    return None
+
+
+def applica_entita(modello, elementi):
+    """
+    Applica in blocco una lista di operazioni su Ristorante, Ricetta o Ingrediente.
+
+    Ogni elemento è un oggetto con:
+        - op: 'create', 'update' o 'delete'
+        - id: obbligatorio per update e delete
+        - <campo di testo> (es. ristorante_text): obbligatorio per create e update
+        - liste di id da collegare all'elemento (es. 'ricette' per un ristorante),
+          facoltative per create e update; i collegamenti già presenti sono ignorati
+    Le operazioni sono applicate per fasi (creazioni, aggiornamenti, collegamenti,
+    eliminazioni), non nell'ordine della lista: per questo un id può comparire
+    in un solo update o delete, e gli elementi successivi con lo stesso id
+    ricevono un errore.
+    """
+    campo, collegamenti = ENTITA[modello]
+    risultati = [None] * len(elementi)
+    validi = []
+    # id già indicati da un update o delete precedente della stessa richiesta
+    indicati = set()
+    for indice, item in enumerate(elementi):
+        errore = _valida_elemento(item, campo, collegamenti)
+        if not errore and item['op'] != 'create':
+            if item['id'] in indicati:
+                errore = f"{modello.__name__} {item['id']} already used by another item"
+            indicati.add(item['id'])
+        if errore:
+            risultati[indice] = _errore(indice, item.get('op') if isinstance(item, dict) else None, errore)
+        else:
+            validi.append((indice, item))
+
+    # verifica con una query per tabella che gli id richiesti esistano
+    esistenti = _ids_esistenti(modello, {item['id'] for _, item in validi if item['op'] != 'create'})
+    collegati_esistenti = {
+        chiave: _ids_esistenti(altro, {v for _, item in validi for v in item.get(chiave, [])})
+        for chiave, (_, _, _, altro) in collegamenti.items()
+    }
+    da_applicare = []
+    for indice, item in validi:
+        op = item['op']
+        if op != 'create' and item['id'] not in esistenti:
+            risultati[indice] = _errore(indice, op, f"{modello.__name__} {item['id']} not found")
+            continue
+        mancanti = [
+            f"{chiave} {v}"
+            for chiave in collegamenti
+            for v in item.get(chiave, [])
+            if v not in collegati_esistenti[chiave]
+        ]
+        if op != 'delete' and mancanti:
+            risultati[indice] = _errore(indice, op, f"Not found: {', '.join(mancanti)}")
+            continue
+        da_applicare.append((indice, item))
+
+    with transaction.atomic():
+        creazioni = [(indice, item) for indice, item in da_applicare if item['op'] == 'create']
+        nuovi = modello.objects.bulk_create([modello(**{campo: item[campo]}) for _, item in creazioni])
+        for (indice, item), oggetto in zip(creazioni, nuovi):
+            item['id'] = oggetto.id
+            risultati[indice] = {'index': indice, 'op': 'create', 'status': 'ok', 'id': oggetto.id, campo: item[campo]}
+        entita_create.send(modello, ids=[oggetto.id for oggetto in nuovi])
+
+        aggiornamenti = [(indice, item) for indice, item in da_applicare if item['op'] == 'update']
+        modello.objects.bulk_update([modello(id=item['id'], **{campo: item[campo]}) for _, item in aggiornamenti], [campo])
+        entita_aggiornate.send(modello, ids=[item['id'] for _, item in aggiornamenti])
+        for indice, item in aggiornamenti:
+            risultati[indice] = {'index': indice, 'op': 'update', 'status': 'ok', 'id': item['id'], campo: item[campo]}
+
+        for chiave, (tabella, campo_elemento, campo_altro, _) in collegamenti.items():
+            coppie = [
+                (item['id'], v)
+                for _, item in da_applicare if item['op'] != 'delete'
+                for v in item.get(chiave, [])
+            ]
+            _crea_collegamenti(tabella, campo_elemento, campo_altro, coppie)
+
+        eliminazioni = [(indice, item) for indice, item in da_applicare if item['op'] == 'delete']
+        eliminazione.elimina(modello, [item['id'] for _, item in eliminazioni])
+        for indice, item in eliminazioni:
+            risultati[indice] = {'index': indice, 'op': 'delete', 'status': 'ok', 'id': item['id']}
+
+    return risultati
+
+
+def applica_collegamenti(modello, elementi):
+    """
+    Applica in blocco una lista di operazioni su una tabella di collegamento
+    (RistoranteToRicetta o RicettaToIngrediente).
+
+    Ogni elemento è un oggetto con:
+        - op: 'create' o 'delete'
+        - i due id del collegamento (es. ristorante_id e ricetta_id)
+    La creazione di un collegamento già esistente non ne crea un duplicato.
+    Le operazioni sono considerate nell'ordine della lista: una creazione
+    seguita dall'eliminazione della stessa coppia non lascia il collegamento,
+    un'eliminazione seguita da una creazione lo lascia; l'esito di ciascuna
+    ('ok', 'exists', 'not_found') tiene conto delle precedenti.
+    """
+    (campo_a, modello_a), (campo_b, modello_b) = COLLEGAMENTI[modello]
+    risultati = [None] * len(elementi)
+    validi = []
+    for indice, item in enumerate(elementi):
+        op = item.get('op') if isinstance(item, dict) else None
+        if op not in ('create', 'delete'):
+            risultati[indice] = _errore(indice, op, "Invalid 'op' (expected create or delete)")
+        elif not _is_id(item.get(campo_a)) or not _is_id(item.get(campo_b)):
+            risultati[indice] = _errore(indice, op, f"Missing or invalid '{campo_a}' or '{campo_b}'")
+        else:
+            validi.append((indice, op, (item[campo_a], item[campo_b])))
+
+    esistenti_a = _ids_esistenti(modello_a, {a for _, op, (a, _) in validi if op == 'create'})
+    esistenti_b = _ids_esistenti(modello_b, {b for _, op, (_, b) in validi if op == 'create'})
+    coppie = _coppie_esistenti(modello, campo_a, campo_b, {coppia for _, _, coppia in validi})
+
+    with transaction.atomic():
+        # coppie presenti dopo ciascuna operazione, nell'ordine della lista
+        presenti = set(coppie)
+        for indice, op, (a, b) in validi:
+            esito = {'index': indice, 'op': op, campo_a: a, campo_b: b}
+            if op == 'create':
+                if a not in esistenti_a or b not in esistenti_b:
+                    risultati[indice] = _errore(indice, op, f"{modello_a.__name__} {a} or {modello_b.__name__} {b} not found")
+                    continue
+                esito['status'] = 'exists' if (a, b) in presenti else 'ok'
+                presenti.add((a, b))
+            else:
+                esito['status'] = 'ok' if (a, b) in presenti else 'not_found'
+                presenti.discard((a, b))
+            risultati[indice] = esito
+
+        # si applica solo la differenza tra lo stato iniziale e quello finale
+        nuove = presenti - set(coppie)
+        da_eliminare = [id_collegamento for coppia, ids in coppie.items() if coppia not in presenti for id_collegamento in ids]
+        modello.objects.bulk_create([modello(**{campo_a: a, campo_b: b}) for a, b in nuove], ignore_conflicts=True)
+        collegamenti_creati.send(modello, coppie=nuove)
+        eliminazione.elimina_collegamenti(modello.objects.filter(id__in=da_eliminare))
+
+    return risultati
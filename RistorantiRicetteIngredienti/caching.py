@@ -0,0 +1,233 @@
+"""
+Cache delle risposte delle viste *_per_*, basata sul framework di cache di Django.
+
+Ogni coppia (vista, id) ha una versione salvata in cache: le risposte sono
+memorizzate sotto una chiave che include la versione, quindi per invalidare
+tutte le varianti di una risposta (paginazione, recipe_count, ...) basta
+eliminare la versione. L'invalidazione avviene dai segnali dei modelli
+(vedi signals.py) e dalle operazioni bulk, solo per le coppie interessate.
+
+Le versioni stanno nella cache CACHE_VERSION_ALIAS, che deve essere condivisa
+da tutti i processi: le scritture dei lavori eseguiti da run_workers le
+invalidano nello stesso modo delle richieste. Le risposte (CACHE_ALIAS)
+possono invece stare in una cache locale al processo, perché la loro chiave
+contiene la versione. run_workers non parte se la cache delle versioni è
+locale al processo.
+
+Le risposte in cache hanno un ETag forte calcolato sul contenuto: se il client
+invia If-None-Match con lo stesso valore riceve 304 senza accessi al database.
+"""
+import hashlib
+import inspect
+import logging
+import uuid
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from . import replica
+from . import settings as app_settings
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente
+
+logger = logging.getLogger(__name__)
+
+PREFISSO = 'rri'
+
+
+def _cache():
+    return caches[app_settings.CACHE_ALIAS]
+
+
+def _cache_versioni():
+    return caches[app_settings.CACHE_VERSION_ALIAS]
+
+
+def versioni_condivise():
+    """Indica se le versioni sono visibili a tutti i processi, cioè se la loro cache non è locale."""
+    return not isinstance(_cache_versioni(), LocMemCache)
+
+
+def _chiave_versione(vista, id_oggetto):
+    return f'{PREFISSO}:v:{vista}:{id_oggetto}'
+
+
+def _versione(vista, id_oggetto):
+    """Restituisce la versione corrente della coppia (vista, id), creandola se manca."""
+    cache = _cache_versioni()
+    chiave = _chiave_versione(vista, id_oggetto)
+    versione = cache.get(chiave)
+    if versione is None:
+        cache.add(chiave, uuid.uuid4().hex, app_settings.CACHE_TIMEOUT)
+        versione = cache.get(chiave)
+    return versione
+
+
+async def _versione_async(vista, id_oggetto):
+    cache = _cache_versioni()
+    chiave = _chiave_versione(vista, id_oggetto)
+    versione = await cache.aget(chiave)
+    if versione is None:
+        await cache.aadd(chiave, uuid.uuid4().hex, app_settings.CACHE_TIMEOUT)
+        versione = await cache.aget(chiave)
+    return versione
+
+
+def _durata():
+    # una risposta letta da una replica può essere indietro rispetto alle
+    # invalidazioni già avvenute: resta in cache al massimo quanto il ritardo della replica
+    if replica.replica_corrente() is not None:
+        return app_settings.REPLICA_MAX_STALENESS
+    return app_settings.CACHE_TIMEOUT
+
+
+def _chiave_risposta(vista, id_oggetto, versione, parametri):
+    firma = hashlib.sha256(parametri.urlencode().encode()).hexdigest()[:16]
+    return f'{PREFISSO}:r:{vista}:{id_oggetto}:{versione}:{firma}'
+
+
+def _risposta_da_voce(request, voce, esito):
+    etag, contenuto, content_type = voce
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        risposta = HttpResponseNotModified()
+    else:
+        risposta = HttpResponse(contenuto, content_type=content_type)
+    risposta['ETag'] = etag
+    risposta['X-Cache'] = esito
+    return risposta
+
+
+def _id_in_cache(request, nome_parametro):
+    """Id della richiesta se la risposta può stare in cache, altrimenti None."""
+    id_oggetto = request.GET.get(nome_parametro, '')
+    if request.method != 'GET' or not id_oggetto.isdigit() or request.GET.get('stream') == '1':
+        return None
+    return int(id_oggetto)
+
+
+def _voce(risposta):
+    """Voce di cache (etag, contenuto, content type) per una risposta, o None se non memorizzabile."""
+    if risposta.status_code != 200 or risposta.streaming:
+        return None
+    etag = '"%s"' % hashlib.sha256(risposta.content).hexdigest()[:32]
+    return (etag, risposta.content, risposta['Content-Type'])
+
+
+def risposta_in_cache(nome_parametro):
+    """
+    Decoratore per le viste *_per_*: memorizza in cache le risposte 200 alle
+    richieste GET con un solo id (nome_parametro). Le richieste batch e in
+    streaming passano direttamente alla vista.
+    Funziona anche con le viste async, usando l'API asincrona della cache.
+    """
+    def decoratore(vista):
+        nome = vista.__name__
+
+        if inspect.iscoroutinefunction(vista):
+            @wraps(vista)
+            async def wrapper_async(request, *args, **kwargs):
+                id_oggetto = _id_in_cache(request, nome_parametro)
+                if id_oggetto is None:
+                    return await vista(request, *args, **kwargs)
+                versione = await _versione_async(nome, id_oggetto)
+                chiave = _chiave_risposta(nome, id_oggetto, versione, request.GET)
+                voce = await _cache().aget(chiave)
+                if voce is not None:
+                    logger.debug("Risposta di %s per l'id %s servita dalla cache", nome, id_oggetto)
+                    return _risposta_da_voce(request, voce, 'HIT')
+
+                risposta = await vista(request, *args, **kwargs)
+                voce = _voce(risposta)
+                if voce is None:
+                    return risposta
+                await _cache().aset(chiave, voce, _durata())
+                return _risposta_da_voce(request, voce, 'MISS')
+            return wrapper_async
+
+        @wraps(vista)
+        def wrapper(request, *args, **kwargs):
+            id_oggetto = _id_in_cache(request, nome_parametro)
+            if id_oggetto is None:
+                return vista(request, *args, **kwargs)
+            versione = _versione(nome, id_oggetto)
+            chiave = _chiave_risposta(nome, id_oggetto, versione, request.GET)
+            voce = _cache().get(chiave)
+            if voce is not None:
+                logger.debug("Risposta di %s per l'id %s servita dalla cache", nome, id_oggetto)
+                return _risposta_da_voce(request, voce, 'HIT')
+
+            risposta = vista(request, *args, **kwargs)
+            voce = _voce(risposta)
+            if voce is None:
+                return risposta
+            _cache().set(chiave, voce, _durata())
+            return _risposta_da_voce(request, voce, 'MISS')
+        return wrapper
+    return decoratore
+
+
+def invalida(coppie):
+    """
+    Invalida le risposte in cache per le coppie (vista, id) indicate.
+    Dentro una transazione l'invalidazione avviene al commit, così nessuna
+    richiesta concorrente può rimettere in cache i dati precedenti.
+    """
+    chiavi = [_chiave_versione(vista, id_oggetto) for vista, id_oggetto in set(coppie)]
+    if chiavi:
+        transaction.on_commit(lambda: _cache_versioni().delete_many(chiavi))
+
+
+def _ristoranti_delle_ricette(ricette):
+    return RistoranteToRicetta.objects.filter(ricetta_id__in=ricette).values_list('ristorante_id', flat=True)
+
+
+def invalida_entita(modello, ids, eliminati=False):
+    """
+    Invalida le risposte che contengono i ristoranti, le ricette o gli ingredienti
+    indicati (creati, modificati o eliminati).
+    """
+    ids = set(ids)
+    coppie = []
+    if modello is Ristorante:
+        ricette = RistoranteToRicetta.objects.filter(ristorante_id__in=ids).values_list('ricetta_id', flat=True)
+        coppie += [('ristoranti_per_ricetta', r) for r in ricette]
+        if eliminati:
+            coppie += [(vista, i) for i in ids for vista in ('ricette_per_ristorante', 'ingredienti_per_ristorante')]
+    elif modello is Ricetta:
+        coppie += [('ricette_per_ristorante', r) for r in _ristoranti_delle_ricette(ids)]
+        ingredienti = RicettaToIngrediente.objects.filter(ricetta_id__in=ids).values_list('ingrediente_id', flat=True)
+        coppie += [('ricette_per_ingrediente', i) for i in ingredienti]
+        if eliminati:
+            coppie += [(vista, i) for i in ids for vista in ('ristoranti_per_ricetta', 'ingredienti_per_ricetta')]
+    elif modello is Ingrediente:
+        ricette = set(RicettaToIngrediente.objects.filter(ingrediente_id__in=ids).values_list('ricetta_id', flat=True))
+        coppie += [('ingredienti_per_ricetta', r) for r in ricette]
+        coppie += [('ingredienti_per_ristorante', r) for r in _ristoranti_delle_ricette(ricette)]
+        if eliminati:
+            coppie += [('ricette_per_ingrediente', i) for i in ids]
+    invalida(coppie)
+
+
+def invalida_collegamenti(modello, coppie_collegate):
+    """
+    Invalida le risposte interessate dalla creazione o dall'eliminazione di
+    collegamenti, indicati come coppie di id nell'ordine dei campi del modello.
+    """
+    coppie_collegate = set(coppie_collegate)
+    coppie = []
+    if modello is RistoranteToRicetta:
+        for ristorante, ricetta in coppie_collegate:
+            coppie += [
+                ('ristoranti_per_ricetta', ricetta),
+                ('ricette_per_ristorante', ristorante),
+                ('ingredienti_per_ristorante', ristorante),
+            ]
+    elif modello is RicettaToIngrediente:
+        ricette = {ricetta for ricetta, _ in coppie_collegate}
+        for ricetta, ingrediente in coppie_collegate:
+            coppie += [('ingredienti_per_ricetta', ricetta), ('ricette_per_ingrediente', ingrediente)]
+        coppie += [('ingredienti_per_ristorante', r) for r in _ristoranti_delle_ricette(ricette)]
+    invalida(coppie)
@@ -0,0 +1,81 @@
+"""
+Formato di import/export del catalogo (comandi catalog_import e catalog_export).
+
+Il catalogo è una directory con un file per tabella, in JSONL (un oggetto per
+riga) oppure CSV (con intestazione). Le righe si riferiscono agli oggetti per
+nome, non per id, così un catalogo può essere importato in un altro database:
+
+    ristoranti.jsonl            {"ristorante_text": "Da Mario"}
+    ricette.jsonl               {"ricetta_text": "Carbonara"}
+    ingredienti.jsonl           {"ingrediente_text": "Guanciale"}
+    ristoranti_ricette.jsonl    {"ristorante": "Da Mario", "ricetta": "Carbonara"}
+    ricette_ingredienti.jsonl   {"ricetta": "Carbonara", "ingrediente": "Guanciale"}
+
+Se più oggetti hanno lo stesso nome, i collegamenti si riferiscono a quello con
+l'id più basso. Lettura e scrittura procedono una riga alla volta.
+"""
+import csv
+import json
+
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente
+
+FORMATI = ('jsonl', 'csv')
+
+# file delle entità, nell'ordine di import: nome del file, modello, campo del nome
+ENTITA = (
+    ('ristoranti', Ristorante, 'ristorante_text'),
+    ('ricette', Ricetta, 'ricetta_text'),
+    ('ingredienti', Ingrediente, 'ingrediente_text'),
+)
+
+# file dei collegamenti: nome del file, modello, (colonna, campo id, modello collegato) x 2
+COLLEGAMENTI = (
+    ('ristoranti_ricette', RistoranteToRicetta,
+     (('ristorante', 'ristorante_id', Ristorante), ('ricetta', 'ricetta_id', Ricetta))),
+    ('ricette_ingredienti', RicettaToIngrediente,
+     (('ricetta', 'ricetta_id', Ricetta), ('ingrediente', 'ingrediente_id', Ingrediente))),
+)
+
+# campo del nome per ogni modello
+CAMPO_NOME = {modello: campo for _, modello, campo in ENTITA}
+
+
+def colonne(nome_file):
+    """Colonne del file indicato."""
+    for nome, _, campo in ENTITA:
+        if nome == nome_file:
+            return [campo]
+    for nome, _, campi in COLLEGAMENTI:
+        if nome == nome_file:
+            return [colonna for colonna, _, _ in campi]
+    raise KeyError(nome_file)
+
+
+def leggi(file, formato):
+    """Generatore delle righe di un file aperto in lettura, come dizionari."""
+    if formato == 'csv':
+        yield from csv.DictReader(file)
+    else:
+        for riga in file:
+            if riga.strip():
+                yield json.loads(riga)
+
+
+class Scrittore:
+    """Scrive righe (tuple nell'ordine delle colonne) in un file aperto in scrittura."""
+
+    def __init__(self, file, formato, colonne):
+        self.file = file
+        self.formato = formato
+        self.colonne = colonne
+        if formato == 'csv':
+            self.csv = csv.writer(file)
+            self.csv.writerow(colonne)
+
+    def scrivi(self, righe):
+        if self.formato == 'csv':
+            self.csv.writerows(righe)
+        else:
+            self.file.writelines(
+                json.dumps(dict(zip(self.colonne, riga)), ensure_ascii=False) + '\n' for riga in righe
+            )
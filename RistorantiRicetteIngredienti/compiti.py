@@ -0,0 +1,57 @@
+"""
+Compiti eseguiti dai worker della coda (lavori.py, comando run_workers):
+le operazioni sul catalogo troppo lunghe per il ciclo di una richiesta.
+"""
+import io
+import logging
+
+from django.core.management import call_command
+
+from . import aggregati, eliminazione, modifiche, ricerca
+from .lavori import compito
+from .models import Ristorante, Ricetta, Ingrediente
+
+logger = logging.getLogger(__name__)
+
+# nome del modello (come in Lavoro.args) -> modello
+MODELLI = {modello._meta.model_name: modello for modello in (Ristorante, Ricetta, Ingrediente)}
+
+
+@compito('elimina')
+def elimina(modello, ids):
+    """Eliminazione definitiva, con i collegamenti, di righe di `modello` ('ristorante', 'ricetta' o 'ingrediente')."""
+    eliminazione.elimina(MODELLI[modello], ids)
+
+
+@compito('purge_deleted')
+def purge_deleted():
+    """Elimina tutte le righe marcate con soft=1, a blocchi di PURGE_BATCH_SIZE collegamenti."""
+    while any(eliminazione.purge()):
+        pass
+
+
+@compito('rebuild_ingredient_rollup')
+def rebuild_ingredient_rollup():
+    aggregati.ricostruisci()
+
+
+@compito('rebuild_search_index')
+def rebuild_search_index():
+    ricerca.ricostruisci_indice()
+
+
+@compito('compact_changes')
+def compact_changes(conservazione):
+    superate, scadute = modifiche.compatta(conservazione)
+    logger.info("Registro delle modifiche compattato: %d voci superate, %d eliminazioni scadute", superate, scadute)
+
+
+@compito('catalog_import')
+def catalog_import(directory, **opzioni):
+    """
+    Import di un catalogo esportato; riparte sempre dal checkpoint, così un
+    nuovo tentativo dopo un errore non reinserisce i blocchi già importati.
+    """
+    uscita = io.StringIO()
+    call_command('catalog_import', directory, resume=True, stdout=uscita, **opzioni)
+    logger.info("Import di %s:\n%s", directory, uscita.getvalue().rstrip())
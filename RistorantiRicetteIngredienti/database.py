@@ -0,0 +1,43 @@
+"""
+Inizializzazione delle connessioni SQLite.
+
+A ogni nuova connessione vengono applicati i PRAGMA di SQLITE_PRAGMAS (WAL,
+synchronous, mmap, cache, busy_timeout, temp_store). Con CONN_MAX_AGE le
+connessioni sono persistenti, quindi il costo di apertura e configurazione si
+paga una volta per thread e non a ogni richiesta.
+
+Il comando benchmark_sqlite confronta questo profilo con la configurazione
+predefinita di SQLite sotto letture e scritture concorrenti.
+"""
+import logging
+import re
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+_VALORE = re.compile(r'^-?\w+$')
+
+
+def istruzioni_pragma(pragmi=None):
+    """Restituisce le istruzioni PRAGMA per i valori indicati (default SQLITE_PRAGMAS)."""
+    pragmi = app_settings.SQLITE_PRAGMAS if pragmi is None else pragmi
+    istruzioni = []
+    for nome, valore in pragmi.items():
+        if not _VALORE.match(nome) or not _VALORE.match(str(valore)):
+            raise ValueError(f"PRAGMA non valido: {nome} = {valore}")
+        istruzioni.append(f'PRAGMA {nome} = {valore}')
+    return istruzioni
+
+
+@receiver(connection_created)
+def configura_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for istruzione in istruzioni_pragma():
+            cursor.execute(istruzione)
+    logger.debug("Connessione SQLite configurata: %s", app_settings.SQLITE_PRAGMAS)
@@ -0,0 +1,147 @@
+"""
+Eliminazione di ristoranti, ricette e ingredienti senza il collector dell'ORM.
+
+Model.delete() carica in Python ogni collegamento da eliminare in cascata e ne
+invia i segnali uno per uno: per un ingrediente usato da migliaia di ricette la
+transazione, e con essa il lock di scrittura di SQLite, dura secondi. elimina()
+esegue la stessa cascata con istruzioni DELETE sugli insiemi di id, in un'unica
+transazione; cache, tabella RistoranteIngrediente e indice della dispensa sono
+aggiornati dai segnali entita_eliminate e collegamenti_eliminati (signals.py).
+
+elimina_logicamente() marca invece le righe con deleted_at: spariscono subito
+dalle letture, che passano dal manager predefinito (CatalogoManager) e
+dall'indice full-text, mentre collegamenti e righe vengono eliminati in seguito
+da purge(), a blocchi di PURGE_BATCH_SIZE collegamenti, ciascuno in una
+transazione breve: dal lavoro purge_deleted che elimina_logicamente() accoda
+per i worker (lavori.py) o dal comando purge_deleted. I collegamenti di una
+riga marcata smettono subito di contare nella tabella RistoranteIngrediente e
+nell'indice della dispensa, come se fossero già eliminati.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import ricerca
+from . import settings as app_settings
+from .lavori import accoda
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, RistoranteIngrediente
+from .signals import entita_eliminate, collegamenti_eliminati, _collegamenti_modificati
+
+# numero massimo di id per clausola IN
+BLOCCO = 500
+
+# per ogni entità: le tabelle di collegamento che la riferiscono, con il campo verso di essa
+RIFERIMENTI = {
+    Ristorante: ((RistoranteToRicetta, 'ristorante_id'),),
+    Ricetta: ((RistoranteToRicetta, 'ricetta_id'), (RicettaToIngrediente, 'ricetta_id')),
+    Ingrediente: ((RicettaToIngrediente, 'ingrediente_id'),),
+}
+
+# campo di RistoranteIngrediente verso l'entità
+_CAMPO_AGGREGATO = {
+    Ristorante: 'ristorante_id',
+    Ingrediente: 'ingrediente_id',
+}
+
+
+def _elimina_righe(modello, ids):
+    """DELETE diretta in SQL delle righe indicate, senza raccogliere gli oggetti né inviare segnali."""
+    manager = modello._base_manager
+    for inizio in range(0, len(ids), BLOCCO):
+        manager.filter(id__in=ids[inizio:inizio + BLOCCO])._raw_delete(manager.db)
+
+
+def elimina_collegamenti(queryset, limite=None, ricalcola=True):
+    """
+    Elimina i collegamenti (RistoranteToRicetta o RicettaToIngrediente) del
+    queryset, al più `limite`, e invia collegamenti_eliminati; con ricalcola
+    falso le righe di RistoranteIngrediente non vengono ricalcolate.
+    Restituisce il numero di collegamenti eliminati.
+    """
+    modello = queryset.model
+    campi = [campo.attname for campo in modello._meta.concrete_fields[1:]]
+    righe = queryset.order_by().values_list('id', *campi)
+    if limite is not None:
+        righe = righe[:limite]
+    righe = list(righe)
+    if righe:
+        _elimina_righe(modello, [riga[0] for riga in righe])
+        collegamenti_eliminati.send(modello, coppie=[riga[1:] for riga in righe], ricalcola=ricalcola)
+    return len(righe)
+
+
+def elimina(modello, ids):
+    """
+    Elimina ristoranti, ricette o ingredienti (anche se già marcati come
+    eliminati) con i loro collegamenti, in un'unica transazione.
+    Restituisce il numero di collegamenti eliminati.
+    """
+    ids = sorted(set(ids))
+    if not ids:
+        return 0
+    # come Collector.delete(): nessun savepoint se la transazione è già aperta
+    with transaction.atomic(savepoint=False):
+        # le risposte da invalidare si trovano dai collegamenti, che esistono ancora
+        entita_eliminate.send(modello, ids=ids)
+        # le righe di RistoranteIngrediente di un ristorante o di un ingrediente si
+        # eliminano sotto con una sola DELETE; per una ricetta vanno ricalcolate
+        ricalcola = modello not in _CAMPO_AGGREGATO
+        eliminati = sum(
+            elimina_collegamenti(collegamento.objects.filter(**{f'{campo}__in': ids}), ricalcola=ricalcola)
+            for collegamento, campo in RIFERIMENTI[modello]
+        )
+        if not ricalcola:
+            aggregate = RistoranteIngrediente.objects.filter(**{f'{_CAMPO_AGGREGATO[modello]}__in': ids})
+            aggregate._raw_delete(aggregate.db)
+        _elimina_righe(modello, ids)
+    return eliminati
+
+
+def elimina_logicamente(modello, ids):
+    """
+    Marca come eliminati ristoranti, ricette o ingredienti: da questo momento
+    non compaiono più nelle letture; collegamenti e righe sono eliminati da purge()
+    nel lavoro purge_deleted, accodato se non ce n'è già uno in attesa.
+    Restituisce il numero di righe marcate.
+    """
+    ids = sorted(set(ids))
+    with transaction.atomic(savepoint=False):
+        marcate = modello.objects.filter(id__in=ids).update(deleted_at=timezone.now())
+        entita_eliminate.send(modello, ids=ids)
+        # i collegamenti restano fino a purge(), ma non contano più nelle strutture derivate
+        for collegamento, campo in RIFERIMENTI[modello]:
+            campi = [c.attname for c in collegamento._meta.concrete_fields[1:]]
+            _collegamenti_modificati(collegamento, collegamento.objects.filter(**{f'{campo}__in': ids}).values_list(*campi))
+        ricerca.rimuovi(modello._meta.model_name, ids)
+        accoda('purge_deleted', unico=True)
+    return marcate
+
+
+def purge(limite=None):
+    """
+    Un passo dell'eliminazione differita, in una transazione: per ogni modello
+    prende al più `limite` (default PURGE_BATCH_SIZE) righe marcate, le più
+    vecchie, ne elimina al più `limite` collegamenti in tutto, poi elimina
+    quelle rimaste senza collegamenti. Per queste righe non viene
+    inviato entita_eliminate, già inviato da elimina_logicamente().
+    Restituisce il numero di collegamenti e di righe eliminati.
+    """
+    limite = limite or app_settings.PURGE_BATCH_SIZE
+    collegamenti = righe = 0
+    with transaction.atomic():
+        for modello, riferimenti in RIFERIMENTI.items():
+            # l'ordinamento segue l'indice parziale su deleted_at: la LIMIT non legge le altre righe marcate
+            marcate = modello.tutti.filter(deleted_at__isnull=False).order_by('deleted_at', 'id')
+            marcate = list(marcate.values_list('id', flat=True)[:limite])
+            if not marcate:
+                continue
+            collegate = set()
+            for collegamento, campo in riferimenti:
+                queryset = collegamento.objects.filter(**{f'{campo}__in': marcate})
+                if collegamenti < limite:
+                    collegamenti += elimina_collegamenti(queryset, limite - collegamenti)
+                collegate.update(queryset.values_list(campo, flat=True).distinct())
+            pronte = [id_riga for id_riga in marcate if id_riga not in collegate]
+            # senza collegamenti non restano righe di RistoranteIngrediente da eliminare
+            _elimina_righe(modello, pronte)
+            righe += len(pronte)
+    return collegamenti, righe
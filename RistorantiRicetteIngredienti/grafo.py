@@ -0,0 +1,325 @@
+"""
+Indice in memoria del grafo ristorante -> ricetta -> ingrediente per le
+interrogazioni "cosa posso cucinare con questa dispensa".
+
+Le due tabelle di collegamento sono caricate come adiacenze compresse (CSR):
+id delle righe ordinati, offsets e array int32 dei vicini. Le verifiche di
+contenimento ("tutti gli ingredienti della ricetta sono nella dispensa")
+sono calcolate in modo vettoriale con NumPy su tutti gli archi insieme.
+
+Per l'abbinamento delle ricette (api/ricette/match/) l'adiacenza ricetta ->
+ingredienti viene trasposta in un indice invertito ingrediente -> ricette:
+una richiesta legge solo le liste degli ingredienti indicati e conta le
+ricette in comune con np.bincount.
+
+L'indice viene costruito alla prima richiesta e aggiornato in modo
+incrementale: i segnali dei collegamenti, ed elimina_logicamente() per i
+collegamenti delle righe marcate, segnano le righe modificate, che
+vengono rilette dal database alla richiesta successiva e inserite negli array
+esistenti senza riordinarli. L'indice invertito, se già costruito, viene
+aggiornato allo stesso modo solo nelle liste degli ingredienti interessati.
+Le righe eliminate in modo logico non compaiono nell'indice. Ogni processo ha
+il proprio indice, ricaricato per intero dopo GRAFO_MAX_AGE secondi per
+recepire le modifiche fatte da altri processi.
+"""
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+
+from . import settings as app_settings
+from .models import RistoranteToRicetta, RicettaToIngrediente
+
+
+# punteggi con cui IndiceDispensa.abbina può ordinare le ricette
+PUNTEGGI = ('comuni', 'jaccard', 'copertura')
+
+
+class AdiacenzaCSR:
+    """
+    Adiacenza compressa: per la riga i (id righe[i]) i vicini sono
+    vicini[offsets[i]:offsets[i + 1]], ordinati. Contiene solo righe con almeno un arco.
+    """
+
+    def __init__(self, righe, offsets, vicini):
+        self.righe = righe
+        self.offsets = offsets
+        self.vicini = vicini
+        # indice di riga di ogni arco, per le riduzioni con np.bincount
+        self.riga_arco = np.repeat(np.arange(len(righe), dtype=np.int32), np.diff(offsets))
+
+    @classmethod
+    def da_archi(cls, sorgenti, destinazioni):
+        ordine = np.lexsort((destinazioni, sorgenti))
+        sorgenti, destinazioni = sorgenti[ordine], destinazioni[ordine]
+        righe, conteggi = np.unique(sorgenti, return_counts=True)
+        offsets = np.zeros(len(righe) + 1, dtype=np.int64)
+        np.cumsum(conteggi, out=offsets[1:])
+        return cls(righe.astype(np.int32), offsets, destinazioni.astype(np.int32))
+
+    @classmethod
+    def da_archi_ordinati(cls, sorgenti, destinazioni):
+        """Come da_archi, per archi già ordinati per sorgente e destinazione, senza riordinarli."""
+        inizi = np.flatnonzero(np.diff(sorgenti, prepend=-1)) if len(sorgenti) else np.zeros(0, dtype=np.int64)
+        offsets = np.append(inizi, len(sorgenti)).astype(np.int64)
+        return cls(sorgenti[inizi].astype(np.int32), offsets, destinazioni.astype(np.int32))
+
+    @classmethod
+    def da_queryset(cls, queryset):
+        """Costruisce l'adiacenza da un queryset values_list(sorgente, destinazione)."""
+        valori = np.fromiter(
+            chain.from_iterable(queryset.iterator(chunk_size=app_settings.STREAM_CHUNK_SIZE)),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        return cls.da_archi(valori[:, 0], valori[:, 1])
+
+    def archi(self):
+        return self.righe[self.riga_arco], self.vicini
+
+    def trasposta(self):
+        """Adiacenza inversa: per ogni vicino, le righe che lo contengono (ordinate)."""
+        sorgenti, destinazioni = self.archi()
+        return AdiacenzaCSR.da_archi(destinazioni, sorgenti)
+
+    def _con_archi(self, tieni, nuove_sorgenti, nuove_destinazioni):
+        """
+        Nuova adiacenza con gli archi selezionati da `tieni` più quelli indicati,
+        inseriti nelle loro posizioni: si ordinano solo gli archi nuovi.
+        """
+        sorgenti, destinazioni = self.archi()
+        sorgenti, destinazioni = sorgenti[tieni].astype(np.int64), destinazioni[tieni]
+        ordine = np.lexsort((nuove_destinazioni, nuove_sorgenti))
+        nuove_sorgenti, nuove_destinazioni = nuove_sorgenti[ordine].astype(np.int64), nuove_destinazioni[ordine]
+        # gli id sono int32: (sorgente, destinazione) in un solo int64 ordinato come la coppia
+        posizioni = np.searchsorted(sorgenti << 32 | destinazioni, nuove_sorgenti << 32 | nuove_destinazioni)
+        return AdiacenzaCSR.da_archi_ordinati(
+            np.insert(sorgenti, posizioni, nuove_sorgenti),
+            np.insert(destinazioni, posizioni, nuove_destinazioni),
+        )
+
+    def con_righe_sostituite(self, ids, nuove):
+        """
+        Restituisce una nuova adiacenza in cui gli archi delle righe `ids` sono
+        sostituiti con quelli dell'adiacenza `nuove`, che contiene solo quelle righe.
+        """
+        sorgenti, _ = self.archi()
+        return self._con_archi(~np.isin(sorgenti, np.fromiter(ids, dtype=np.int64)), *nuove.archi())
+
+    def con_colonne_sostituite(self, ids, nuove):
+        """
+        Come con_righe_sostituite per l'adiacenza trasposta: gli archi verso i
+        vicini `ids` sono sostituiti con quelli di `nuove`, non trasposta.
+        """
+        sorgenti, destinazioni = nuove.archi()
+        return self._con_archi(~np.isin(self.vicini, np.fromiter(ids, dtype=np.int64)), destinazioni, sorgenti)
+
+
+class IndiceDispensa:
+    """Adiacenze ricetta -> ingredienti e ristorante -> ricette, più l'indice invertito ingrediente -> ricette."""
+
+    def __init__(self, ricette, ristoranti, ricette_per_ingrediente=None):
+        self.ricette = ricette
+        self.ristoranti = ristoranti
+        self._ricette_per_ingrediente = ricette_per_ingrediente
+
+    @property
+    def ricette_per_ingrediente(self):
+        """Indice invertito ingrediente -> ricette, costruito al primo uso."""
+        if self._ricette_per_ingrediente is None:
+            self._ricette_per_ingrediente = self.ricette.trasposta()
+        return self._ricette_per_ingrediente
+
+    def aggiornato(self, ricette=None, ristoranti=None):
+        """
+        Nuovo indice con le righe modificate sostituite: ricette e ristoranti
+        sono coppie (ids, adiacenza delle righe rilette) oppure None. L'indice
+        invertito, se già costruito, è aggiornato invece di essere ricalcolato.
+        """
+        adiacenza_ricette, adiacenza_ristoranti = self.ricette, self.ristoranti
+        inverso = self._ricette_per_ingrediente
+        if ricette is not None:
+            adiacenza_ricette = adiacenza_ricette.con_righe_sostituite(*ricette)
+            if inverso is not None:
+                inverso = inverso.con_colonne_sostituite(*ricette)
+        if ristoranti is not None:
+            adiacenza_ristoranti = adiacenza_ristoranti.con_righe_sostituite(*ristoranti)
+        return IndiceDispensa(adiacenza_ricette, adiacenza_ristoranti, inverso)
+
+    def abbina(self, ingredienti, punteggio='comuni', limite=20):
+        """
+        Ordina le ricette per ingredienti in comune con quelli indicati.
+        Per ogni ricetta con almeno un ingrediente in comune restituisce:
+            - comuni: numero di ingredienti in comune
+            - jaccard: comuni / ingredienti distinti tra ricetta e richiesta
+            - copertura: comuni / ingredienti della ricetta
+        Le ricette sono ordinate per il punteggio indicato (decrescente), poi
+        per comuni e per id; ne vengono restituite al più limite.
+        """
+        richiesti = np.unique(np.asarray(ingredienti, dtype=np.int32))
+        inverso, ricette = self.ricette_per_ingrediente, self.ricette
+        if not len(inverso.righe) or not len(richiesti):
+            return []
+        posizioni = np.minimum(np.searchsorted(inverso.righe, richiesti), len(inverso.righe) - 1)
+        posizioni = posizioni[inverso.righe[posizioni] == richiesti]
+        if not len(posizioni):
+            return []
+
+        # ricette di tutti gli ingredienti richiesti, contate per riga di `ricette`
+        candidate = np.concatenate([
+            inverso.vicini[inverso.offsets[posizione]:inverso.offsets[posizione + 1]]
+            for posizione in posizioni.tolist()
+        ])
+        conteggi = np.bincount(np.searchsorted(ricette.righe, candidate), minlength=len(ricette.righe))
+        righe = np.flatnonzero(conteggi)
+        comuni = conteggi[righe]
+        dimensioni = np.diff(ricette.offsets)[righe]
+        valori = {
+            'comuni': comuni,
+            'jaccard': comuni / (dimensioni + len(richiesti) - comuni),
+            'copertura': comuni / dimensioni,
+        }
+        ids = ricette.righe[righe]
+        # np.lexsort ordina per l'ultima chiave: punteggio, poi comuni, poi id
+        ordine = np.lexsort((ids, -comuni, -valori[punteggio]))[:limite]
+        return [
+            {
+                'id': int(ids[i]),
+                'comuni': int(comuni[i]),
+                'jaccard': round(float(valori['jaccard'][i]), 4),
+                'copertura': round(float(valori['copertura'][i]), 4),
+            }
+            for i in ordine.tolist()
+        ]
+
+    def interroga(self, ingredienti, max_mancanti=1, limite=100):
+        """
+        Dati gli id degli ingredienti disponibili restituisce:
+            - ricette: ricette che si possono cucinare per intero
+            - ricette_quasi: ricette a cui mancano al più max_mancanti ingredienti,
+              con gli ingredienti mancanti, dalle più vicine
+            - ristoranti: ristoranti di cui si possono cucinare tutte le ricette
+            - ristoranti_quasi: ristoranti a cui mancano al più max_mancanti
+              ingredienti in totale, con gli ingredienti mancanti
+        Le ricette senza ingredienti non sono considerate.
+        """
+        dispensa = np.unique(np.asarray(ingredienti, dtype=np.int32))
+        ricette = self.ricette
+
+        # ingredienti mancanti per ricetta, su tutti gli archi in una volta
+        presente = np.isin(ricette.vicini, dispensa)
+        mancante = ~presente
+        mancanti = np.bincount(ricette.riga_arco[mancante], minlength=len(ricette.righe))
+        cucinabile = mancanti == 0
+        quasi = (mancanti > 0) & (mancanti <= max_mancanti)
+
+        # ingredienti mancanti delle ricette "quasi" cucinabili
+        archi_quasi = np.flatnonzero(mancante & quasi[ricette.riga_arco])
+        mancanti_per_riga = {}
+        for riga, ingrediente in zip(ricette.riga_arco[archi_quasi].tolist(), ricette.vicini[archi_quasi].tolist()):
+            mancanti_per_riga.setdefault(riga, []).append(ingrediente)
+
+        # stato di ogni ricetta dei ristoranti: le ricette assenti dall'indice
+        # (senza ingredienti) non impediscono di cucinare il menu
+        ristoranti = self.ristoranti
+        n = len(ricette.righe)
+        if n:
+            posizioni = np.minimum(np.searchsorted(ricette.righe, ristoranti.vicini), n - 1)
+            nota = ricette.righe[posizioni] == ristoranti.vicini
+            ok = ~nota | cucinabile[posizioni]
+            recuperabile = ok | quasi[posizioni]
+        else:
+            posizioni = np.zeros(len(ristoranti.vicini), dtype=np.int64)
+            ok = recuperabile = np.ones(len(ristoranti.vicini), dtype=bool)
+        non_ok = np.bincount(ristoranti.riga_arco[~ok], minlength=len(ristoranti.righe))
+        # un ristorante è "quasi" cucinabile solo se ogni sua ricetta non cucinabile lo è
+        irrecuperabili = np.bincount(ristoranti.riga_arco[~recuperabile], minlength=len(ristoranti.righe))
+
+        ristoranti_quasi = []
+        candidati = np.flatnonzero(non_ok > 0)
+        for riga in candidati[irrecuperabili[candidati] == 0].tolist():
+            inizio, fine = ristoranti.offsets[riga], ristoranti.offsets[riga + 1]
+            mancanti_ristorante = set()
+            for posizione in posizioni[inizio:fine][~ok[inizio:fine]].tolist():
+                mancanti_ristorante.update(mancanti_per_riga[posizione])
+            if len(mancanti_ristorante) <= max_mancanti:
+                ristoranti_quasi.append({'id': int(ristoranti.righe[riga]), 'mancanti': sorted(mancanti_ristorante)})
+        ristoranti_quasi.sort(key=lambda r: (len(r['mancanti']), r['id']))
+
+        righe_quasi = np.flatnonzero(quasi)
+        righe_quasi = righe_quasi[np.argsort(mancanti[righe_quasi], kind='stable')][:limite]
+        return {
+            'ricette': ricette.righe[cucinabile][:limite].tolist(),
+            'ricette_quasi': [
+                {'id': int(ricette.righe[riga]), 'mancanti': mancanti_per_riga[riga]}
+                for riga in righe_quasi.tolist()
+            ],
+            'ristoranti': ristoranti.righe[non_ok == 0][:limite].tolist(),
+            'ristoranti_quasi': ristoranti_quasi[:limite],
+        }
+
+
+def _queryset_ricette():
+    return RicettaToIngrediente.objects.filter(
+        ricetta__deleted_at__isnull=True, ingrediente__deleted_at__isnull=True,
+    ).order_by().values_list('ricetta_id', 'ingrediente_id')
+
+
+def _queryset_ristoranti():
+    return RistoranteToRicetta.objects.filter(
+        ristorante__deleted_at__isnull=True, ricetta__deleted_at__isnull=True,
+    ).order_by().values_list('ristorante_id', 'ricetta_id')
+
+
+_lock = threading.Lock()
+_indice = None
+_caricato_il = 0.0
+_ricette_modificate = set()
+_ristoranti_modificati = set()
+
+
+def segna_ricette_modificate(ids):
+    """Segna le ricette i cui ingredienti sono cambiati; saranno rilette alla prossima richiesta."""
+    with _lock:
+        _ricette_modificate.update(ids)
+
+
+def segna_ristoranti_modificati(ids):
+    """Segna i ristoranti le cui ricette sono cambiate; saranno riletti alla prossima richiesta."""
+    with _lock:
+        _ristoranti_modificati.update(ids)
+
+
+def invalida_indice():
+    """Scarta l'indice del processo corrente, che sarà ricaricato alla prossima richiesta."""
+    global _indice
+    with _lock:
+        _indice = None
+
+
+def indice_dispensa():
+    """Restituisce l'indice aggiornato, caricandolo o aggiornandolo se necessario."""
+    global _indice, _caricato_il
+    with _lock:
+        if _indice is None or time.monotonic() - _caricato_il > app_settings.GRAFO_MAX_AGE:
+            _indice = IndiceDispensa(
+                AdiacenzaCSR.da_queryset(_queryset_ricette()),
+                AdiacenzaCSR.da_queryset(_queryset_ristoranti()),
+            )
+            _caricato_il = time.monotonic()
+        elif _ricette_modificate or _ristoranti_modificati:
+            ricette = ristoranti = None
+            if _ricette_modificate:
+                ricette = (_ricette_modificate, AdiacenzaCSR.da_queryset(
+                    _queryset_ricette().filter(ricetta_id__in=_ricette_modificate)
+                ))
+            if _ristoranti_modificati:
+                ristoranti = (_ristoranti_modificati, AdiacenzaCSR.da_queryset(
+                    _queryset_ristoranti().filter(ristorante_id__in=_ristoranti_modificati)
+                ))
+            _indice = _indice.aggiornato(ricette, ristoranti)
+        else:
+            return _indice
+        _ricette_modificate.clear()
+        _ristoranti_modificati.clear()
+        return _indice
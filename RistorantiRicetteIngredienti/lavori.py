@@ -0,0 +1,204 @@
+"""
+Coda di lavori sul database, senza broker esterni.
+
+I lavori sono righe della tabella Lavoro: accoda() ne inserisce uno, nella
+transazione della richiesta che lo crea, e i processi del comando run_workers
+li eseguono fuori dal ciclo delle richieste. Un compito è una funzione
+registrata con @compito(nome) (i compiti dell'applicazione sono in compiti.py)
+e riceve come argomenti con nome il contenuto di Lavoro.args, quindi valori
+serializzabili in JSON.
+
+Un worker prende un lavoro con reclama(): la lettura e l'aggiornamento dello
+stato avvengono in una transazione con select_for_update(skip_locked=True),
+così due worker non prendono mai lo stesso lavoro; su SQLite, che non ha lock
+di riga, lo stesso risultato si ottiene perché la transazione parte con
+BEGIN IMMEDIATE (vedi PyDjango/settings.py) e i worker la eseguono uno alla
+volta. Un lavoro che solleva un'eccezione torna in coda dopo JOB_RETRY_DELAY
+secondi (raddoppiati a ogni tentativo) fino a max_attempts tentativi.
+
+Il lock di un lavoro in corso scade dopo JOB_LOCK_TIMEOUT secondi; mentre il
+lavoro è in esecuzione un thread del worker lo rinnova ogni terzo di quel
+tempo, quindi scade solo se il worker è terminato o bloccato, e a quel punto il
+lavoro torna in coda per un altro tentativo. L'esito viene registrato solo se
+il worker possiede ancora il lock (stesso locked_by e stesso tentativo): un
+worker che lo ha perso non sovrascrive lo stato impostato da chi ha ripreso il
+lavoro.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import settings as app_settings
+from .models import Lavoro
+
+logger = logging.getLogger(__name__)
+
+# nome -> funzione
+COMPITI = {}
+
+
+def compito(nome):
+    """Decoratore che registra una funzione come compito eseguibile dai worker."""
+    def registra(funzione):
+        COMPITI[nome] = funzione
+        return funzione
+    return registra
+
+
+def accoda(nome, unico=False, ritardo=0, **argomenti):
+    """
+    Accoda il compito `nome` con gli argomenti indicati e restituisce il Lavoro.
+    Con unico=True, se lo stesso compito con gli stessi argomenti è già in coda
+    e non ancora iniziato, restituisce quello invece di accodarne un altro.
+    """
+    if nome not in COMPITI:
+        raise ValueError(f"Compito sconosciuto: {nome}")
+    if unico:
+        esistente = Lavoro.objects.filter(task=nome, args=argomenti, status=Lavoro.IN_CODA).first()
+        if esistente is not None:
+            return esistente
+    return Lavoro.objects.create(
+        task=nome,
+        args=argomenti,
+        max_attempts=app_settings.JOB_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=ritardo),
+    )
+
+
+def nome_worker():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def recupera_scaduti():
+    """Rimette in coda i lavori con il lock scaduto; restituisce quanti sono."""
+    return Lavoro.objects.filter(status=Lavoro.IN_CORSO, locked_until__lt=timezone.now()).update(
+        status=Lavoro.IN_CODA, locked_by='', locked_until=None,
+    )
+
+
+def reclama(worker):
+    """Prende il prossimo lavoro pronto, segnandolo in corso per `worker`; None se la coda è vuota."""
+    adesso = timezone.now()
+    with transaction.atomic():
+        lavoro = Lavoro.objects.select_for_update(skip_locked=True).filter(
+            status=Lavoro.IN_CODA, run_after__lte=adesso,
+        ).order_by('run_after', 'id').first()
+        if lavoro is None:
+            return None
+        lavoro.status = Lavoro.IN_CORSO
+        lavoro.attempts += 1
+        lavoro.locked_by = worker
+        lavoro.locked_until = adesso + timedelta(seconds=app_settings.JOB_LOCK_TIMEOUT)
+        lavoro.save(update_fields=['status', 'attempts', 'locked_by', 'locked_until'])
+    return lavoro
+
+
+def _posseduto(lavoro):
+    """Il lavoro, se è ancora in corso con il lock preso da questo tentativo."""
+    return Lavoro.objects.filter(
+        id=lavoro.id, status=Lavoro.IN_CORSO, locked_by=lavoro.locked_by, attempts=lavoro.attempts,
+    )
+
+
+def rinnova(lavoro):
+    """Prolunga di JOB_LOCK_TIMEOUT secondi il lock del lavoro; False se il worker non lo possiede più."""
+    scadenza = timezone.now() + timedelta(seconds=app_settings.JOB_LOCK_TIMEOUT)
+    if not _posseduto(lavoro).update(locked_until=scadenza):
+        return False
+    lavoro.locked_until = scadenza
+    return True
+
+
+class Rinnovo(threading.Thread):
+    """Thread che rinnova il lock di un lavoro finché fine non viene impostato."""
+
+    def __init__(self, lavoro):
+        super().__init__(name=f'rinnovo-lavoro-{lavoro.id}', daemon=True)
+        self.lavoro = lavoro
+        self.fine = threading.Event()
+
+    def run(self):
+        try:
+            while not self.fine.wait(app_settings.JOB_LOCK_TIMEOUT / 3):
+                try:
+                    if not rinnova(self.lavoro):
+                        logger.error("Lavoro %s (%s): lock perso durante l'esecuzione", self.lavoro.id, self.lavoro.task)
+                        return
+                except DatabaseError:
+                    # database occupato (ad esempio da una transazione del lavoro stesso): si riprova al giro successivo
+                    logger.warning("Rinnovo del lock del lavoro %s non riuscito", self.lavoro.id, exc_info=True)
+        finally:
+            # il thread ha una propria connessione
+            connection.close()
+
+
+def esegui(lavoro):
+    """
+    Esegue un lavoro reclamato, rinnovandone il lock, e ne registra l'esito se
+    il lock è ancora suo; restituisce True se è riuscito.
+    """
+    inizio = time.monotonic()
+    rinnovo = Rinnovo(lavoro)
+    rinnovo.start()
+    try:
+        funzione = COMPITI.get(lavoro.task)
+        if funzione is None:
+            raise LookupError(f"Compito sconosciuto: {lavoro.task}")
+        funzione(**lavoro.args)
+    except Exception:
+        lavoro.last_error = traceback.format_exc()
+        if lavoro.attempts < lavoro.max_attempts:
+            attesa = app_settings.JOB_RETRY_DELAY * 2 ** (lavoro.attempts - 1)
+            lavoro.status = Lavoro.IN_CODA
+            lavoro.run_after = timezone.now() + timedelta(seconds=attesa)
+            logger.warning("Lavoro %s (%s) fallito, nuovo tentativo tra %s s", lavoro.id, lavoro.task, attesa, exc_info=True)
+        else:
+            lavoro.status = Lavoro.FALLITO
+            lavoro.finished_at = timezone.now()
+            logger.error("Lavoro %s (%s) fallito dopo %d tentativi", lavoro.id, lavoro.task, lavoro.attempts, exc_info=True)
+    else:
+        lavoro.status = Lavoro.COMPLETATO
+        lavoro.finished_at = timezone.now()
+        logger.info("Lavoro %s (%s) completato in %.0f ms", lavoro.id, lavoro.task, (time.monotonic() - inizio) * 1000)
+    finally:
+        rinnovo.fine.set()
+        rinnovo.join()
+    registrato = _posseduto(lavoro).update(
+        status=lavoro.status, run_after=lavoro.run_after, last_error=lavoro.last_error,
+        finished_at=lavoro.finished_at, locked_by='', locked_until=None,
+    )
+    if not registrato:
+        logger.error("Lavoro %s (%s): lock perso, esito del tentativo %d scartato", lavoro.id, lavoro.task, lavoro.attempts)
+        return False
+    lavoro.locked_by = ''
+    lavoro.locked_until = None
+    return lavoro.status == Lavoro.COMPLETATO
+
+
+def lavora(intervallo=None, una_volta=False):
+    """
+    Ciclo di un worker: esegue i lavori pronti uno alla volta e, a coda vuota,
+    attende `intervallo` secondi (default JOB_POLL_INTERVAL); con una_volta
+    termina invece alla prima coda vuota. Restituisce il numero di lavori eseguiti.
+    """
+    intervallo = app_settings.JOB_POLL_INTERVAL if intervallo is None else intervallo
+    worker = nome_worker()
+    eseguiti = 0
+    while True:
+        close_old_connections()
+        recupera_scaduti()
+        lavoro = reclama(worker)
+        if lavoro is None:
+            if una_volta:
+                return eseguiti
+            time.sleep(intervallo)
+            continue
+        esegui(lavoro)
+        eseguiti += 1
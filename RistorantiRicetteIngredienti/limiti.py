@@ -0,0 +1,145 @@
+"""
+Limiti di richieste per client con token bucket condivisi tra i processi.
+
+Ogni client (indirizzo IP, vedi client()) ha un bucket per tutte le sue richieste, configurato da
+RATE_LIMITS['*'], e uno per ogni route che ha una voce in RATE_LIMITS: una
+richiesta è ammessa solo se entrambi hanno almeno un gettone, e in quel caso
+ne consuma uno da ciascuno. Un bucket si ricarica di `rate` gettoni al secondo
+fino alla sua capacità.
+
+I bucket stanno in un database SQLite a parte (RATE_LIMIT_DB), non in quello
+del catalogo, così i processi worker condividono lo stato senza contendersi il
+lock di scrittura delle tabelle del catalogo. Lo stato è effimero: il file può
+essere eliminato in qualunque momento (i bucket ripartono pieni), e per questo
+è aperto con synchronous=OFF. I bucket inattivi abbastanza a lungo da essere di
+nuovo pieni sono equivalenti a quelli assenti e vengono eliminati
+periodicamente. Se il database non risponde entro il busy_timeout la
+richiesta viene ammessa.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from . import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+TUTTE = '*'
+
+# ogni quanti secondi un processo elimina i bucket inattivi
+INTERVALLO_PULIZIA = 60
+
+_locale = threading.local()
+_pulito_il = 0.0
+
+
+def _connessione():
+    """Connessione del thread corrente al database dei bucket (riaperta dopo un fork)."""
+    connessione = getattr(_locale, 'connessione', None)
+    if connessione is None or _locale.pid != os.getpid() or _locale.percorso != app_settings.RATE_LIMIT_DB:
+        connessione = sqlite3.connect(app_settings.RATE_LIMIT_DB, timeout=0.1, isolation_level=None)
+        connessione.execute('PRAGMA journal_mode=WAL')
+        connessione.execute('PRAGMA synchronous=OFF')
+        connessione.execute(
+            'CREATE TABLE IF NOT EXISTS bucket '
+            '(chiave TEXT PRIMARY KEY, gettoni REAL NOT NULL, aggiornato REAL NOT NULL)'
+        )
+        connessione.execute('CREATE INDEX IF NOT EXISTS bucket_aggiornato_idx ON bucket (aggiornato)')
+        _locale.connessione, _locale.pid, _locale.percorso = connessione, os.getpid(), app_settings.RATE_LIMIT_DB
+    return connessione
+
+
+def client(request):
+    """
+    Identificativo del client della richiesta: REMOTE_ADDR, oppure dietro
+    RATE_LIMIT_TRUSTED_PROXIES proxy l'indirizzo che il primo di questi ha
+    aggiunto all'header RATE_LIMIT_CLIENT_HEADER.
+    """
+    indirizzo = request.META.get('REMOTE_ADDR', '')
+    proxy = app_settings.RATE_LIMIT_TRUSTED_PROXIES
+    if not proxy or not app_settings.RATE_LIMIT_CLIENT_HEADER:
+        return indirizzo
+    # ogni proxy aggiunge a destra l'indirizzo da cui ha ricevuto la richiesta:
+    # le voci più a sinistra delle ultime `proxy` sono scritte dal client e
+    # non sono affidabili
+    valori = [v.strip() for v in request.META.get(app_settings.RATE_LIMIT_CLIENT_HEADER, '').split(',') if v.strip()]
+    if len(valori) < proxy:
+        # richiesta che non è passata da tutti i proxy
+        return indirizzo
+    return valori[-proxy]
+
+
+def _bucket(route, cliente):
+    """(chiave, capacità, rate) dei bucket che una richiesta deve attraversare."""
+    nomi = (TUTTE,) if route == TUTTE else (TUTTE, route)
+    return [(f'{nome}|{cliente}', *app_settings.RATE_LIMITS[nome]) for nome in nomi if nome in app_settings.RATE_LIMITS]
+
+
+def _pulisci(connessione, adesso):
+    global _pulito_il
+    if adesso - _pulito_il < INTERVALLO_PULIZIA:
+        return
+    _pulito_il = adesso
+    # un bucket fermo da più del tempo di ricarica completa è pieno: equivale a uno assente
+    ricarica = max((capacita / rate for capacita, rate in app_settings.RATE_LIMITS.values()), default=0)
+    connessione.execute('DELETE FROM bucket WHERE aggiornato < ?', [adesso - ricarica])
+
+
+def consuma(route, cliente):
+    """
+    Consuma un gettone dai bucket del client per la route. Restituisce 0 se la
+    richiesta è ammessa, altrimenti i secondi da attendere prima che lo sia;
+    se è respinta nessun bucket viene modificato.
+    """
+    bucket = _bucket(route, cliente)
+    if not bucket:
+        return 0
+    adesso = time.time()
+    try:
+        connessione = _connessione()
+        connessione.execute('BEGIN IMMEDIATE')
+        try:
+            attesa = 0
+            aggiornati = []
+            for chiave, capacita, rate in bucket:
+                riga = connessione.execute('SELECT gettoni, aggiornato FROM bucket WHERE chiave = ?', [chiave]).fetchone()
+                gettoni = capacita if riga is None else min(capacita, riga[0] + (adesso - riga[1]) * rate)
+                if gettoni < 1:
+                    attesa = max(attesa, (1 - gettoni) / rate)
+                aggiornati.append((chiave, gettoni - 1, adesso))
+            if not attesa:
+                connessione.executemany('INSERT OR REPLACE INTO bucket VALUES (?, ?, ?)', aggiornati)
+                _pulisci(connessione, adesso)
+            connessione.execute('COMMIT')
+        except BaseException:
+            connessione.execute('ROLLBACK')
+            raise
+    except sqlite3.Error:
+        logger.warning("Database dei limiti non disponibile: richiesta ammessa", exc_info=True)
+        return 0
+    return attesa
+
+
+class Concorrenza:
+    """Contatore delle richieste in corso nel processo, con un massimo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_corso = 0
+
+    def entra(self):
+        """Registra una richiesta; restituisce False (senza registrarla) se il massimo è raggiunto."""
+        with self._lock:
+            if app_settings.MAX_IN_FLIGHT and self.in_corso >= app_settings.MAX_IN_FLIGHT:
+                return False
+            self.in_corso += 1
+            return True
+
+    def esci(self):
+        with self._lock:
+            self.in_corso -= 1
+
+
+concorrenza = Concorrenza()
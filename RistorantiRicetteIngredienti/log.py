@@ -0,0 +1,106 @@
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from . import metrics
+from . import settings as app_settings
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    Handler che inserisce i record in una coda in memoria; un thread in
+    background (QueueListener) li passa agli handler reali (file, console).
+    Le viste non attendono mai l'I/O su disco: se la coda è piena il record
+    viene scartato invece di bloccare il thread della richiesta.
+
+    Il thread non sopravvive a un fork: il processo figlio (worker di
+    run_workers o di un server che carica l'applicazione prima del fork) ne
+    avvia uno proprio, con una coda nuova. close(), chiamato da
+    logging.shutdown() all'uscita, scrive i record ancora in coda.
+
+    Si configura da LOGGING, ad esempio:
+        'queue': {
+            'class': 'RistorantiRicetteIngredienti.log.BackgroundQueueHandler',
+            'handlers': ['cfg://handlers.file', 'cfg://handlers.console'],
+        }
+    """
+
+    def __init__(self, handlers, maxsize=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(maxsize))
+        # dictConfig passa una ConvertingList: l'accesso per indice risolve i riferimenti cfg://
+        handlers = [handlers[i] for i in range(len(handlers))]
+        self.scartati = 0
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=respect_handler_level)
+        self.listener.start()
+        self._attivo = True
+        os.register_at_fork(after_in_child=self._dopo_fork)
+
+    def _dopo_fork(self):
+        if not self._attivo:
+            return
+        # la coda ereditata può essere rimasta bloccata dal thread del padre
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.listener = QueueListener(
+            self.queue, *self.listener.handlers, respect_handler_level=self.listener.respect_handler_level,
+        )
+        self.listener.start()
+
+    def close(self):
+        if self._attivo:
+            self._attivo = False
+            self.listener.stop()
+        super().close()
+
+    def handle(self, record):
+        # il tempo speso nel thread della richiesta compare come 'log' in Server-Timing
+        inizio = time.perf_counter()
+        try:
+            return super().handle(record)
+        finally:
+            metrics.aggiungi_tempo('log', time.perf_counter() - inizio)
+
+    def prepare(self, record):
+        # la coda resta nello stesso processo: il messaggio viene formattato dal
+        # thread in background e non da quello della richiesta
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.scartati += 1
+
+
+class Anteprima:
+    """
+    Rappresentazione pigra e limitata di una lista di righe da inserire nei log.
+    Il testo viene costruito solo se il record viene effettivamente scritto,
+    e contiene al massimo LOG_RESULT_MAX_ITEMS righe.
+    """
+
+    def __init__(self, righe, massimo=None):
+        self.righe = righe
+        self.massimo = app_settings.LOG_RESULT_MAX_ITEMS if massimo is None else massimo
+
+    def __str__(self):
+        mostrate = self.righe[:self.massimo]
+        testo = repr(mostrate)
+        altre = len(self.righe) - len(mostrate)
+        if altre > 0:
+            testo += f" ... (+{altre} altre righe)"
+        return testo
+
+
+def log_risultato(logger, messaggio, righe):
+    """
+    Registra a livello DEBUG un'anteprima delle righe restituite da una vista,
+    solo per una frazione delle richieste (LOG_RESULT_SAMPLE_RATE).
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= app_settings.LOG_RESULT_SAMPLE_RATE:
+        return
+    logger.debug("%s (%d righe): %s", messaggio, len(righe), Anteprima(righe))
@@ -0,0 +1,90 @@
+import inspect
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from RistorantiRicetteIngredienti.models import Ristorante, Ricetta, Ingrediente
+
+# richieste eseguite per l'analisi: (nome della url, parametri GET, tabelle per cui
+# una scansione completa è prevista). Nei parametri {ristorante}, {ricetta} e
+# {ingrediente} sono sostituiti con id esistenti.
+RICHIESTE = [
+    ('lista_ristoranti', {}, {Ristorante._meta.db_table}),
+    ('lista_ristoranti', {'limit': '10', 'after': '{ristorante}'}, set()),
+    ('menu_ristoranti', {'limit': '10', 'after': '{ristorante}'}, set()),
+    ('ristoranti_per_ricetta', {'ricetta_id': '{ricetta}'}, set()),
+    ('ristoranti_per_ricetta', {'ricetta_id': '{ricetta},{ricetta}'}, set()),
+    ('ricette_per_ristorante', {'ristorante_id': '{ristorante}'}, set()),
+    ('ricette_per_ristorante', {'ristorante_id': '{ristorante},{ristorante}'}, set()),
+    ('ricette_per_ingrediente', {'ingrediente_id': '{ingrediente}'}, set()),
+    ('ricette_per_ingrediente', {'ingrediente_id': '{ingrediente},{ingrediente}'}, set()),
+    ('ingredienti_per_ricetta', {'ricetta_id': '{ricetta}'}, set()),
+    ('ingredienti_per_ricetta', {'ricetta_id': '{ricetta},{ricetta}'}, set()),
+    ('ingredienti_per_ristorante', {'ristorante_id': '{ristorante}'}, set()),
+    ('ingredienti_per_ristorante', {'ristorante_id': '{ristorante}', 'recipe_count': '1'}, set()),
+    ('ingredienti_per_ristorante', {'ristorante_id': '{ristorante}', 'limit': '10'}, set()),
+    ('ingredienti_per_ristorante', {'ristorante_id': '{ristorante},{ristorante}'}, set()),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue EXPLAIN QUERY PLAN su tutte le query emesse dalle viste di lettura "
+        "e segnala le scansioni complete di tabella non previste."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-fail', action='store_true',
+            help="Non termina con errore se vengono trovate scansioni complete",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("audit_query_plans supporta solo SQLite")
+
+        tabelle = set(connection.introspection.table_names())
+        ids = {
+            nome: str(modello.objects.order_by('id').values_list('id', flat=True).first() or 1)
+            for nome, modello in (('ristorante', Ristorante), ('ricetta', Ricetta), ('ingrediente', Ingrediente))
+        }
+        factory = RequestFactory()
+        problemi = 0
+
+        for nome, parametri, previste in RICHIESTE:
+            url = reverse(nome)
+            parametri = {chiave: valore.format(**ids) for chiave, valore in parametri.items()}
+            # la cache delle risposte viene saltata, così le query vengono sempre eseguite
+            vista = inspect.unwrap(resolve(url).func)
+            if inspect.iscoroutinefunction(vista):
+                vista = async_to_sync(vista)
+            with CaptureQueriesContext(connection) as contesto:
+                risposta = vista(factory.get(url, parametri))
+                if risposta.streaming:
+                    b''.join(risposta.streaming_content)
+
+            self.stdout.write(f"{nome} {parametri}")
+            for query in contesto.captured_queries:
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    piano = [riga[-1] for riga in cursor.fetchall()]
+                scansioni = [
+                    dettaglio for dettaglio in piano
+                    if dettaglio.startswith('SCAN ') and 'USING' not in dettaglio
+                    and dettaglio.split()[1] in tabelle and dettaglio.split()[1] not in previste
+                ]
+                if options['verbosity'] > 1 or scansioni:
+                    self.stdout.write(f"  {query['sql']}")
+                    for dettaglio in piano:
+                        self.stdout.write(f"    {dettaglio}")
+                for dettaglio in scansioni:
+                    problemi += 1
+                    self.stdout.write(self.style.WARNING(f"  scansione completa: {dettaglio}"))
+
+        if problemi and not options['no_fail']:
+            raise CommandError(f"{problemi} scansioni complete di tabella non previste")
+        self.stdout.write(self.style.SUCCESS(f"Analisi completata: {problemi} scansioni complete non previste"))
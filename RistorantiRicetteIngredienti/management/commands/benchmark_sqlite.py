@@ -0,0 +1,160 @@
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from RistorantiRicetteIngredienti import settings as app_settings
+from RistorantiRicetteIngredienti.database import istruzioni_pragma
+from RistorantiRicetteIngredienti.models import Ristorante, Ingrediente
+
+# configurazione predefinita di SQLite: rollback journal e una connessione per operazione,
+# come con CONN_MAX_AGE = 0
+PREDEFINITO = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Profilo:
+    def __init__(self, nome, percorso, pragmi, persistente):
+        self.nome = nome
+        self.percorso = percorso
+        self.pragmi = pragmi
+        self.persistente = persistente
+        self.locale = threading.local()
+
+    def prepara(self):
+        with sqlite3.connect(self.percorso) as conn:
+            conn.execute(f"PRAGMA journal_mode = {self.pragmi.get('journal_mode', 'DELETE')}")
+
+    def _apri(self):
+        # timeout predefinito di Python e di Django (5 s), sostituito da busy_timeout se configurato
+        conn = sqlite3.connect(self.percorso, isolation_level=None, check_same_thread=False)
+        for istruzione in istruzioni_pragma(self.pragmi):
+            conn.execute(istruzione)
+        return conn
+
+    def esegui(self, funzione):
+        if not self.persistente:
+            conn = self._apri()
+            try:
+                return funzione(conn)
+            finally:
+                conn.close()
+        conn = getattr(self.locale, 'conn', None)
+        if conn is None:
+            conn = self.locale.conn = self._apri()
+        return funzione(conn)
+
+
+def _carico(profilo, lettori, scrittori, secondi, lettura, scrittura):
+    """
+    Esegue letture e scritture concorrenti per `secondi` e restituisce
+    {'letture': [latenze], 'scritture': [latenze], 'errori': n}.
+    """
+    risultati = {'letture': [], 'scritture': [], 'errori': 0}
+    fine = time.monotonic() + secondi
+    lock = threading.Lock()
+
+    def lavoratore(tipo, funzione):
+        latenze = []
+        errori = 0
+        while time.monotonic() < fine:
+            inizio = time.perf_counter()
+            try:
+                profilo.esegui(funzione)
+            except sqlite3.OperationalError:
+                # "database is locked": con il profilo predefinito i lettori falliscono durante le scritture
+                errori += 1
+                continue
+            latenze.append(time.perf_counter() - inizio)
+        with lock:
+            risultati[tipo].extend(latenze)
+            risultati['errori'] += errori
+
+    thread = [threading.Thread(target=lavoratore, args=('letture', lettura)) for _ in range(lettori)]
+    thread += [threading.Thread(target=lavoratore, args=('scritture', scrittura)) for _ in range(scrittori)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    return risultati
+
+
+def _p99(valori):
+    return statistics.quantiles(valori, n=100)[98] * 1000 if len(valori) > 1 else float('nan')
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta il throughput di letture e scritture concorrenti su una copia del "
+        "database SQLite con la configurazione predefinita (rollback journal, una "
+        "connessione per operazione) e con SQLITE_PRAGMAS e connessioni persistenti."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help="Durata di ogni prova in secondi (default 5)")
+        parser.add_argument('--readers', type=int, default=8, help="Thread di lettura (default 8)")
+        parser.add_argument('--writers', type=int, default=2, help="Thread di scrittura (default 2)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("benchmark_sqlite supporta solo SQLite")
+        sorgente = Path(connection.settings_dict['NAME'])
+        if not sorgente.exists():
+            raise CommandError(f"Database {sorgente} non trovato")
+        ristorante = Ristorante.objects.order_by('id').values_list('id', flat=True).first()
+        if ristorante is None:
+            raise CommandError("Il catalogo è vuoto: generarlo con seed_catalog")
+
+        # la query della vista ingredienti_per_ristorante (tabella materializzata
+        # RistoranteIngrediente) e la INSERT della riga di create_ingrediente
+        sql_lettura, parametri_lettura = Ingrediente.objects.filter(
+            ristoranteingrediente__ristorante_id=ristorante,
+            ristoranteingrediente__ristorante__deleted_at__isnull=True,
+        ).values('id', 'ingrediente_text').order_by('pk').query.sql_with_params()
+        # segnaposto del modulo sqlite3 al posto di quelli di Django
+        sql_lettura = sql_lettura.replace('%s', '?')
+        tabella = Ingrediente._meta.db_table
+
+        def lettura(conn):
+            return conn.execute(sql_lettura, parametri_lettura).fetchall()
+
+        def scrittura(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(f'INSERT INTO "{tabella}" (ingrediente_text) VALUES (?)', ('benchmark',))
+            conn.execute('COMMIT')
+
+        with tempfile.TemporaryDirectory() as directory:
+            profili = []
+            for nome, pragmi, persistente in (
+                ('predefinito', PREDEFINITO, False),
+                ('ottimizzato', app_settings.SQLITE_PRAGMAS, True),
+            ):
+                percorso = Path(directory) / f'{nome}.sqlite3'
+                # copia consistente anche se il database è in WAL
+                with sqlite3.connect(sorgente) as origine, sqlite3.connect(percorso) as copia:
+                    origine.backup(copia)
+                profili.append(Profilo(nome, str(percorso), pragmi, persistente))
+
+            righe = []
+            for profilo in profili:
+                profilo.prepara()
+                self.stdout.write(f"Profilo {profilo.nome}: {profilo.pragmi}, connessioni persistenti: {profilo.persistente}")
+                risultato = _carico(
+                    profilo, options['readers'], options['writers'], options['seconds'], lettura, scrittura,
+                )
+                righe.append((profilo.nome, risultato))
+
+        self.stdout.write(
+            f"\n{'profilo':<12} {'letture/s':>10} {'p99 lett. ms':>13} {'scritture/s':>12} {'p99 scr. ms':>12} {'errori':>7}"
+        )
+        for nome, risultato in righe:
+            letture, scritture = risultato['letture'], risultato['scritture']
+            self.stdout.write(
+                f"{nome:<12} {len(letture) / options['seconds']:>10.1f} {_p99(letture):>13.2f} "
+                f"{len(scritture) / options['seconds']:>12.1f} {_p99(scritture):>12.2f} {risultato['errori']:>7}"
+            )
+        self.stdout.write(self.style.SUCCESS("Confronto completato"))
@@ -0,0 +1,51 @@
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from RistorantiRicetteIngredienti import catalogo
+
+
+class Command(BaseCommand):
+    help = (
+        "Esporta ristoranti, ricette, ingredienti e collegamenti in una directory, "
+        "un file JSONL o CSV per tabella, leggendo il database con iteratori lato server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Directory di destinazione (viene creata se non esiste)")
+        parser.add_argument('--format', choices=catalogo.FORMATI, default='jsonl', help="Formato dei file (default jsonl)")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Righe lette e scritte per volta (default 5000)")
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        formato = options['format']
+        blocco = options['chunk_size']
+        if blocco < 1:
+            raise CommandError("--chunk-size deve essere almeno 1")
+        directory.mkdir(parents=True, exist_ok=True)
+
+        tabelle = [
+            (nome, modello.objects.order_by('id').values_list(campo))
+            for nome, modello, campo in catalogo.ENTITA
+        ] + [
+            (nome, modello.objects.filter(**{
+                # senza i collegamenti delle righe eliminate in modo logico
+                f'{campo_id[:-3]}__deleted_at__isnull': True for _, campo_id, _ in campi
+            }).order_by('id').values_list(
+                *(f'{campo_id[:-3]}__{catalogo.CAMPO_NOME[collegato]}' for _, campo_id, collegato in campi)
+            ))
+            for nome, modello, campi in catalogo.COLLEGAMENTI
+        ]
+        for nome, queryset in tabelle:
+            percorso = directory / f'{nome}.{formato}'
+            righe = queryset.iterator(chunk_size=blocco)
+            totale = 0
+            with open(percorso, 'w', encoding='utf-8', newline='') as file:
+                scrittore = catalogo.Scrittore(file, formato, catalogo.colonne(nome))
+                while porzione := list(islice(righe, blocco)):
+                    scrittore.scrivi(porzione)
+                    totale += len(porzione)
+            self.stdout.write(f"{percorso}: {totale} righe")
+
+        self.stdout.write(self.style.SUCCESS(f"Catalogo esportato in {directory}"))
@@ -0,0 +1,160 @@
+import json
+import os
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from RistorantiRicetteIngredienti import catalogo
+from RistorantiRicetteIngredienti.lavori import accoda
+from RistorantiRicetteIngredienti.signals import entita_create, collegamenti_creati
+
+CHECKPOINT = '.catalog_import_checkpoint.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa un catalogo esportato da catalog_export (JSONL o CSV) leggendo i file "
+        "in streaming e inserendo le righe a blocchi con bulk_create. Ogni blocco è una "
+        "transazione seguita da un checkpoint: con --resume l'import riprende dall'ultimo "
+        "blocco completato."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Directory con i file del catalogo")
+        parser.add_argument(
+            '--format', choices=catalogo.FORMATI,
+            help="Formato dei file (default: dedotto dai file presenti)",
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Righe per transazione (default 5000)")
+        parser.add_argument('--resume', action='store_true', help="Riprende dall'ultimo checkpoint")
+        parser.add_argument('--checkpoint', help=f"File di checkpoint (default: <directory>/{CHECKPOINT})")
+        parser.add_argument(
+            '--background', action='store_true',
+            help="Accoda l'import per i worker (run_workers) invece di eseguirlo",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        directory = Path(options['directory'])
+        if not directory.is_dir():
+            raise CommandError(f"{directory} non è una directory")
+        if options['background']:
+            # il worker può girare in un'altra directory: percorsi assoluti
+            opzioni = {'chunk_size': options['chunk_size']}
+            if options['format']:
+                opzioni['format'] = options['format']
+            if options['checkpoint']:
+                opzioni['checkpoint'] = str(Path(options['checkpoint']).resolve())
+            lavoro = accoda('catalog_import', directory=str(directory.resolve()), **opzioni)
+            self.stdout.write(self.style.SUCCESS(f"Import accodato (lavoro {lavoro.id})"))
+            return
+        formato = options['format'] or self._formato(directory)
+        self.blocco = options['chunk_size']
+        if self.blocco < 1:
+            raise CommandError("--chunk-size deve essere almeno 1")
+        self.percorso_checkpoint = Path(options['checkpoint'] or directory / CHECKPOINT)
+        self.checkpoint = {}
+        if options['resume'] and self.percorso_checkpoint.exists():
+            self.checkpoint = json.loads(self.percorso_checkpoint.read_text(encoding='utf-8'))
+            self.stdout.write(f"Ripresa dal checkpoint {self.percorso_checkpoint}")
+
+        # nome -> id per ogni modello; un nome duplicato si riferisce all'id più basso
+        self.ids = {}
+        for _, modello, campo in catalogo.ENTITA:
+            mappa = self.ids[modello] = {}
+            for nome, id_ in modello.objects.order_by('id').values_list(campo, 'id').iterator(chunk_size=self.blocco):
+                mappa.setdefault(nome, id_)
+
+        for nome, modello, campo in catalogo.ENTITA:
+            self._importa(directory, nome, formato, lambda righe, m=modello, c=campo: self._entita(m, c, righe))
+        for nome, modello, campi in catalogo.COLLEGAMENTI:
+            self._importa(directory, nome, formato, lambda righe, m=modello, c=campi: self._collegamenti(m, c, righe))
+
+        self.percorso_checkpoint.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(f"Catalogo importato da {directory}"))
+
+    def _formato(self, directory):
+        for formato in catalogo.FORMATI:
+            if any((directory / f'{nome}.{formato}').exists() for nome, _, _ in catalogo.ENTITA + catalogo.COLLEGAMENTI):
+                return formato
+        raise CommandError(f"Nessun file del catalogo in {directory}")
+
+    def _salva_checkpoint(self):
+        # scrittura atomica: un'interruzione non lascia un checkpoint troncato
+        temporaneo = self.percorso_checkpoint.with_suffix('.tmp')
+        temporaneo.write_text(json.dumps(self.checkpoint), encoding='utf-8')
+        os.replace(temporaneo, self.percorso_checkpoint)
+
+    def _importa(self, directory, nome, formato, elabora):
+        """Legge un file a blocchi; ogni blocco è elaborato in una transazione e poi salvato nel checkpoint."""
+        percorso = directory / f'{nome}.{formato}'
+        if not percorso.exists():
+            return
+        stato = self.checkpoint.get(nome, {'righe': 0, 'inserite': 0, 'scartate': 0, 'completo': False})
+        if stato['completo']:
+            self.stdout.write(f"{percorso}: già importato")
+            return
+        with open(percorso, encoding='utf-8', newline='') as file:
+            righe = islice(catalogo.leggi(file, formato), stato['righe'], None)
+            while porzione := list(islice(righe, self.blocco)):
+                with transaction.atomic():
+                    inserite, scartate = elabora(porzione)
+                stato['righe'] += len(porzione)
+                stato['inserite'] += inserite
+                stato['scartate'] += scartate
+                self.checkpoint[nome] = stato
+                self._salva_checkpoint()
+                if self.verbosity > 1:
+                    self.stdout.write(f"  {nome}: {stato['righe']} righe lette")
+        stato['completo'] = True
+        self.checkpoint[nome] = stato
+        self._salva_checkpoint()
+        self.stdout.write(
+            f"{percorso}: {stato['righe']} righe, {stato['inserite']} inserite, {stato['scartate']} scartate"
+        )
+
+    def _entita(self, modello, campo, righe):
+        """Inserisce le entità con un nome non ancora presente; restituisce (inserite, scartate)."""
+        mappa = self.ids[modello]
+        nuovi = {}
+        scartate = 0
+        for riga in righe:
+            nome = riga.get(campo)
+            if not nome or nome in mappa or nome in nuovi:
+                scartate += 1
+                continue
+            nuovi[nome] = modello(**{campo: nome})
+        creati = modello.objects.bulk_create(nuovi.values())
+        # su SQLite e PostgreSQL bulk_create restituisce gli id delle righe inserite
+        for oggetto in creati:
+            mappa[getattr(oggetto, campo)] = oggetto.pk
+        entita_create.send(modello, ids=[oggetto.pk for oggetto in creati])
+        return len(creati), scartate
+
+    def _collegamenti(self, modello, campi, righe):
+        """
+        Risolve i nomi in id e inserisce i collegamenti; quelli già presenti
+        vengono ignorati (e contati tra gli inseriti), quelli con nomi
+        sconosciuti scartati.
+        """
+        (colonna_a, campo_a, modello_a), (colonna_b, campo_b, modello_b) = campi
+        ids_a, ids_b = self.ids[modello_a], self.ids[modello_b]
+        # dizionario e non set: i collegamenti sono inseriti nell'ordine del file
+        coppie = {}
+        scartate = 0
+        for riga in righe:
+            a, b = ids_a.get(riga.get(colonna_a)), ids_b.get(riga.get(colonna_b))
+            if a is None or b is None:
+                scartate += 1
+                if self.verbosity > 1:
+                    self.stdout.write(self.style.WARNING(f"  nome sconosciuto: {riga}"))
+                continue
+            coppie[(a, b)] = None
+        modello.objects.bulk_create(
+            [modello(**{campo_a: a, campo_b: b}) for a, b in coppie], ignore_conflicts=True
+        )
+        # bulk_create non invia post_save: cache e indice della dispensa sono aggiornati dal segnale
+        collegamenti_creati.send(modello, coppie=coppie)
+        return len(coppie), scartate
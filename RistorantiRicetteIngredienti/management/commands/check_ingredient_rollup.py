@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from RistorantiRicetteIngredienti import aggregati
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica che la tabella materializzata RistoranteIngrediente corrisponda ai "
+        "collegamenti ristorante-ricetta-ingrediente. Termina con errore se ci sono "
+        "differenze; con --fix rigenera la tabella."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rigenera la tabella se non è coerente")
+        parser.add_argument('--examples', type=int, default=10, help="Differenze da mostrare (default 10)")
+
+    def handle(self, *args, **options):
+        errate, in_eccesso, differenze = aggregati.verifica(options['examples'])
+        if not errate and not in_eccesso:
+            self.stdout.write(self.style.SUCCESS("Tabella RistoranteIngrediente coerente"))
+            return
+        self.stdout.write(self.style.WARNING(
+            f"Tabella RistoranteIngrediente non coerente: {errate} righe mancanti o errate, {in_eccesso} in eccesso"
+        ))
+        for ristorante, ingrediente, atteso, trovato in differenze:
+            self.stdout.write(f"  ristorante {ristorante}, ingrediente {ingrediente}: atteso {atteso}, trovato {trovato}")
+        if not options['fix']:
+            raise CommandError("Tabella RistoranteIngrediente non coerente: eseguire con --fix o rebuild_ingredient_rollup")
+        righe = aggregati.ricostruisci()
+        self.stdout.write(self.style.SUCCESS(f"Tabella RistoranteIngrediente ricostruita: {righe} righe"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from RistorantiRicetteIngredienti import settings as app_settings
+from RistorantiRicetteIngredienti.lavori import accoda
+from RistorantiRicetteIngredienti.modifiche import compatta, orizzonte
+
+
+class Command(BaseCommand):
+    help = (
+        "Compatta il registro delle modifiche di api/changes/: elimina le voci superate "
+        "da una più recente dello stesso oggetto e le eliminazioni più vecchie di "
+        "CHANGES_RETENTION secondi, alzando l'orizzonte dei client."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention', type=int, default=None,
+            help="Secondi di conservazione delle eliminazioni (default CHANGES_RETENTION)",
+        )
+        parser.add_argument('--background', action='store_true', help="Accoda il lavoro per i worker (run_workers)")
+
+    def handle(self, *args, **options):
+        conservazione = options['retention']
+        if conservazione is None:
+            conservazione = app_settings.CHANGES_RETENTION
+        if options['background']:
+            lavoro = accoda('compact_changes', unico=True, conservazione=conservazione)
+            self.stdout.write(self.style.SUCCESS(f"Compattazione accodata (lavoro {lavoro.id})"))
+            return
+        superate, scadute = compatta(conservazione)
+        self.stdout.write(self.style.SUCCESS(
+            f"Registro compattato: {superate} voci superate e {scadute} eliminazioni scadute rimosse, "
+            f"orizzonte {orizzonte()}"
+        ))
@@ -0,0 +1,176 @@
+import http.client
+import itertools
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from importlib.util import find_spec
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from RistorantiRicetteIngredienti.models import Ristorante, Ricetta, Ingrediente
+
+# viste di lettura interrogate, con il parametro id e il modello da cui prendere gli id
+VISTE = [
+    ('ristoranti_per_ricetta', 'ricetta_id', Ricetta),
+    ('ricette_per_ristorante', 'ristorante_id', Ristorante),
+    ('ricette_per_ingrediente', 'ingrediente_id', Ingrediente),
+    ('ingredienti_per_ricetta', 'ricetta_id', Ricetta),
+    ('ingredienti_per_ristorante', 'ristorante_id', Ristorante),
+]
+
+
+def _attendi_server(url, timeout=30):
+    """Attende che il server risponda sull'indirizzo indicato."""
+    parti = urlsplit(url)
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection((parti.hostname, parti.port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _carico(url, percorsi, richieste, concorrenza):
+    """
+    Esegue `richieste` GET distribuite su `concorrenza` thread, ognuno con una
+    connessione keep-alive. Restituisce (latenze in secondi, errori, durata).
+    """
+    parti = urlsplit(url)
+    contatore = itertools.count()
+    latenze = []
+    errori = []
+
+    def lavoratore():
+        connessione = http.client.HTTPConnection(parti.hostname, parti.port, timeout=30)
+        mie = []
+        try:
+            while (indice := next(contatore)) < richieste:
+                percorso = percorsi[indice % len(percorsi)]
+                inizio = time.perf_counter()
+                try:
+                    connessione.request('GET', percorso)
+                    risposta = connessione.getresponse()
+                    risposta.read()
+                    # 429: limiti di richieste attivi sul server (vedi RATE_LIMITS)
+                    if risposta.status >= 500 or risposta.status == 429:
+                        errori.append(risposta.status)
+                except (OSError, http.client.HTTPException) as e:
+                    errori.append(type(e).__name__)
+                    connessione.close()
+                    connessione = http.client.HTTPConnection(parti.hostname, parti.port, timeout=30)
+                    continue
+                mie.append(time.perf_counter() - inizio)
+        finally:
+            connessione.close()
+            latenze.extend(mie)
+
+    thread = [threading.Thread(target=lavoratore) for _ in range(concorrenza)]
+    inizio = time.perf_counter()
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    return latenze, errori, time.perf_counter() - inizio
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta throughput e latenza (p50/p99) delle viste di lettura servite "
+        "in modo sincrono via WSGI (gunicorn) e asincrono via ASGI (uvicorn), "
+        "sotto carico concorrente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help="Richieste per server (default 2000)")
+        parser.add_argument('--concurrency', type=int, default=50, help="Client concorrenti (default 50)")
+        parser.add_argument('--warmup', type=int, default=100, help="Richieste di riscaldamento non misurate")
+        parser.add_argument('--workers', type=int, default=2, help="Processi worker per server (default 2)")
+        parser.add_argument('--threads', type=int, default=8, help="Thread per worker WSGI (default 8)")
+        parser.add_argument('--wsgi-url', help="URL di un server WSGI già avviato (altrimenti viene avviato gunicorn)")
+        parser.add_argument('--asgi-url', help="URL di un server ASGI già avviato (altrimenti viene avviato uvicorn)")
+        parser.add_argument('--port', type=int, default=8101, help="Prima porta per i server avviati (default 8101)")
+        parser.add_argument(
+            '--bust-cache', action='store_true',
+            help="Aggiunge un parametro diverso ad ogni richiesta per misurare il percorso senza cache",
+        )
+
+    def _percorsi(self, bust_cache):
+        percorsi = [reverse('lista_ristoranti') + '?limit=50']
+        for nome, parametro, modello in VISTE:
+            ids = list(modello.objects.order_by('?').values_list('id', flat=True)[:50])
+            if not ids:
+                raise CommandError(f"Nessun {modello.__name__} nel database: popolare il catalogo prima del confronto")
+            percorsi += [f"{reverse(nome)}?{parametro}={i}" for i in ids]
+        random.shuffle(percorsi)
+        if bust_cache:
+            percorsi = [f"{p}&_={i}" for i, p in enumerate(percorsi * 20)]
+        return percorsi
+
+    def _avvia(self, tipo, porta, options):
+        ambiente = dict(os.environ)
+        if tipo == 'wsgi':
+            if find_spec('gunicorn') is None:
+                raise CommandError("gunicorn non è installato: installarlo oppure indicare --wsgi-url")
+            ambiente['DJANGO_SETTINGS_MODULE'] = 'PyDjango.settings'
+            comando = [
+                sys.executable, '-m', 'gunicorn', 'PyDjango.wsgi:application',
+                '--bind', f'127.0.0.1:{porta}', '--workers', str(options['workers']),
+                '--threads', str(options['threads']), '--log-level', 'warning',
+            ]
+        else:
+            if find_spec('uvicorn') is None:
+                raise CommandError("uvicorn non è installato: installarlo oppure indicare --asgi-url")
+            ambiente['DJANGO_SETTINGS_MODULE'] = 'PyDjango.settings_asgi'
+            comando = [
+                sys.executable, '-m', 'uvicorn', 'PyDjango.asgi:application',
+                '--host', '127.0.0.1', '--port', str(porta), '--workers', str(options['workers']),
+                '--log-level', 'warning', '--no-access-log',
+            ]
+        processo = subprocess.Popen(comando, cwd=settings.BASE_DIR, env=ambiente)
+        url = f'http://127.0.0.1:{porta}'
+        if not _attendi_server(url):
+            processo.terminate()
+            raise CommandError(f"Il server {tipo.upper()} non risponde su {url}")
+        return processo, url
+
+    def handle(self, *args, **options):
+        percorsi = self._percorsi(options['bust_cache'])
+        risultati = []
+        for porta, tipo in enumerate(('wsgi', 'asgi'), start=options['port']):
+            processo = None
+            url = options[f'{tipo}_url']
+            if not url:
+                processo, url = self._avvia(tipo, porta, options)
+            try:
+                self.stdout.write(f"{tipo.upper()}: {url}")
+                _carico(url, percorsi, options['warmup'], min(options['concurrency'], options['warmup'] or 1))
+                latenze, errori, durata = _carico(url, percorsi, options['requests'], options['concurrency'])
+            finally:
+                if processo is not None:
+                    processo.terminate()
+                    processo.wait(timeout=30)
+            risultati.append((tipo.upper(), latenze, errori, durata))
+
+        self.stdout.write(f"\n{'server':<6} {'ok':>7} {'errori':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for tipo, latenze, errori, durata in risultati:
+            if len(latenze) < 2:
+                self.stdout.write(self.style.WARNING(f"{tipo:<6} troppe poche richieste completate ({len(latenze)})"))
+                continue
+            centili = statistics.quantiles(latenze, n=100)
+            self.stdout.write(
+                f"{tipo:<6} {len(latenze):>7} {len(errori):>7} {len(latenze) / durata:>9.1f} "
+                f"{centili[49] * 1000:>8.1f} {centili[98] * 1000:>8.1f} {max(latenze) * 1000:>8.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Confronto completato: {options['requests']} richieste per server, concorrenza {options['concurrency']}"
+        ))
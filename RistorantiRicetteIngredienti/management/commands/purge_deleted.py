@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from RistorantiRicetteIngredienti import settings as app_settings
+from RistorantiRicetteIngredienti.eliminazione import purge
+
+
+class Command(BaseCommand):
+    help = (
+        "Elimina definitivamente ristoranti, ricette e ingredienti eliminati in modo "
+        "logico (soft=1): i collegamenti vengono eliminati a blocchi, ognuno in una "
+        "transazione breve, e per ultime le righe rimaste senza collegamenti."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=app_settings.PURGE_BATCH_SIZE,
+            help=f"Collegamenti eliminati per transazione (default {app_settings.PURGE_BATCH_SIZE})",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=app_settings.PURGE_INTERVAL,
+            help=f"Secondi di attesa quando non c'è nulla da eliminare (default {app_settings.PURGE_INTERVAL})",
+        )
+        parser.add_argument('--once', action='store_true', help="Elimina ciò che è in attesa ed esce")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size deve essere almeno 1")
+
+        totale_collegamenti = totale_righe = 0
+        try:
+            while True:
+                inizio = time.monotonic()
+                collegamenti, righe = purge(options['batch_size'])
+                totale_collegamenti += collegamenti
+                totale_righe += righe
+                if collegamenti or righe:
+                    if options['verbosity'] > 1:
+                        self.stdout.write(
+                            f"Eliminati {collegamenti} collegamenti e {righe} righe "
+                            f"in {(time.monotonic() - inizio) * 1000:.0f} ms"
+                        )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f"Eliminati definitivamente {totale_righe} righe e {totale_collegamenti} collegamenti"
+        ))
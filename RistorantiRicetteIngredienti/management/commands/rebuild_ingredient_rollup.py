@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from RistorantiRicetteIngredienti import aggregati
+from RistorantiRicetteIngredienti.lavori import accoda
+
+
+class Command(BaseCommand):
+    help = (
+        "Rigenera per intero la tabella materializzata RistoranteIngrediente "
+        "(ingredienti per ristorante con il numero di ricette) dai collegamenti."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--background', action='store_true', help="Accoda il lavoro per i worker (run_workers)")
+
+    def handle(self, *args, **options):
+        if options['background']:
+            lavoro = accoda('rebuild_ingredient_rollup', unico=True)
+            self.stdout.write(self.style.SUCCESS(f"Ricostruzione accodata (lavoro {lavoro.id})"))
+            return
+        righe = aggregati.ricostruisci()
+        self.stdout.write(self.style.SUCCESS(f"Tabella RistoranteIngrediente ricostruita: {righe} righe"))
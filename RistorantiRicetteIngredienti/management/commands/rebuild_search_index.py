@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from RistorantiRicetteIngredienti.lavori import accoda
+from RistorantiRicetteIngredienti.ricerca import ricostruisci_indice
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricostruisce l'indice full-text (FTS5) di ristoranti, ricette e ingredienti "
+        "e reinstalla i trigger che lo mantengono aggiornato."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--background', action='store_true', help="Accoda il lavoro per i worker (run_workers)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("rebuild_search_index supporta solo SQLite")
+        if options['background']:
+            lavoro = accoda('rebuild_search_index', unico=True)
+            self.stdout.write(self.style.SUCCESS(f"Ricostruzione accodata (lavoro {lavoro.id})"))
+            return
+        totale = ricostruisci_indice()
+        self.stdout.write(self.style.SUCCESS(f"Indice di ricerca ricostruito: {totale} elementi"))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from RistorantiRicetteIngredienti import settings as app_settings
+from RistorantiRicetteIngredienti.replica import Replicatore
+
+
+class Command(BaseCommand):
+    help = (
+        "Copia periodicamente il database primario sulle repliche di sola lettura "
+        "(READ_REPLICAS) con l'API di online backup di SQLite. Se il primario non è "
+        "cambiato dall'ultima copia aggiorna soltanto l'istante di sincronizzazione."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="Repliche da aggiornare (default: READ_REPLICAS)")
+        parser.add_argument(
+            '--interval', type=float, default=app_settings.REPLICA_SYNC_INTERVAL,
+            help=f"Secondi tra due copie (default {app_settings.REPLICA_SYNC_INTERVAL})",
+        )
+        parser.add_argument('--once', action='store_true', help="Esegue una sola copia ed esce")
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or list(app_settings.READ_REPLICAS)
+        if not aliases:
+            raise CommandError("Nessuna replica configurata in READ_REPLICAS")
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if alias not in connections.settings:
+                raise CommandError(f"Database {alias} non presente in DATABASES")
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError("replicate_db supporta solo SQLite")
+        if app_settings.REPLICA_MAX_STALENESS <= options['interval']:
+            self.stdout.write(self.style.WARNING(
+                f"--interval ({options['interval']} s) non è inferiore a REPLICA_MAX_STALENESS "
+                f"({app_settings.REPLICA_MAX_STALENESS} s): le repliche risulteranno spesso non aggiornate"
+            ))
+
+        replicatore = Replicatore(aliases)
+        try:
+            while True:
+                inizio = time.monotonic()
+                copiate = replicatore.esegui()
+                if copiate and options['verbosity'] > 0:
+                    self.stdout.write(
+                        f"Copiato il primario su {', '.join(copiate)} in {(time.monotonic() - inizio) * 1000:.0f} ms"
+                    )
+                if options['once']:
+                    break
+                time.sleep(max(0.0, options['interval'] - (time.monotonic() - inizio)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            replicatore.chiudi()
+        self.stdout.write(self.style.SUCCESS("Replica terminata"))
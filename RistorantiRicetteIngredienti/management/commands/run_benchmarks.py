@@ -0,0 +1,73 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from RistorantiRicetteIngredienti import benchmark
+from RistorantiRicetteIngredienti.models import Ristorante, Ricetta, Ingrediente
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue la suite di benchmark su tutti gli endpoint con il client di test "
+        "(latenza p50/p95/p99, query SQL, byte) e la confronta con la baseline salvata."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=50, help="Ripetizioni per caso (default 50)")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help="Peggioramento ammesso per latenza e byte, come frazione (default 0.5)",
+        )
+        parser.add_argument('--baseline', default=str(benchmark.BASELINE), help="File JSON della baseline")
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help="Salva i risultati come nuova baseline invece di confrontarli",
+        )
+        parser.add_argument(
+            '--with-cache', action='store_true',
+            help="Non svuota la cache delle risposte prima di ogni richiesta",
+        )
+
+    def handle(self, *args, **options):
+        if options['repetitions'] < 1:
+            raise CommandError("--repetitions deve essere almeno 1")
+        if not Ristorante.objects.exists() or not Ricetta.objects.exists() or not Ingrediente.objects.exists():
+            raise CommandError("Il catalogo è vuoto: generarlo con seed_catalog")
+
+        # i log di ogni richiesta coprirebbero i risultati
+        logger = logging.getLogger('RistorantiRicetteIngredienti')
+        livello = logger.level
+        if options['verbosity'] < 2:
+            logger.setLevel(logging.WARNING)
+        # come nei test: abilita l'host 'testserver' del client
+        setup_test_environment()
+        try:
+            risultati = benchmark.esegui(Client(), options['repetitions'], options['with_cache'])
+        finally:
+            teardown_test_environment()
+            logger.setLevel(livello)
+
+        self.stdout.write(f"{'caso':<42} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'query':>6} {'byte':>9}")
+        for nome, r in risultati.items():
+            self.stdout.write(
+                f"{nome:<42} {r['status']:>6} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                f"{r['p99_ms']:>8.2f} {r['queries']:>6} {r['bytes']:>9}"
+            )
+
+        if options['update_baseline']:
+            benchmark.salva_baseline(risultati, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline salvata in {options['baseline']}"))
+            return
+
+        try:
+            baseline = benchmark.carica_baseline(options['baseline'])
+        except FileNotFoundError:
+            raise CommandError(f"Baseline {options['baseline']} non trovata: crearla con --update-baseline")
+        regressioni = benchmark.confronta(risultati, baseline, options['tolerance'])
+        for regressione in regressioni:
+            self.stdout.write(self.style.WARNING(f"  regressione: {regressione}"))
+        if regressioni:
+            raise CommandError(f"{len(regressioni)} regressioni rispetto alla baseline")
+        self.stdout.write(self.style.SUCCESS("Nessuna regressione rispetto alla baseline"))
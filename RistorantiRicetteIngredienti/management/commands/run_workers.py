@@ -0,0 +1,71 @@
+import logging
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from RistorantiRicetteIngredienti import settings as app_settings
+from RistorantiRicetteIngredienti.caching import versioni_condivise
+from RistorantiRicetteIngredienti.lavori import lavora
+
+
+def _worker(intervallo, una_volta):
+    try:
+        lavora(intervallo, una_volta)
+    except KeyboardInterrupt:
+        pass
+
+
+def _processo(intervallo, una_volta):
+    try:
+        _worker(intervallo, una_volta)
+    finally:
+        # i processi creati con fork terminano con os._exit, senza gli handler
+        # di atexit: i record ancora in coda (log.py) vanno scritti qui
+        logging.shutdown()
+
+
+class Command(BaseCommand):
+    help = (
+        "Avvia i worker della coda dei lavori (tabella Lavoro): ogni processo prende "
+        "un lavoro alla volta, lo esegue e ne registra l'esito; i lavori falliti vengono "
+        "ritentati fino a JOB_MAX_ATTEMPTS volte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Processi worker (default 1)")
+        parser.add_argument(
+            '--interval', type=float, default=app_settings.JOB_POLL_INTERVAL,
+            help=f"Secondi di attesa quando la coda è vuota (default {app_settings.JOB_POLL_INTERVAL})",
+        )
+        parser.add_argument('--once', action='store_true', help="Esegue i lavori pronti ed esce")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError("--processes deve essere almeno 1")
+        if not versioni_condivise():
+            # le invalidazioni dei lavori non raggiungerebbero i processi web
+            raise CommandError(
+                f"La cache '{app_settings.CACHE_VERSION_ALIAS}' (CACHE_VERSION_ALIAS) è locale al processo: "
+                "configurare una cache condivisa (file, database, Redis) prima di avviare i worker"
+            )
+        argomenti = (options['interval'], options['once'])
+        if options['processes'] == 1:
+            _worker(*argomenti)
+            return
+
+        # i processi figli non devono ereditare le connessioni aperte del padre
+        connections.close_all()
+        contesto = multiprocessing.get_context('fork')
+        processi = [contesto.Process(target=_processo, args=argomenti) for _ in range(options['processes'])]
+        for processo in processi:
+            processo.start()
+        self.stdout.write(f"Avviati {len(processi)} worker")
+        try:
+            for processo in processi:
+                processo.join()
+        except KeyboardInterrupt:
+            for processo in processi:
+                processo.terminate()
+            for processo in processi:
+                processo.join()
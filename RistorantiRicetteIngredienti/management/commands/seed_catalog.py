@@ -0,0 +1,125 @@
+import random
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from RistorantiRicetteIngredienti import aggregati, grafo, statistiche
+from RistorantiRicetteIngredienti.models import (
+    Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, RistoranteIngrediente,
+)
+
+# parole da cui sono composti i nomi generati, per avere testi realistici anche per la ricerca
+PAROLE = {
+    'ristorante': (
+        ['Trattoria', 'Osteria', 'Ristorante', 'Pizzeria', 'Locanda', 'Bistrot', 'Taverna'],
+        ['da Mario', 'del Porto', 'al Duomo', 'La Pergola', 'Il Girasole', 'dei Pescatori', 'Bella Vista', 'Vecchia Roma'],
+    ),
+    'ricetta': (
+        ['Spaghetti', 'Risotto', 'Tagliatelle', 'Zuppa', 'Filetto', 'Insalata', 'Torta', 'Gnocchi', 'Lasagne'],
+        ['alla carbonara', 'ai funghi', 'al pomodoro', 'di mare', 'al tartufo', 'alla genovese', 'con verdure', 'della casa'],
+    ),
+    'ingrediente': (
+        ['pomodoro', 'basilico', 'farina', 'uova', 'guanciale', 'pecorino', 'funghi', 'riso', 'olio', 'aglio', 'tartufo'],
+        ['fresco', 'secco', 'biologico', 'di stagione', 'DOP', 'IGP', 'locale'],
+    ),
+}
+
+
+def _nomi(rng, tipo, quanti):
+    prime, seconde = PAROLE[tipo]
+    for numero in range(1, quanti + 1):
+        yield f"{rng.choice(prime)} {rng.choice(seconde)} {numero}"
+
+
+def _a_blocchi(iterabile, dimensione):
+    iteratore = iter(iterabile)
+    while blocco := list(islice(iteratore, dimensione)):
+        yield blocco
+
+
+class Command(BaseCommand):
+    help = (
+        "Popola il database con un catalogo sintetico deterministico di ristoranti, "
+        "ricette e ingredienti, con inserimenti bulk a blocchi."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ristoranti', type=int, default=10000, help="Numero di ristoranti (default 10000)")
+        parser.add_argument('--ricette', type=int, default=200000, help="Numero di ricette (default 200000)")
+        parser.add_argument('--ingredienti', type=int, default=50000, help="Numero di ingredienti (default 50000)")
+        parser.add_argument(
+            '--ricette-per-ristorante', type=int, default=20,
+            help="Numero medio di ricette per ristorante (default 20)",
+        )
+        parser.add_argument(
+            '--ingredienti-per-ricetta', type=int, default=10,
+            help="Numero medio di ingredienti per ricetta (default 10)",
+        )
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help="Fattore moltiplicativo per il numero di ristoranti, ricette e ingredienti",
+        )
+        parser.add_argument('--seed', type=int, default=42, help="Seme del generatore casuale (default 42)")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Righe per ogni bulk insert (default 5000)")
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Elimina il catalogo esistente prima di generare quello nuovo",
+        )
+
+    def handle(self, *args, **options):
+        scala = options['scale']
+        quanti = {
+            Ristorante: max(1, int(options['ristoranti'] * scala)),
+            Ricetta: max(1, int(options['ricette'] * scala)),
+            Ingrediente: max(1, int(options['ingredienti'] * scala)),
+        }
+        modelli = (RistoranteIngrediente, RistoranteToRicetta, RicettaToIngrediente, Ristorante, Ricetta, Ingrediente)
+        if options['clear']:
+            for modello in modelli:
+                # eliminazione diretta in SQL: il catalogo viene sostituito per intero,
+                # senza raccogliere gli oggetti né inviare segnali
+                eliminati = modello._base_manager.all()._raw_delete(modello._base_manager.db)
+                self.stdout.write(f"{modello.__name__}: {eliminati} righe eliminate")
+        elif any(modello.objects.exists() for modello in modelli):
+            raise CommandError("Il catalogo non è vuoto: usare --clear per sostituirlo")
+
+        rng = random.Random(options['seed'])
+        blocco = options['chunk_size']
+        ids = {}
+        for modello, tipo in ((Ristorante, 'ristorante'), (Ricetta, 'ricetta'), (Ingrediente, 'ingrediente')):
+            campo = f'{tipo}_text'
+            with transaction.atomic():
+                for nomi in _a_blocchi(_nomi(rng, tipo, quanti[modello]), blocco):
+                    modello.objects.bulk_create([modello(**{campo: nome}) for nome in nomi])
+            ids[modello] = list(modello.objects.order_by('id').values_list('id', flat=True))
+            self.stdout.write(f"{modello.__name__}: {len(ids[modello])} righe")
+
+        collegamenti = (
+            (RistoranteToRicetta, 'ristorante_id', Ristorante, 'ricetta_id', Ricetta, options['ricette_per_ristorante']),
+            (RicettaToIngrediente, 'ricetta_id', Ricetta, 'ingrediente_id', Ingrediente, options['ingredienti_per_ricetta']),
+        )
+        for modello, campo_a, modello_a, campo_b, modello_b, media in collegamenti:
+            ids_b = ids[modello_b]
+
+            def coppie():
+                for a in ids[modello_a]:
+                    # tra 1 e 2 * media - 1 collegati distinti, in media `media`
+                    quanti_b = min(len(ids_b), rng.randint(1, max(1, 2 * media - 1)))
+                    for b in sorted(rng.sample(ids_b, quanti_b)):
+                        yield modello(**{campo_a: a, campo_b: b})
+
+            totale = 0
+            with transaction.atomic():
+                for righe in _a_blocchi(coppie(), blocco):
+                    modello.objects.bulk_create(righe)
+                    totale += len(righe)
+            self.stdout.write(f"{modello.__name__}: {totale} righe")
+
+        # gli inserimenti bulk non inviano segnali: la tabella RistoranteIngrediente va
+        # rigenerata e l'indice della dispensa e le classifiche di questo processo ricaricati
+        righe = aggregati.ricostruisci()
+        self.stdout.write(f"RistoranteIngrediente: {righe} righe")
+        grafo.invalida_indice()
+        statistiche.invalida()
+        self.stdout.write(self.style.SUCCESS("Catalogo sintetico generato"))
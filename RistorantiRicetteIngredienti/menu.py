@@ -0,0 +1,76 @@
+"""
+Menu completi dei ristoranti (api/ristoranti/menu/ e api/ristoranti/<id>/menu/):
+ristoranti -> ricette -> ingredienti annidati in una sola risposta.
+
+L'albero è letto con prefetch_related: una query per i ristoranti, una per
+i collegamenti ristorante-ricetta con le ricette (join) e, con profondità 2,
+una per i collegamenti ricetta-ingrediente con gli ingredienti. Il numero di
+query non dipende quindi dal numero di ristoranti, ricette o ingredienti,
+solo dalla profondità. Le ricette e gli ingredienti eliminati in modo logico
+non compaiono.
+"""
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Ristorante, RistoranteToRicetta, RicettaToIngrediente
+
+# profondità dell'albero: 1 = ricette, 2 = ricette e ingredienti
+PROFONDITA = (1, 2)
+
+
+def _prefetch(profondita):
+    """Prefetch delle ricette (e degli ingredienti) dei ristoranti, in ristorante.menu."""
+    menu = RistoranteToRicetta.objects.filter(ricetta__deleted_at__isnull=True).select_related('ricetta').only(
+        'ristorante', 'ricetta', 'ricetta__ricetta_text',
+    ).order_by('ricetta_id')
+    if profondita > 1:
+        # la ricetta è già in memoria (select_related): la lookup attraversa la
+        # chiave esterna senza query e legge solo i collegamenti agli ingredienti
+        menu = menu.prefetch_related(Prefetch(
+            'ricetta__ricettatoingrediente_set',
+            queryset=RicettaToIngrediente.objects.filter(ingrediente__deleted_at__isnull=True).select_related(
+                'ingrediente',
+            ).only('ricetta', 'ingrediente', 'ingrediente__ingrediente_text').order_by('ingrediente_id'),
+            to_attr='ingredienti',
+        ))
+    return Prefetch('ristorantetoricetta', queryset=menu, to_attr='menu')
+
+
+def _voce(ristorante, profondita):
+    ricette = []
+    for collegamento in ristorante.menu:
+        ricetta = collegamento.ricetta
+        voce = {'id': ricetta.id, 'ricetta_text': ricetta.ricetta_text}
+        if profondita > 1:
+            voce['ingredienti'] = [
+                {'id': r.ingrediente.id, 'ingrediente_text': r.ingrediente.ingrediente_text}
+                for r in ricetta.ingredienti
+            ]
+        ricette.append(voce)
+    return {'id': ristorante.id, 'ristorante_text': ristorante.ristorante_text, 'ricette': ricette}
+
+
+def menu_ristorante(ristorante_id, profondita=2):
+    """Menu di un ristorante, o None se il ristorante non esiste."""
+    ristorante = Ristorante.objects.only('ristorante_text').filter(id=ristorante_id).first()
+    if ristorante is None:
+        return None
+    prefetch_related_objects([ristorante], _prefetch(profondita))
+    return _voce(ristorante, profondita)
+
+
+def menu_ristoranti(limite, dopo=None, profondita=2):
+    """
+    Pagina di menu: i primi `limite` ristoranti con id maggiore di `dopo`.
+    Restituisce (menu, cursore della pagina successiva o None).
+    """
+    ristoranti = Ristorante.objects.only('ristorante_text').order_by('pk')
+    if dopo is not None:
+        ristoranti = ristoranti.filter(pk__gt=dopo)
+    # un ristorante in più per sapere se esiste una pagina successiva; il suo menu non viene letto
+    ristoranti = list(ristoranti[:limite + 1])
+    successivo = None
+    if len(ristoranti) > limite:
+        ristoranti = ristoranti[:limite]
+        successivo = str(ristoranti[-1].id)
+    prefetch_related_objects(ristoranti, _prefetch(profondita))
+    return [_voce(ristorante, profondita) for ristorante in ristoranti], successivo
@@ -0,0 +1,170 @@
+"""
+Misure per richiesta e istogrammi per route, esposti in formato testo Prometheus.
+
+PerformanceMiddleware (middleware.py) apre una Misura per ogni richiesta e la
+rende disponibile tramite una ContextVar: il wrapper delle query SQL, la
+serializzazione JSON (serialization.py) e l'handler dei log vi aggiungono i
+propri tempi. Alla fine della richiesta la misura viene registrata negli
+istogrammi della route, identificata dal `name` della url in urls.py.
+
+Gli istogrammi sono in memoria e per processo: con più worker ognuno espone i
+propri valori e l'aggregazione spetta a Prometheus (una destinazione per worker).
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from . import settings as app_settings
+
+PREFISSO = 'rri'
+
+# limiti superiori dei bucket: secondi per le durate, numero per le query
+BUCKET_DURATA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKET_QUERY = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+# nome, descrizione, campo della misura, bucket
+ISTOGRAMMI = (
+    ('request_duration_seconds', "Durata totale delle richieste", 'totale', BUCKET_DURATA),
+    ('db_duration_seconds', "Tempo passato nelle query SQL per richiesta", 'db', BUCKET_DURATA),
+    ('json_duration_seconds', "Tempo di serializzazione JSON per richiesta", 'json', BUCKET_DURATA),
+    ('db_queries', "Numero di query SQL per richiesta", 'query', BUCKET_QUERY),
+)
+
+_misura_corrente = ContextVar('misura_corrente', default=None)
+
+
+class Misura:
+    """Tempi (in secondi) e query di una singola richiesta."""
+
+    def __init__(self):
+        self.inizio = time.perf_counter()
+        self.totale = 0.0
+        self.db = 0.0
+        self.json = 0.0
+        self.log = 0.0
+        self.query = 0
+        # (sql, durata) delle prime SLOW_REQUEST_MAX_QUERIES query, per il log delle richieste lente
+        self.sql = []
+
+    def chiudi(self):
+        self.totale = time.perf_counter() - self.inizio
+
+
+def attiva(misura):
+    """Rende misura la misura corrente; restituisce il token per disattiva()."""
+    return _misura_corrente.set(misura)
+
+
+def disattiva(token):
+    _misura_corrente.reset(token)
+
+
+def misura_corrente():
+    return _misura_corrente.get()
+
+
+def aggiungi_tempo(campo, durata):
+    """Aggiunge durata al campo ('json', 'log', ...) della misura corrente, se presente."""
+    misura = _misura_corrente.get()
+    if misura is not None:
+        setattr(misura, campo, getattr(misura, campo) + durata)
+
+
+def registra_query(execute, sql, params, many, context):
+    """
+    Wrapper per connection.execute_wrappers: conta le query e ne misura la
+    durata per la richiesta corrente. Fuori da una richiesta non fa nulla.
+    """
+    misura = _misura_corrente.get()
+    if misura is None:
+        return execute(sql, params, many, context)
+    inizio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        durata = time.perf_counter() - inizio
+        misura.db += durata
+        misura.query += 1
+        if len(misura.sql) < app_settings.SLOW_REQUEST_MAX_QUERIES:
+            misura.sql.append((sql, durata))
+
+
+def installa_wrapper(connessione):
+    """Aggiunge registra_query ai wrapper della connessione, se non è già presente."""
+    if registra_query not in connessione.execute_wrappers:
+        connessione.execute_wrappers.append(registra_query)
+
+
+class Istogramma:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.conteggi = [0] * len(bucket)
+        self.somma = 0.0
+        self.totale = 0
+
+    def osserva(self, valore):
+        for indice, limite in enumerate(self.bucket):
+            if valore <= limite:
+                self.conteggi[indice] += 1
+                break
+        self.somma += valore
+        self.totale += 1
+
+
+_lock = threading.Lock()
+# (nome istogramma, route) -> Istogramma
+_istogrammi = {}
+# (route, metodo, status) -> numero di richieste
+_richieste = {}
+
+
+def registra(route, metodo, status, misura):
+    """Registra una richiesta conclusa negli istogrammi della sua route."""
+    with _lock:
+        for nome, _, campo, bucket in ISTOGRAMMI:
+            istogramma = _istogrammi.get((nome, route))
+            if istogramma is None:
+                istogramma = _istogrammi[(nome, route)] = Istogramma(bucket)
+            istogramma.osserva(getattr(misura, campo))
+        chiave = (route, metodo, status)
+        _richieste[chiave] = _richieste.get(chiave, 0) + 1
+
+
+def azzera():
+    """Svuota istogrammi e contatori (usata dai test)."""
+    with _lock:
+        _istogrammi.clear()
+        _richieste.clear()
+
+
+def _etichette(**valori):
+    coppie = []
+    for chiave, valore in valori.items():
+        valore = str(valore).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        coppie.append(f'{chiave}="{valore}"')
+    return '{' + ','.join(coppie) + '}'
+
+
+def testo_prometheus():
+    """Restituisce istogrammi e contatori nel formato di esposizione testuale di Prometheus."""
+    righe = []
+    with _lock:
+        nome = f'{PREFISSO}_requests_total'
+        righe += [f'# HELP {nome} Richieste servite per route, metodo e status', f'# TYPE {nome} counter']
+        for (route, metodo, status), conteggio in sorted(_richieste.items()):
+            righe.append(f'{nome}{_etichette(route=route, method=metodo, status=status)} {conteggio}')
+
+        for base, descrizione, _, bucket in ISTOGRAMMI:
+            nome = f'{PREFISSO}_{base}'
+            righe += [f'# HELP {nome} {descrizione}', f'# TYPE {nome} histogram']
+            for (istogramma_nome, route), istogramma in sorted(_istogrammi.items()):
+                if istogramma_nome != base:
+                    continue
+                cumulato = 0
+                for limite, conteggio in zip(bucket, istogramma.conteggi):
+                    cumulato += conteggio
+                    righe.append(f'{nome}_bucket{_etichette(route=route, le=limite)} {cumulato}')
+                righe.append(f'{nome}_bucket{_etichette(route=route, le="+Inf")} {istogramma.totale}')
+                righe.append(f'{nome}_sum{_etichette(route=route)} {istogramma.somma}')
+                righe.append(f'{nome}_count{_etichette(route=route)} {istogramma.totale}')
+    return '\n'.join(righe) + '\n'
@@ -0,0 +1,210 @@
+import logging
+import math
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import limiti, metrics, replica
+from . import settings as app_settings
+from .serialization import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(connection_created)
+def _connessione_creata(sender, connection, **kwargs):
+    # sotto ASGI le query delle viste async sono eseguite in un thread diverso,
+    # con una propria connessione: il wrapper viene installato su ognuna
+    metrics.installa_wrapper(connection)
+
+
+class PerformanceMiddleware:
+    """
+    Misura ogni richiesta: durata totale, numero e durata delle query SQL
+    (tramite connection.execute_wrappers), tempo di serializzazione JSON e di
+    log. I tempi sono inviati al client nell'header Server-Timing e aggregati
+    negli istogrammi per route esposti da /metrics.
+
+    Le richieste più lente di SLOW_REQUEST_MS vengono registrate nel log a
+    livello WARNING, con le query SQL eseguite.
+
+    Va inserito per primo in MIDDLEWARE, così la durata totale comprende
+    anche gli altri middleware. Il contenuto delle risposte in streaming viene
+    prodotto dopo la fine della misura e non è compreso nei tempi.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics.installa_wrapper(connection)
+        misura = metrics.Misura()
+        token = metrics.attiva(misura)
+        try:
+            risposta = self.get_response(request)
+        finally:
+            metrics.disattiva(token)
+        return self._concludi(request, risposta, misura)
+
+    async def __acall__(self, request):
+        misura = metrics.Misura()
+        token = metrics.attiva(misura)
+        try:
+            risposta = await self.get_response(request)
+        finally:
+            metrics.disattiva(token)
+        return self._concludi(request, risposta, misura)
+
+    def _concludi(self, request, risposta, misura):
+        misura.chiudi()
+        corrispondenza = request.resolver_match
+        route = corrispondenza.url_name if corrispondenza and corrispondenza.url_name else 'unmatched'
+        metrics.registra(route, request.method, risposta.status_code, misura)
+
+        applicazione = max(0.0, misura.totale - misura.db - misura.json - misura.log)
+        risposta['Server-Timing'] = ', '.join([
+            f'db;dur={misura.db * 1000:.2f};desc="{misura.query} queries"',
+            f'json;dur={misura.json * 1000:.2f}',
+            f'log;dur={misura.log * 1000:.2f}',
+            f'app;dur={applicazione * 1000:.2f}',
+            f'total;dur={misura.totale * 1000:.2f}',
+        ])
+
+        if misura.totale * 1000 >= app_settings.SLOW_REQUEST_MS:
+            logger.warning(
+                "Richiesta lenta: %s %s (%s) %.1f ms, %d query in %.1f ms, json %.1f ms\n%s",
+                request.method, request.get_full_path(), route, misura.totale * 1000,
+                misura.query, misura.db * 1000, misura.json * 1000,
+                '\n'.join(f"  {durata * 1000:8.2f} ms  {sql}" for sql, durata in misura.sql),
+            )
+        return risposta
+
+
+class LimitiMiddleware:
+    """
+    Controllo di ammissione delle richieste:
+
+    - oltre MAX_IN_FLIGHT richieste in corso nel processo le nuove ricevono
+      subito 503 con Retry-After, invece di accodarsi dietro quelle lente;
+    - ogni client ha i token bucket di RATE_LIMITS (vedi limiti.py), condivisi
+      tra i processi: a bucket vuoto la richiesta riceve 429 con Retry-After,
+      senza eseguire la vista.
+
+    Va dopo PerformanceMiddleware, così anche le risposte 429 e 503 compaiono
+    nelle metriche. Le richieste in streaming escono dal conteggio quando la
+    risposta viene restituita, prima che il contenuto sia prodotto.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _sovraccarico(self):
+        logger.warning("Troppe richieste in corso (%d): richiesta respinta", limiti.concorrenza.in_corso)
+        risposta = JsonResponse({'error': 'Server sovraccarico'}, status=503)
+        risposta['Retry-After'] = str(app_settings.OVERLOAD_RETRY_AFTER)
+        return risposta
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not limiti.concorrenza.entra():
+            return self._sovraccarico()
+        try:
+            return self.get_response(request)
+        finally:
+            limiti.concorrenza.esci()
+
+    async def __acall__(self, request):
+        if not limiti.concorrenza.entra():
+            return self._sovraccarico()
+        try:
+            return await self.get_response(request)
+        finally:
+            limiti.concorrenza.esci()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        cliente = limiti.client(request)
+        if cliente in app_settings.RATE_LIMIT_EXEMPT:
+            return None
+        attesa = limiti.consuma(request.resolver_match.url_name or limiti.TUTTE, cliente)
+        if not attesa:
+            return None
+        logger.warning("Limite di richieste superato da %s per %s", cliente, request.resolver_match.url_name)
+        risposta = JsonResponse({'error': 'Troppe richieste'}, status=429)
+        risposta['Retry-After'] = str(math.ceil(attesa))
+        return risposta
+
+
+class ReplicaMiddleware:
+    """
+    Prepara l'instradamento delle query di ogni richiesta per RouterReplica
+    (vedi replica.py): le richieste GET e HEAD alle viste di REPLICA_VIEWS
+    possono leggere da una replica; le risposte delle richieste che hanno
+    scritto sul primario impostano il cookie che tiene le letture successive
+    del client sul primario finché le repliche non sono aggiornate.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _stato(self, request):
+        try:
+            pin = float(request.COOKIES.get(replica.PIN_COOKIE, 0))
+        except ValueError:
+            pin = 0.0
+        return replica.StatoRichiesta(pin)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stato = request.stato_replica = self._stato(request)
+        token = replica.attiva(stato)
+        try:
+            risposta = self.get_response(request)
+        finally:
+            replica.disattiva(token)
+        return self._concludi(stato, risposta)
+
+    async def __acall__(self, request):
+        stato = request.stato_replica = self._stato(request)
+        token = replica.attiva(stato)
+        try:
+            risposta = await self.get_response(request)
+        finally:
+            replica.disattiva(token)
+        return self._concludi(stato, risposta)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.stato_replica.lettura_replica = (
+            bool(app_settings.READ_REPLICAS)
+            and request.method in ('GET', 'HEAD')
+            and request.resolver_match.url_name in app_settings.REPLICA_VIEWS
+        )
+
+    def _concludi(self, stato, risposta):
+        if stato.scrittura and app_settings.READ_REPLICAS:
+            risposta.set_cookie(
+                replica.PIN_COOKIE, f'{time.time():.3f}',
+                max_age=math.ceil(app_settings.REPLICA_MAX_STALENESS), httponly=True, samesite='Lax',
+            )
+        return risposta
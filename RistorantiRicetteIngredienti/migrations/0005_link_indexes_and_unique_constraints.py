@@ -0,0 +1,58 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:56
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def rimuovi_collegamenti_duplicati(apps, schema_editor):
+    """
+    Elimina i collegamenti duplicati, mantenendo quello con id minore,
+    prima di aggiungere i vincoli di unicità.
+    """
+    for nome, campi in (('RistoranteToRicetta', ('ristorante', 'ricetta')),
+                        ('RicettaToIngrediente', ('ricetta', 'ingrediente'))):
+        modello = apps.get_model('RistorantiRicetteIngredienti', nome)
+        da_tenere = modello.objects.values(*campi).annotate(id_minimo=Min('id')).values('id_minimo')
+        modello.objects.exclude(id__in=da_tenere).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RistorantiRicetteIngredienti', '0004_alter_ristorantetoricetta_ricetta_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(rimuovi_collegamenti_duplicati, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='ingrediente',
+            name='ingrediente_text',
+            field=models.CharField(db_index=True, default='test ingrediente', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='ricetta',
+            name='ricetta_text',
+            field=models.CharField(db_index=True, default='test ricetta', max_length=5000),
+        ),
+        migrations.AlterField(
+            model_name='ristorante',
+            name='ristorante_text',
+            field=models.CharField(db_index=True, default='test ristorante', max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='ricettatoingrediente',
+            index=models.Index(fields=['ingrediente', 'ricetta'], name='ingrediente_ricetta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ristorantetoricetta',
+            index=models.Index(fields=['ricetta', 'ristorante'], name='ricetta_ristorante_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ricettatoingrediente',
+            constraint=models.UniqueConstraint(fields=('ricetta', 'ingrediente'), name='unique_ricetta_ingrediente'),
+        ),
+        migrations.AddConstraint(
+            model_name='ristorantetoricetta',
+            constraint=models.UniqueConstraint(fields=('ristorante', 'ricetta'), name='unique_ristorante_ricetta'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:10
+
+from django.db import migrations
+
+# Indice full-text (SQLite FTS5) su ristoranti, ricette e ingredienti.
+# Il rowid codifica tipo e id dell'oggetto: id * 4 + tipo, con tipo
+# 1 = ristorante, 2 = ricetta, 3 = ingrediente. I trigger mantengono
+# l'indice allineato alle tabelle anche per bulk_create e SQL diretto.
+TABELLE = (
+    ('ristorante', 1),
+    ('ricetta', 2),
+    ('ingrediente', 3),
+)
+
+CREA = [
+    """
+    CREATE VIRTUAL TABLE "RistorantiRicetteIngredienti_ricerca" USING fts5(
+        testo,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+    """,
+]
+for nome, tipo in TABELLE:
+    tabella = f'"RistorantiRicetteIngredienti_{nome}"'
+    CREA += [
+        f"""
+        CREATE TRIGGER "RistorantiRicetteIngredienti_ricerca_{nome}_ai" AFTER INSERT ON {tabella} BEGIN
+            INSERT INTO "RistorantiRicetteIngredienti_ricerca"(rowid, testo) VALUES (new.id * 4 + {tipo}, new.{nome}_text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER "RistorantiRicetteIngredienti_ricerca_{nome}_au" AFTER UPDATE OF {nome}_text ON {tabella} BEGIN
+            UPDATE "RistorantiRicetteIngredienti_ricerca" SET testo = new.{nome}_text WHERE rowid = old.id * 4 + {tipo};
+        END
+        """,
+        f"""
+        CREATE TRIGGER "RistorantiRicetteIngredienti_ricerca_{nome}_ad" AFTER DELETE ON {tabella} BEGIN
+            DELETE FROM "RistorantiRicetteIngredienti_ricerca" WHERE rowid = old.id * 4 + {tipo};
+        END
+        """,
+        f"""
+        INSERT INTO "RistorantiRicetteIngredienti_ricerca"(rowid, testo)
+        SELECT id * 4 + {tipo}, {nome}_text FROM {tabella}
+        """,
+    ]
+
+ELIMINA = [
+    f'DROP TRIGGER IF EXISTS "RistorantiRicetteIngredienti_ricerca_{nome}_{evento}"'
+    for nome, _ in TABELLE for evento in ('ai', 'au', 'ad')
+] + ['DROP TABLE IF EXISTS "RistorantiRicetteIngredienti_ricerca"']
+
+
+def crea_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREA:
+        schema_editor.execute(sql)
+
+
+def elimina_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in ELIMINA:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RistorantiRicetteIngredienti', '0005_link_indexes_and_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(crea_indice, elimina_indice),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# popola la tabella materializzata con i collegamenti già presenti
+POPOLA = """
+    INSERT INTO "RistorantiRicetteIngredienti_ristoranteingrediente" (ristorante_id, ingrediente_id, recipe_count)
+    SELECT rr.ristorante_id, ri.ingrediente_id, COUNT(*)
+    FROM "RistorantiRicetteIngredienti_ristorantetoricetta" rr
+    JOIN "RistorantiRicetteIngredienti_ricettatoingrediente" ri ON ri.ricetta_id = rr.ricetta_id
+    GROUP BY rr.ristorante_id, ri.ingrediente_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RistorantiRicetteIngredienti', '0006_ricerca_fts5'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RistoranteIngrediente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_count', models.PositiveIntegerField()),
+                ('ingrediente', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ristoranteingrediente', to='RistorantiRicetteIngredienti.ingrediente')),
+                ('ristorante', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ristoranteingrediente', to='RistorantiRicetteIngredienti.ristorante')),
+            ],
+            options={
+                'verbose_name_plural': 'Ristoranti-ingredienti',
+                'indexes': [models.Index(fields=['ingrediente', 'ristorante'], name='ingrediente_ristorante_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ristorante', 'ingrediente'), name='unique_ristorante_ingrediente')],
+            },
+        ),
+        migrations.RunSQL(POPOLA, migrations.RunSQL.noop),
+    ]
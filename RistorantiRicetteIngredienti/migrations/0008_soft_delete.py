@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RistorantiRicetteIngredienti', '0007_ristoranteingrediente'),
+    ]
+
+    # campo nullable senza default: su SQLite è un ALTER TABLE ADD COLUMN, che
+    # non ricostruisce le tabelle e lascia al loro posto i trigger della ricerca full-text
+    operations = [
+        migrations.AddField(
+            model_name='ingrediente',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ricetta',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ristorante',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ingrediente',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='ingrediente_deleted_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ricetta',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='ricetta_deleted_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ristorante',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='ristorante_deleted_at_idx'),
+        ),
+    ]
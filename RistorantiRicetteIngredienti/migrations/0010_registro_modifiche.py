@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RistorantiRicetteIngredienti', '0009_lavoro'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrizzonteModifiche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Orizzonte delle modifiche',
+            },
+        ),
+        migrations.CreateModel(
+            name='Modifica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField()),
+                ('related_id', models.BigIntegerField(default=0)),
+                ('op', models.CharField(choices=[('insert', 'inserimento'), ('update', 'aggiornamento'), ('delete', 'eliminazione')], max_length=6)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Modifiche',
+                'indexes': [models.Index(fields=['model', 'object_id', 'related_id'], name='modifica_oggetto_idx'), models.Index(condition=models.Q(('op', 'delete')), fields=['created_at'], name='modifica_eliminazione_idx')],
+            },
+        ),
+    ]
@@ -1,22 +1,55 @@
 from django.db import models
+from django.utils import timezone
 
-class Ristorante(models.Model):
-    ristorante_text = models.CharField(max_length=200, default='test ristorante')
+def campi_pubblici(modello):
+    """Campi delle righe restituite dall'API: tutti tranne deleted_at."""
+    return [campo.attname for campo in modello._meta.concrete_fields if campo.attname != 'deleted_at']
+
+class CatalogoQuerySet(models.QuerySet):
+    def values(self, *fields, **expressions):
+        # senza argomenti: i campi pubblici e le annotazioni, come farebbe values()
+        if not fields and not expressions:
+            fields = (*campi_pubblici(self.model), *self.query.extra_select, *self.query.annotation_select)
+        return super().values(*fields, **expressions)
+
+class CatalogoManager(models.Manager.from_queryset(CatalogoQuerySet)):
+    """
+    Manager predefinito di ristoranti, ricette e ingredienti: esclude le righe
+    eliminate in modo logico (deleted_at valorizzato, vedi eliminazione.py).
+    Le righe eliminate restano raggiungibili con il manager tutti.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+class EntitaCatalogo(models.Model):
+    # istante dell'eliminazione logica; la riga viene eliminata in seguito da purge_deleted
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    objects = CatalogoManager()
+    tutti = models.Manager()
     class Meta:
+        abstract = True
+        indexes = [
+            # solo le righe in attesa di eliminazione definitiva
+            models.Index(fields=['deleted_at'], name='%(class)s_deleted_at_idx', condition=models.Q(deleted_at__isnull=False)),
+        ]
+
+class Ristorante(EntitaCatalogo):
+    ristorante_text = models.CharField(db_index=True, max_length=200, default='test ristorante')
+    class Meta(EntitaCatalogo.Meta):
         verbose_name_plural = 'Ristoranti'
     def __str__(self):
         return self.ristorante_text
 
-class Ricetta(models.Model):
-    ricetta_text = models.CharField(max_length=5000, default='test ricetta')
-    class Meta:
+class Ricetta(EntitaCatalogo):
+    ricetta_text = models.CharField(db_index=True, max_length=5000, default='test ricetta')
+    class Meta(EntitaCatalogo.Meta):
         verbose_name_plural = 'Ricette'
     def __str__(self):
         return self.ricetta_text
 
-class Ingrediente(models.Model):
-    ingrediente_text = models.CharField(max_length=200, default='test ingrediente')
-    class Meta:
+class Ingrediente(EntitaCatalogo):
+    ingrediente_text = models.CharField(db_index=True, max_length=200, default='test ingrediente')
+    class Meta(EntitaCatalogo.Meta):
         verbose_name_plural = 'Ingredienti'
     def __str__(self):
         return self.ingrediente_text
@@ -24,7 +57,117 @@ class Ingrediente(models.Model):
 class RistoranteToRicetta(models.Model):
     ristorante = models.ForeignKey(Ristorante, on_delete=models.CASCADE, related_name='ristorantetoricetta')
     ricetta = models.ForeignKey(Ricetta, on_delete=models.CASCADE, related_name='ristorantetoricetta')
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ristorante', 'ricetta'], name='unique_ristorante_ricetta'),
+        ]
+        indexes = [
+            models.Index(fields=['ricetta', 'ristorante'], name='ricetta_ristorante_idx'),
+        ]
 
 class RicettaToIngrediente(models.Model):
     ricetta = models.ForeignKey(Ricetta, on_delete=models.CASCADE)
-    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE)
\ No newline at end of file
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ricetta', 'ingrediente'], name='unique_ricetta_ingrediente'),
+        ]
+        indexes = [
+            models.Index(fields=['ingrediente', 'ricetta'], name='ingrediente_ricetta_idx'),
+        ]
+
+class RistoranteIngrediente(models.Model):
+    """
+    Tabella materializzata: per ogni ristorante gli ingredienti usati dalle sue
+    ricette, con il numero di ricette che li usano. È mantenuta da aggregati.py
+    a ogni modifica dei collegamenti e non va scritta direttamente.
+    """
+    # niente indici sulle singole chiavi esterne: le coprono il vincolo di unicità e l'indice inverso
+    ristorante = models.ForeignKey(Ristorante, on_delete=models.CASCADE, related_name='ristoranteingrediente', db_index=False)
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='ristoranteingrediente', db_index=False)
+    recipe_count = models.PositiveIntegerField()
+    class Meta:
+        verbose_name_plural = 'Ristoranti-ingredienti'
+        constraints = [
+            models.UniqueConstraint(fields=['ristorante', 'ingrediente'], name='unique_ristorante_ingrediente'),
+        ]
+        indexes = [
+            models.Index(fields=['ingrediente', 'ristorante'], name='ingrediente_ristorante_idx'),
+        ]
+
+class Lavoro(models.Model):
+    """
+    Lavoro in coda, eseguito fuori dalle richieste dai processi del comando
+    run_workers (vedi lavori.py). task è il nome di un compito registrato,
+    args i suoi argomenti.
+    """
+    IN_CODA = 'queued'
+    IN_CORSO = 'running'
+    COMPLETATO = 'done'
+    FALLITO = 'failed'
+    STATI = [
+        (IN_CODA, 'in coda'),
+        (IN_CORSO, 'in corso'),
+        (COMPLETATO, 'completato'),
+        (FALLITO, 'fallito'),
+    ]
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATI, default=IN_CODA)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # non prima di questo istante (ritardo iniziale o attesa prima di un nuovo tentativo)
+    run_after = models.DateTimeField(default=timezone.now)
+    # worker che sta eseguendo il lavoro e scadenza del suo lock
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        verbose_name_plural = 'Lavori'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='lavoro_coda_idx'),
+        ]
+    def __str__(self):
+        return f'{self.task} ({self.status})'
+
+class Modifica(models.Model):
+    """
+    Voce del registro delle modifiche letto da api/changes/ (vedi modifiche.py):
+    l'id è il numero di sequenza. Per ristoranti, ricette e ingredienti
+    object_id è l'id della riga e related_id è 0; per i collegamenti sono i
+    due id della coppia, nell'ordine dei campi del modello.
+    """
+    INSERIMENTO = 'insert'
+    AGGIORNAMENTO = 'update'
+    ELIMINAZIONE = 'delete'
+    OPERAZIONI = [
+        (INSERIMENTO, 'inserimento'),
+        (AGGIORNAMENTO, 'aggiornamento'),
+        (ELIMINAZIONE, 'eliminazione'),
+    ]
+    # nome del modello (model_name), es. 'ricetta' o 'ristorantetoricetta'
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    related_id = models.BigIntegerField(default=0)
+    op = models.CharField(max_length=6, choices=OPERAZIONI)
+    created_at = models.DateTimeField(default=timezone.now)
+    class Meta:
+        verbose_name_plural = 'Modifiche'
+        indexes = [
+            # voci successive dello stesso oggetto, per la compattazione
+            models.Index(fields=['model', 'object_id', 'related_id'], name='modifica_oggetto_idx'),
+            # eliminazioni da far scadere dopo CHANGES_RETENTION
+            models.Index(fields=['created_at'], name='modifica_eliminazione_idx', condition=models.Q(op='delete')),
+        ]
+
+class OrizzonteModifiche(models.Model):
+    """
+    Riga unica: la sequenza più alta tra le voci di eliminazione scadute e
+    rimosse dal registro. Un client fermo a una sequenza inferiore può aver
+    perso delle eliminazioni e deve riscaricare il catalogo.
+    """
+    seq = models.BigIntegerField(default=0)
+    class Meta:
+        verbose_name_plural = 'Orizzonte delle modifiche'
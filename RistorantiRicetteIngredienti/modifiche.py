@@ -0,0 +1,160 @@
+"""
+Registro delle modifiche del catalogo per la sincronizzazione incrementale
+dei client (api/changes/).
+
+Ogni creazione, modifica ed eliminazione di ristoranti, ricette, ingredienti e
+collegamenti aggiunge una voce alla tabella Modifica, nella stessa transazione
+della scrittura: i ricevitori dei segnali (signals.py) chiamano registra() e
+registra_collegamenti(), anche per le operazioni bulk e per eliminazione.py.
+Il numero di sequenza è l'id della voce: su SQLite le scritture sono
+serializzate (BEGIN IMMEDIATE), quindi le sequenze compaiono nell'ordine dei
+commit e un client che legge le voci successive alla propria non ne perde.
+seed_catalog inserisce i dati senza registrarli: dopo seed_catalog --clear i
+client devono riscaricare il catalogo.
+
+Un client legge la sequenza corrente (api/changes/ senza since), scarica il
+catalogo e da quel momento chiede solo le voci successive. Una pagina contiene
+per ogni oggetto solo la voce più recente, con la riga attuale dell'oggetto
+(update vale come "inserisci o aggiorna"); un oggetto che non esiste più, o è
+eliminato in modo logico, è restituito come eliminazione.
+
+compatta() (comando compact_changes) elimina le voci superate da una voce più
+recente dello stesso oggetto, che non servono a nessun client, e le
+eliminazioni più vecchie di CHANGES_RETENTION secondi: la sequenza più alta
+tra queste diventa l'orizzonte (OrizzonteModifiche), e un client fermo prima
+dell'orizzonte riceve 410 e deve riscaricare il catalogo.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .models import (
+    Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, Modifica, OrizzonteModifiche,
+)
+
+# voci esaminate per transazione dalla compattazione
+BLOCCO = 10000
+
+ENTITA = {modello._meta.model_name: modello for modello in (Ristorante, Ricetta, Ingrediente)}
+
+# per ogni collegamento: i nomi dei due campi, nell'ordine di object_id e related_id
+COLLEGAMENTI = {
+    modello._meta.model_name: [campo.attname for campo in modello._meta.concrete_fields[1:]]
+    for modello in (RistoranteToRicetta, RicettaToIngrediente)
+}
+
+
+class SequenzaScaduta(Exception):
+    """La sequenza del client è precedente all'orizzonte della compattazione."""
+
+    def __init__(self, sequenza, corrente):
+        super().__init__(sequenza, corrente)
+        self.sequenza = sequenza
+        # sequenza da cui riparte il client dopo aver riscaricato il catalogo
+        self.corrente = corrente
+
+
+def registra(modello, ids, op):
+    """Registra l'operazione op su ristoranti, ricette o ingredienti."""
+    nome = modello._meta.model_name
+    Modifica.objects.bulk_create([Modifica(model=nome, object_id=id_oggetto, op=op) for id_oggetto in ids])
+
+
+def registra_collegamenti(modello, coppie, op):
+    """Registra l'operazione op su collegamenti, indicati come coppie di id nell'ordine dei campi."""
+    nome = modello._meta.model_name
+    Modifica.objects.bulk_create([Modifica(model=nome, object_id=a, related_id=b, op=op) for a, b in coppie])
+
+
+def orizzonte():
+    return OrizzonteModifiche.objects.values_list('seq', flat=True).first() or 0
+
+
+def sequenza_corrente():
+    """Sequenza dell'ultima voce registrata: il punto di partenza di un client appena sincronizzato."""
+    # dopo la compattazione l'ultima voce rimasta può precedere l'orizzonte
+    return max(Modifica.objects.aggregate(seq=Max('id'))['seq'] or 0, orizzonte())
+
+
+def modifiche(dopo, limite):
+    """
+    Voci successive alla sequenza `dopo`, al più `limite`, ridotte alla più
+    recente per oggetto. Restituisce (voci, sequenza da cui continuare, altre
+    voci in attesa); solleva SequenzaScaduta se `dopo` precede l'orizzonte.
+    """
+    if dopo < orizzonte():
+        raise SequenzaScaduta(dopo, sequenza_corrente())
+    righe = list(
+        Modifica.objects.filter(id__gt=dopo).order_by('id')
+        .values_list('id', 'model', 'object_id', 'related_id', 'op')[:limite + 1]
+    )
+    altre = len(righe) > limite
+    righe = righe[:limite]
+    successivo = righe[-1][0] if righe else dopo
+
+    # voce più recente per oggetto, nell'ordine delle sequenze
+    ultime = {}
+    for riga in righe:
+        ultime.pop(riga[1:4], None)
+        ultime[riga[1:4]] = riga
+
+    # righe attuali delle entità inserite o aggiornate, una query per modello
+    attuali = {}
+    for nome, modello in ENTITA.items():
+        ids = [oggetto for (tipo, oggetto, _), riga in ultime.items() if tipo == nome and riga[4] != Modifica.ELIMINAZIONE]
+        if ids:
+            attuali[nome] = {riga['id']: riga for riga in modello.objects.filter(id__in=ids).values()}
+
+    voci = []
+    for seq, nome, oggetto, collegato, op in ultime.values():
+        if nome in COLLEGAMENTI:
+            voci.append({'seq': seq, 'model': nome, 'op': op, 'data': dict(zip(COLLEGAMENTI[nome], (oggetto, collegato)))})
+            continue
+        riga = attuali.get(nome, {}).get(oggetto)
+        if riga is None:
+            voci.append({'seq': seq, 'model': nome, 'op': Modifica.ELIMINAZIONE, 'id': oggetto})
+        else:
+            voci.append({'seq': seq, 'model': nome, 'op': op, 'id': oggetto, 'data': riga})
+    return voci, successivo, altre
+
+
+def pagina(dopo, limite):
+    """
+    Risposta di api/changes/: {'results': [voci], 'next': sequenza da passare
+    come since alla richiesta successiva, 'more': altre voci in attesa}. Senza
+    `dopo` restituisce solo la sequenza corrente.
+    """
+    if dopo is None:
+        return {'results': [], 'next': sequenza_corrente(), 'more': False}
+    voci, successivo, altre = modifiche(dopo, limite)
+    return {'results': voci, 'next': successivo, 'more': altre}
+
+
+def compatta(conservazione):
+    """
+    Compatta il registro: elimina le voci superate e le eliminazioni più vecchie
+    di `conservazione` secondi, aggiornando l'orizzonte. Ogni blocco di BLOCCO
+    voci è una transazione. Restituisce il numero di voci superate e scadute eliminate.
+    """
+    ultima = Modifica.objects.aggregate(seq=Max('id'))['seq'] or 0
+    successive = Modifica.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), related_id=OuterRef('related_id'), id__gt=OuterRef('id'),
+    )
+    superate = 0
+    for inizio in range(0, ultima, BLOCCO):
+        with transaction.atomic():
+            superate += Modifica.objects.filter(id__gt=inizio, id__lte=inizio + BLOCCO).filter(Exists(successive)).delete()[0]
+
+    scadute = Modifica.objects.filter(op=Modifica.ELIMINAZIONE, created_at__lt=timezone.now() - timedelta(seconds=conservazione))
+    with transaction.atomic():
+        limite = scadute.aggregate(seq=Max('id'))['seq']
+        eliminate = 0
+        if limite is not None:
+            eliminate = scadute.filter(id__lte=limite).delete()[0]
+            stato, _ = OrizzonteModifiche.objects.get_or_create(id=1)
+            if limite > stato.seq:
+                stato.seq = limite
+                stato.save(update_fields=['seq'])
+    return superate, eliminate
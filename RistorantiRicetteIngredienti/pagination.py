@@ -0,0 +1,199 @@
+import logging
+from itertools import chain
+
+from django.http import StreamingHttpResponse, HttpResponseBadRequest
+
+from . import settings as app_settings
+from .models import campi_pubblici
+from .serialization import JsonResponse, codifica
+from .log import log_risultato
+
+logger = logging.getLogger(__name__)
+
+
+def _parametro_intero(request, nome):
+    """
+    Legge un parametro GET intero non negativo.
+    Restituisce None se il parametro è assente e solleva ValueError se non è valido.
+    """
+    valore = request.GET.get(nome)
+    if valore is None or valore == '':
+        return None
+    valore = int(valore)
+    if valore < 0:
+        raise ValueError(nome)
+    return valore
+
+
+def campi_richiesti(request, modello):
+    """
+    Legge il parametro GET 'fields' (es. fields=ricetta_text): i campi di
+    modello da restituire, sempre preceduti da 'id'. Restituisce None se il
+    parametro è assente e solleva ValueError se indica un campo inesistente.
+    """
+    valore = request.GET.get('fields')
+    if valore is None or valore == '':
+        return None
+    disponibili = set(campi_pubblici(modello))
+    campi = [campo.strip() for campo in valore.split(',') if campo.strip()]
+    if not campi or any(campo not in disponibili for campo in campi):
+        raise ValueError("Invalid 'fields' parameter")
+    return list(dict.fromkeys(['id', *campi]))
+
+
+def _stream_righe(righe):
+    """
+    Generatore che scrive una lista JSON una porzione alla volta,
+    senza mai tenere in memoria l'intero risultato.
+    """
+    blocco = []
+    separatore = b'['
+    for riga in righe:
+        blocco.append(separatore + codifica(riga))
+        separatore = b','
+        if len(blocco) >= app_settings.STREAM_CHUNK_SIZE:
+            yield b''.join(blocco)
+            blocco = []
+    if separatore == b'[':
+        blocco.append(b'[')
+    blocco.append(b']')
+    yield b''.join(blocco)
+
+
+async def _stream_righe_async(primo, righe):
+    """Come _stream_righe, per un iteratore asincrono (aiterator) già avviato con primo."""
+    blocco = [b'[' + codifica(primo)]
+    async for riga in righe:
+        blocco.append(b',' + codifica(riga))
+        if len(blocco) >= app_settings.STREAM_CHUNK_SIZE:
+            yield b''.join(blocco)
+            blocco = []
+    blocco.append(b']')
+    yield b''.join(blocco)
+
+
+def _prepara(request, queryset):
+    """
+    Legge limit, after e fields e applica ordinamento, cursore e proiezione al queryset.
+    Restituisce (queryset, limit, after); solleva ValueError, con il messaggio
+    da restituire al client, se i parametri non sono validi.
+    In streaming limit vale solo se indicato: after da solo non limita le righe.
+    """
+    try:
+        limit = _parametro_intero(request, 'limit')
+        after = _parametro_intero(request, 'after')
+    except ValueError:
+        raise ValueError("Invalid 'limit' or 'after' parameter")
+    campi = campi_richiesti(request, queryset.model)
+    if campi is not None:
+        # solo le colonne richieste, più le annotazioni della vista (es. recipe_count):
+        # la SELECT non legge i testi lunghi non necessari
+        queryset = queryset.values(*campi, *queryset.query.annotation_select)
+    queryset = queryset.order_by('pk')
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    if limit is not None or (after is not None and request.GET.get('stream') != '1'):
+        if limit is None:
+            limit = app_settings.PAGE_SIZE_DEFAULT
+        limit = max(1, min(limit, app_settings.PAGE_SIZE_MAX))
+    return queryset, limit, after
+
+
+def _pagina(righe, limit):
+    """Risposta paginata da limit + 1 righe lette."""
+    successivo = None
+    if len(righe) > limit:
+        righe = righe[:limit]
+        successivo = str(righe[-1]['id'])
+    log_risultato(logger, "Righe restituite", righe)
+    return JsonResponse({'results': righe, 'next': successivo})
+
+
+def risposta_lista(request, queryset, se_vuoto=None):
+    """
+    Restituisce le righe di un queryset .values() come risposta JSON.
+
+    Parametri GET opzionali:
+        - limit: numero di righe per pagina; attiva la paginazione a cursore
+          e la risposta diventa {'results': [...], 'next': cursore}
+        - after: cursore ('next' della pagina precedente); restituisce solo le
+          righe con chiave primaria maggiore
+        - stream: se '1' le righe vengono scritte in streaming da un iterator
+          lato server, come lista JSON; limit e after restano validi (al più
+          limit righe, sempre entro PAGE_SIZE_MAX) ma non c'è il cursore 'next'
+        - fields: campi da restituire separati da virgola (es. fields=ricetta_text);
+          'id' è sempre incluso e le altre colonne non vengono lette dal database
+    Senza nessuno di questi parametri viene restituita la lista completa.
+
+    se_vuoto è una funzione opzionale chiamata solo quando il risultato è vuoto:
+    se restituisce una risposta (ad esempio un 404) questa sostituisce la lista.
+    """
+    try:
+        queryset, limit, after = _prepara(request, queryset)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    if request.GET.get('stream') == '1':
+        if limit is not None:
+            queryset = queryset[:limit]
+        righe = queryset.iterator(chunk_size=app_settings.STREAM_CHUNK_SIZE)
+        primo = next(righe, None)
+        if primo is None:
+            risposta = se_vuoto() if se_vuoto else None
+            if risposta is not None:
+                return risposta
+        else:
+            righe = chain((primo,), righe)
+        return StreamingHttpResponse(_stream_righe(righe), content_type='application/json')
+
+    if limit is None:
+        righe = list(queryset)
+        risposta = se_vuoto() if se_vuoto and not righe else None
+        if risposta is not None:
+            return risposta
+        log_risultato(logger, "Righe restituite", righe)
+        return JsonResponse(righe, safe=False)
+
+    # una riga in più per sapere se esiste una pagina successiva
+    righe = list(queryset[:limit + 1])
+    risposta = se_vuoto() if se_vuoto and not righe else None
+    if risposta is not None:
+        return risposta
+    return _pagina(righe, limit)
+
+
+async def risposta_lista_async(request, queryset, se_vuoto=None):
+    """
+    Versione asincrona di risposta_lista per le viste async (views_async.py):
+    le righe sono lette con l'ORM asincrono e lo streaming usa aiterator.
+    se_vuoto, se indicata, è una coroutine function.
+    """
+    try:
+        queryset, limit, after = _prepara(request, queryset)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    if request.GET.get('stream') == '1':
+        if limit is not None:
+            queryset = queryset[:limit]
+        righe = queryset.aiterator(chunk_size=app_settings.STREAM_CHUNK_SIZE)
+        primo = await anext(righe, None)
+        if primo is None:
+            risposta = await se_vuoto() if se_vuoto else None
+            if risposta is not None:
+                return risposta
+            return JsonResponse([], safe=False)
+        return StreamingHttpResponse(_stream_righe_async(primo, righe), content_type='application/json')
+
+    if limit is None:
+        righe = [riga async for riga in queryset]
+    else:
+        # una riga in più per sapere se esiste una pagina successiva
+        righe = [riga async for riga in queryset[:limit + 1]]
+    risposta = await se_vuoto() if se_vuoto and not righe else None
+    if risposta is not None:
+        return risposta
+    if limit is None:
+        log_risultato(logger, "Righe restituite", righe)
+        return JsonResponse(righe, safe=False)
+    return _pagina(righe, limit)
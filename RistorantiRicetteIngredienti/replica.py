@@ -0,0 +1,180 @@
+"""
+Repliche di sola lettura del database SQLite.
+
+Le repliche sono alias di DATABASES elencati in READ_REPLICAS: file SQLite
+copiati dal primario con l'API di online backup dal comando replicate_db, che
+dopo ogni copia aggiorna un file di marcatura (<replica>.sync) con l'istante
+in cui la copia è iniziata. I dati della replica sono quindi aggiornati almeno
+a quell'istante, anche per gli altri processi.
+
+RouterReplica manda sulle repliche solo le letture delle viste di
+REPLICA_VIEWS, durante le richieste GET marcate da ReplicaMiddleware; tutte le
+scritture, e ogni lettura fuori da quelle viste, vanno sul primario. Una
+replica viene usata solo se è stata sincronizzata da meno di
+REPLICA_MAX_STALENESS secondi e dopo l'ultima scrittura del client
+(read-your-writes): una richiesta che scrive imposta il cookie PIN_COOKIE con
+l'istante della scrittura, e finché una replica non è più recente di quel
+valore le letture di quel client restano sul primario.
+"""
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from . import settings as app_settings
+
+PIN_COOKIE = 'rri_primary'
+
+_stato_corrente = ContextVar('stato_replica', default=None)
+
+
+class StatoRichiesta:
+    """Instradamento delle query di una richiesta."""
+
+    def __init__(self, pin=0.0):
+        # istante dell'ultima scrittura del client (dal cookie), 0 se assente
+        self.pin = pin
+        # True se la vista della richiesta può leggere da una replica
+        self.lettura_replica = False
+        # alias della replica scelta per la richiesta, se usata
+        self.replica = None
+        # True se la richiesta ha scritto sul primario
+        self.scrittura = False
+
+
+def attiva(stato):
+    return _stato_corrente.set(stato)
+
+
+def disattiva(token):
+    _stato_corrente.reset(token)
+
+
+def replica_corrente():
+    """Alias della replica da cui sta leggendo la richiesta corrente, o None."""
+    stato = _stato_corrente.get()
+    return stato.replica if stato is not None else None
+
+
+def _percorso(alias):
+    return Path(settings.DATABASES[alias]['NAME'])
+
+
+def _marcatura(alias):
+    percorso = _percorso(alias)
+    return percorso.with_name(percorso.name + '.sync')
+
+
+def sincronizzata(alias):
+    """Istante (time.time()) a cui i dati della replica sono aggiornati, 0 se mai copiata."""
+    try:
+        return os.stat(_marcatura(alias)).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _segna(alias, istante):
+    marcatura = _marcatura(alias)
+    marcatura.touch()
+    os.utime(marcatura, (istante, istante))
+
+
+def sincronizza(alias, primario=None):
+    """
+    Copia il database primario sulla replica indicata con l'API di backup di
+    SQLite. La copia avviene in un'unica transazione sulla replica: con WAL i
+    lettori della replica continuano a vedere la copia precedente fino alla fine.
+    """
+    inizio = time.time()
+    sorgente = primario or sqlite3.connect(_percorso(DEFAULT_DB_ALIAS))
+    try:
+        # il with di sqlite3.Connection chiude solo la transazione, non la connessione
+        with closing(sqlite3.connect(_percorso(alias), timeout=30)) as destinazione:
+            sorgente.backup(destinazione)
+    finally:
+        if primario is None:
+            sorgente.close()
+    _segna(alias, inizio)
+
+
+class Replicatore:
+    """
+    Tiene aperta una connessione al primario e ricopia le repliche solo se il
+    primario è cambiato dall'ultima copia (PRAGMA data_version); altrimenti ne
+    aggiorna soltanto la marcatura.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = list(aliases)
+        self.primario = sqlite3.connect(_percorso(DEFAULT_DB_ALIAS))
+        self.versione = None
+
+    def esegui(self):
+        """Esegue un ciclo di replica; restituisce gli alias effettivamente ricopiati."""
+        inizio = time.time()
+        versione = self.primario.execute('PRAGMA data_version').fetchone()[0]
+        copiate = []
+        for alias in self.aliases:
+            if versione == self.versione and _percorso(alias).exists():
+                _segna(alias, inizio)
+            else:
+                sincronizza(alias, self.primario)
+                copiate.append(alias)
+        self.versione = versione
+        return copiate
+
+    def chiudi(self):
+        self.primario.close()
+
+
+def alias_lettura():
+    """Alias da usare per una lettura nella richiesta corrente (None = primario)."""
+    stato = _stato_corrente.get()
+    if stato is None or not stato.lettura_replica or stato.scrittura:
+        return None
+    if stato.replica is None:
+        minimo = max(time.time() - app_settings.REPLICA_MAX_STALENESS, stato.pin)
+        candidati = [alias for alias in app_settings.READ_REPLICAS if sincronizzata(alias) >= minimo]
+        if not candidati:
+            return None
+        # la stessa replica per tutte le query della richiesta
+        stato.replica = random.choice(candidati)
+    return stato.replica
+
+
+def segna_scrittura():
+    stato = _stato_corrente.get()
+    if stato is not None:
+        stato.scrittura = True
+        stato.replica = None
+
+
+class RouterReplica:
+    """Router per DATABASE_ROUTERS: letture delle viste di REPLICA_VIEWS sulle repliche, il resto sul primario."""
+
+    def db_for_read(self, model, **hints):
+        return alias_lettura()
+
+    def db_for_write(self, model, **hints):
+        segna_scrittura()
+        # esplicito: altrimenti Django userebbe il database da cui è stata letta l'istanza
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # le repliche contengono gli stessi dati del primario
+        database = {DEFAULT_DB_ALIAS, *app_settings.READ_REPLICAS}
+        if obj1._state.db in database and obj2._state.db in database:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # le repliche ricevono lo schema dal primario con la copia
+        if db in app_settings.READ_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,129 @@
+"""
+Ricerca full-text su ristoranti, ricette e ingredienti tramite SQLite FTS5.
+
+L'indice è la tabella virtuale RistorantiRicetteIngredienti_ricerca, creata
+dalla migrazione 0006 e mantenuta dai trigger sulle tre tabelle. Il rowid
+codifica tipo e id dell'oggetto (id * 4 + tipo), così le modifiche e le
+eliminazioni aggiornano l'indice per chiave primaria.
+"""
+import re
+
+from django.db import connection, transaction
+
+TABELLA = 'RistorantiRicetteIngredienti_ricerca'
+
+# tipo -> codice nel rowid
+TIPI = {
+    'ristorante': 1,
+    'ricetta': 2,
+    'ingrediente': 3,
+}
+NOMI_TIPI = {codice: tipo for tipo, codice in TIPI.items()}
+
+_PAROLA = re.compile(r'\w+', re.UNICODE)
+
+
+def _sql_trigger(nome, tipo):
+    tabella = f'"RistorantiRicetteIngredienti_{nome}"'
+    return [
+        f"""
+        CREATE TRIGGER "{TABELLA}_{nome}_ai" AFTER INSERT ON {tabella} BEGIN
+            INSERT INTO "{TABELLA}"(rowid, testo) VALUES (new.id * 4 + {tipo}, new.{nome}_text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER "{TABELLA}_{nome}_au" AFTER UPDATE OF {nome}_text ON {tabella} BEGIN
+            UPDATE "{TABELLA}" SET testo = new.{nome}_text WHERE rowid = old.id * 4 + {tipo};
+        END
+        """,
+        f"""
+        CREATE TRIGGER "{TABELLA}_{nome}_ad" AFTER DELETE ON {tabella} BEGIN
+            DELETE FROM "{TABELLA}" WHERE rowid = old.id * 4 + {tipo};
+        END
+        """,
+    ]
+
+
+def ricostruisci_indice():
+    """
+    Ricrea tabella FTS5 e trigger (se mancanti, ad esempio dopo una migrazione
+    che ha ricostruito una delle tabelle) e reindicizza tutti gli oggetti non
+    eliminati in modo logico.
+    Restituisce il numero di righe indicizzate.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS "{TABELLA}" USING fts5(
+                testo,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3 4'
+            )
+        """)
+        cursor.execute(f'DELETE FROM "{TABELLA}"')
+        totale = 0
+        for nome, tipo in TIPI.items():
+            for evento in ('ai', 'au', 'ad'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{TABELLA}_{nome}_{evento}"')
+            for sql in _sql_trigger(nome, tipo):
+                cursor.execute(sql)
+            cursor.execute(f"""
+                INSERT INTO "{TABELLA}"(rowid, testo)
+                SELECT id * 4 + {tipo}, {nome}_text FROM "RistorantiRicetteIngredienti_{nome}"
+                WHERE deleted_at IS NULL
+            """)
+            totale += cursor.rowcount
+        cursor.execute(f"INSERT INTO \"{TABELLA}\"(\"{TABELLA}\") VALUES ('optimize')")
+    return totale
+
+
+def rimuovi(tipo, ids):
+    """Toglie dall'indice gli oggetti indicati, ad esempio quelli eliminati in modo logico."""
+    rowids = [id_oggetto * 4 + TIPI[tipo] for id_oggetto in ids]
+    with connection.cursor() as cursor:
+        for inizio in range(0, len(rowids), 500):
+            blocco = rowids[inizio:inizio + 500]
+            cursor.execute(f'DELETE FROM "{TABELLA}" WHERE rowid IN ({", ".join(["%s"] * len(blocco))})', blocco)
+
+
+def espressione_fts(testo, prefisso=True):
+    """
+    Converte il testo dell'utente in un'espressione FTS5 sicura: ogni parola
+    diventa una frase tra virgolette (tutte richieste) e, se prefisso è vero,
+    l'ultima parola viene cercata come prefisso, per l'autocompletamento.
+    Restituisce None se il testo non contiene parole.
+    """
+    parole = _PAROLA.findall(testo)
+    if not parole:
+        return None
+    termini = [f'"{parola}"' for parola in parole]
+    if prefisso:
+        termini[-1] += '*'
+    return ' '.join(termini)
+
+
+def cerca(testo, tipi=None, limite=20, prefisso=True):
+    """
+    Cerca nell'indice full-text e restituisce i risultati ordinati per rilevanza
+    (bm25), come lista di {'tipo', 'id', 'snippet'}.
+    tipi è un elenco facoltativo di tipi ('ristorante', 'ricetta', 'ingrediente').
+    """
+    espressione = espressione_fts(testo, prefisso)
+    if espressione is None:
+        return []
+    sql = f"""
+        SELECT rowid, snippet("{TABELLA}", 0, '', '', '...', 16)
+        FROM "{TABELLA}"
+        WHERE "{TABELLA}" MATCH %s
+    """
+    parametri = [espressione]
+    if tipi:
+        sql += f" AND rowid %% 4 IN ({', '.join(['%s'] * len(tipi))})"
+        parametri += [TIPI[tipo] for tipo in tipi]
+    sql += " ORDER BY rank LIMIT %s"
+    parametri.append(limite)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametri)
+        return [
+            {'tipo': NOMI_TIPI[rowid % 4], 'id': rowid // 4, 'snippet': snippet}
+            for rowid, snippet in cursor.fetchall()
+        ]
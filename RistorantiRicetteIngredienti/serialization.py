@@ -0,0 +1,56 @@
+"""
+Serializzazione JSON delle risposte.
+
+JsonResponse sostituisce quella di Django nelle viste dell'applicazione: codifica
+con il codificatore scelto da JSON_ENCODER (orjson se installato, altrimenti il
+modulo json con DjangoJSONEncoder) e misura il tempo di codifica, aggiunto alla
+misura della richiesta corrente (vedi metrics.py e l'header Server-Timing).
+
+Il JSON è lo stesso con entrambi: compatto (senza spazi dopo ',' e ':'), con
+i caratteri non ASCII non codificati come \\uXXXX, e date, orari e Decimal
+passano comunque da DjangoJSONEncoder.
+"""
+import json
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse as DjangoJsonResponse
+
+from . import metrics
+from . import settings as app_settings
+
+try:
+    import orjson
+except ImportError:  # dipendenza opzionale
+    orjson = None
+
+USA_ORJSON = orjson is not None and app_settings.JSON_ENCODER == 'orjson'
+
+_encoder = DjangoJSONEncoder()
+
+if orjson is not None:
+    _OPZIONI_ORJSON = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def codifica(dati):
+    """Codifica dati in JSON (bytes UTF-8) con il codificatore configurato."""
+    if USA_ORJSON:
+        # i tipi non gestiti da orjson (Decimal, datetime, lazy string, ...) come in DjangoJSONEncoder
+        return orjson.dumps(dati, default=_encoder.default, option=_OPZIONI_ORJSON)
+    return json.dumps(dati, cls=DjangoJSONEncoder, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+class JsonResponse(DjangoJsonResponse):
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        inizio = time.perf_counter()
+        if encoder is not DjangoJSONEncoder or json_dumps_params:
+            super().__init__(data, encoder, safe, json_dumps_params, **kwargs)
+        else:
+            if safe and not isinstance(data, dict):
+                raise TypeError(
+                    'In order to allow non-dict objects to be serialized set the safe parameter to False.'
+                )
+            kwargs.setdefault('content_type', 'application/json')
+            HttpResponse.__init__(self, content=codifica(data), **kwargs)
+        metrics.aggiungi_tempo('json', time.perf_counter() - inizio)
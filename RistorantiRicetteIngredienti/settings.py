@@ -0,0 +1,191 @@
+"""
+Impostazioni predefinite dell'applicazione RistorantiRicetteIngredienti.
+
+Ogni valore può essere sovrascritto nel settings del progetto
+(PyDjango/settings.py) definendo una variabile con lo stesso nome.
+"""
+from django.conf import settings
+
+# Numero di righe per pagina quando la paginazione a cursore è attiva
+# ma il parametro 'limit' non è stato specificato
+PAGE_SIZE_DEFAULT = getattr(settings, 'PAGE_SIZE_DEFAULT', 100)
+
+# Numero massimo di righe per pagina accettato dal parametro 'limit'
+PAGE_SIZE_MAX = getattr(settings, 'PAGE_SIZE_MAX', 1000)
+
+# Numero di righe lette per volta dall'iterator lato server in modalità streaming
+STREAM_CHUNK_SIZE = getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+
+# Frazione delle richieste (tra 0 e 1) per cui le righe restituite vengono
+# registrate nei log a livello DEBUG
+LOG_RESULT_SAMPLE_RATE = getattr(settings, 'LOG_RESULT_SAMPLE_RATE', 0.01)
+
+# Numero massimo di righe riportate nei log per ogni risultato campionato
+LOG_RESULT_MAX_ITEMS = getattr(settings, 'LOG_RESULT_MAX_ITEMS', 5)
+
+# Numero massimo di id accettati in una singola richiesta batch delle viste *_per_*
+BATCH_SIZE_MAX = getattr(settings, 'BATCH_SIZE_MAX', 500)
+
+# Numero massimo di operazioni accettate in una singola richiesta bulk
+BULK_SIZE_MAX = getattr(settings, 'BULK_SIZE_MAX', 5000)
+
+# Alias della cache (vedi CACHES) usata per le risposte delle viste *_per_*
+CACHE_ALIAS = getattr(settings, 'CACHE_ALIAS', 'default')
+
+# Alias della cache con le versioni delle risposte: deve essere condivisa da tutti
+# i processi, compresi quelli di run_workers, che la invalidano dopo i lavori
+CACHE_VERSION_ALIAS = getattr(settings, 'CACHE_VERSION_ALIAS', CACHE_ALIAS)
+
+# Durata in secondi delle risposte in cache; l'invalidazione avviene comunque
+# a ogni modifica dei dati tramite i segnali dei modelli
+CACHE_TIMEOUT = getattr(settings, 'CACHE_TIMEOUT', 3600)
+
+# Numero di risultati restituiti dalla ricerca full-text se 'limit' non è indicato
+SEARCH_LIMIT_DEFAULT = getattr(settings, 'SEARCH_LIMIT_DEFAULT', 20)
+
+# Numero massimo di risultati accettato dal parametro 'limit' della ricerca
+SEARCH_LIMIT_MAX = getattr(settings, 'SEARCH_LIMIT_MAX', 100)
+
+# Secondi dopo i quali l'indice in memoria della dispensa viene ricaricato per
+# intero (per recepire le modifiche fatte da altri processi)
+GRAFO_MAX_AGE = getattr(settings, 'GRAFO_MAX_AGE', 600)
+
+# Numero di elementi per lista restituiti da api/pantry/ se 'limit' non è indicato
+PANTRY_LIMIT_DEFAULT = getattr(settings, 'PANTRY_LIMIT_DEFAULT', 100)
+
+# Valore massimo accettato per il parametro 'max_mancanti' di api/pantry/
+PANTRY_MAX_MISSING = getattr(settings, 'PANTRY_MAX_MISSING', 5)
+
+# Numero di ricette restituite da api/ricette/match/ se 'limit' non è indicato
+MATCH_LIMIT_DEFAULT = getattr(settings, 'MATCH_LIMIT_DEFAULT', 20)
+
+# Se True le viste di lettura usano le varianti asincrone di views_async.py
+# (da attivare quando l'applicazione è servita da un server ASGI)
+ASYNC_VIEWS = getattr(settings, 'ASYNC_VIEWS', False)
+
+# Codificatore JSON delle risposte: 'orjson' (usato se installato, altrimenti
+# si ricade su 'json') oppure 'json' (modulo della libreria standard)
+JSON_ENCODER = getattr(settings, 'JSON_ENCODER', 'orjson')
+
+# Durata in millisecondi oltre la quale una richiesta viene registrata nel log
+# delle richieste lente, con le query SQL eseguite
+SLOW_REQUEST_MS = getattr(settings, 'SLOW_REQUEST_MS', 500)
+
+# Numero massimo di query SQL conservate per richiesta per il log delle richieste lente
+SLOW_REQUEST_MAX_QUERIES = getattr(settings, 'SLOW_REQUEST_MAX_QUERIES', 50)
+
+# PRAGMA applicati a ogni nuova connessione SQLite (vedi database.py):
+# - journal_mode WAL: i lettori non sono bloccati da chi scrive
+# - synchronous NORMAL: sicuro con WAL, senza fsync a ogni commit
+# - mmap_size, cache_size (negativo = KiB): letture da memoria invece che con read()
+# - busy_timeout (ms): attesa sui lock invece dell'errore "database is locked"
+# - temp_store MEMORY: tabelle temporanee e ordinamenti in memoria
+SQLITE_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+})
+
+# Alias di DATABASES usati come repliche di sola lettura (vedi replica.py e il
+# comando replicate_db); vuoto = tutte le query sul primario
+READ_REPLICAS = getattr(settings, 'READ_REPLICAS', ())
+
+# Viste (name delle url) le cui letture possono essere servite da una replica
+REPLICA_VIEWS = getattr(settings, 'REPLICA_VIEWS', (
+    'lista_ristoranti',
+    'ristoranti_per_ricetta',
+    'ricette_per_ristorante',
+    'ricette_per_ingrediente',
+    'ingredienti_per_ricetta',
+    'ingredienti_per_ristorante',
+))
+
+# Ritardo massimo in secondi di una replica rispetto al primario: una replica
+# sincronizzata da più tempo non viene usata. È anche la durata in cache delle
+# risposte lette da una replica e del cookie di read-your-writes
+REPLICA_MAX_STALENESS = getattr(settings, 'REPLICA_MAX_STALENESS', 5)
+
+# Intervallo in secondi tra due copie del comando replicate_db
+REPLICA_SYNC_INTERVAL = getattr(settings, 'REPLICA_SYNC_INTERVAL', 1)
+
+# Righe dei collegamenti mostrate per pagina negli inline dell'admin
+ADMIN_INLINE_PER_PAGE = getattr(settings, 'ADMIN_INLINE_PER_PAGE', 50)
+
+# Numero massimo di risultati della ricerca full-text usata dall'admin
+# (casella di ricerca degli elenchi e widget di autocompletamento)
+ADMIN_SEARCH_LIMIT = getattr(settings, 'ADMIN_SEARCH_LIMIT', 1000)
+
+# Oltre questo numero stimato di righe gli elenchi non filtrati dell'admin
+# mostrano il conteggio stimato invece di eseguire COUNT(*)
+ADMIN_COUNT_ESTIMATE_THRESHOLD = getattr(settings, 'ADMIN_COUNT_ESTIMATE_THRESHOLD', 10000)
+
+# Collegamenti eliminati per transazione dal comando purge_deleted: ogni blocco
+# tiene il lock di scrittura solo per il tempo di una DELETE di queste dimensioni
+PURGE_BATCH_SIZE = getattr(settings, 'PURGE_BATCH_SIZE', 1000)
+
+# Secondi di attesa del comando purge_deleted quando non ci sono righe da eliminare
+PURGE_INTERVAL = getattr(settings, 'PURGE_INTERVAL', 5)
+
+# Ristoranti per pagina di default e massimi di api/ristoranti/menu/, che include
+# per ognuno ricette e ingredienti
+MENU_PAGE_SIZE_DEFAULT = getattr(settings, 'MENU_PAGE_SIZE_DEFAULT', 10)
+MENU_PAGE_SIZE_MAX = getattr(settings, 'MENU_PAGE_SIZE_MAX', 100)
+
+# Secondi dopo i quali le classifiche di api/stats/ vengono ricalcolate (vedi statistiche.py)
+STATS_MAX_AGE = getattr(settings, 'STATS_MAX_AGE', 300)
+
+# Numero di elementi restituiti di default dalle classifiche di api/stats/
+STATS_LIMIT_DEFAULT = getattr(settings, 'STATS_LIMIT_DEFAULT', 50)
+
+# Secondi per cui il registro di api/changes/ conserva le eliminazioni: un client
+# fermo da più tempo deve riscaricare il catalogo (vedi modifiche.py)
+CHANGES_RETENTION = getattr(settings, 'CHANGES_RETENTION', 7 * 24 * 3600)
+
+# Limiti di richieste per client (token bucket, vedi limiti.py): per nome di url
+# la capacità del bucket e i gettoni ricaricati al secondo. '*' vale per tutte le
+# richieste del client, in aggiunta al limite della route; le route più costose
+# hanno limiti più stretti
+RATE_LIMITS = getattr(settings, 'RATE_LIMITS', {
+    '*': (120, 20),
+    'ingredienti_per_ristorante': (30, 5),
+    'menu_ristoranti': (10, 2),
+    'menu_ristorante': (30, 5),
+    'dispensa': (20, 4),
+    'match_ricette': (20, 4),
+})
+
+# Database SQLite dei bucket, condiviso dai processi worker
+RATE_LIMIT_DB = getattr(settings, 'RATE_LIMIT_DB', str(settings.BASE_DIR / 'rate_limit.sqlite3'))
+
+# Header META a cui ogni proxy aggiunge l'indirizzo da cui ha ricevuto la richiesta
+RATE_LIMIT_CLIENT_HEADER = getattr(settings, 'RATE_LIMIT_CLIENT_HEADER', 'HTTP_X_FORWARDED_FOR')
+
+# Numero di proxy fidati davanti all'applicazione: il client è l'indirizzo
+# aggiunto all'header dal primo di essi; 0 = REMOTE_ADDR, l'header viene ignorato
+RATE_LIMIT_TRUSTED_PROXIES = getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 0)
+
+# Client senza limiti di richieste (indirizzi come restituiti da limiti.client)
+RATE_LIMIT_EXEMPT = getattr(settings, 'RATE_LIMIT_EXEMPT', ())
+
+# Richieste in corso oltre le quali un processo risponde 503 (0 = nessun limite)
+MAX_IN_FLIGHT = getattr(settings, 'MAX_IN_FLIGHT', 64)
+
+# Valore di Retry-After (secondi) delle risposte 503 per sovraccarico
+OVERLOAD_RETRY_AFTER = getattr(settings, 'OVERLOAD_RETRY_AFTER', 1)
+
+# Tentativi di un lavoro in coda prima di considerarlo fallito (vedi lavori.py)
+JOB_MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+
+# Attesa in secondi prima del secondo tentativo di un lavoro fallito; raddoppia a ogni tentativo
+JOB_RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 10)
+
+# Durata in secondi del lock di un worker su un lavoro, rinnovato ogni terzo di
+# questo tempo durante l'esecuzione: scaduto il lock (worker terminato o bloccato)
+# il lavoro torna in coda per un altro tentativo
+JOB_LOCK_TIMEOUT = getattr(settings, 'JOB_LOCK_TIMEOUT', 300)
+
+# Secondi di attesa di un worker quando la coda è vuota
+JOB_POLL_INTERVAL = getattr(settings, 'JOB_POLL_INTERVAL', 1)
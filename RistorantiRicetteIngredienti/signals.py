@@ -0,0 +1,157 @@
+"""
+Ricevitori dei segnali dei modelli, collegati in apps.py.
+
+Le operazioni in blocco (bulk.py) usano bulk_create e bulk_update, che non
+inviano post_save: al loro posto inviano entita_create, entita_aggiornate e
+collegamenti_creati, gestiti qui insieme ai segnali dei modelli. Allo stesso modo le eliminazioni di
+eliminazione.py, che non passano dal collector dell'ORM, inviano
+entita_eliminate e collegamenti_eliminati.
+
+Ogni ricevitore registra anche la modifica nel registro di modifiche.py,
+nella transazione della scrittura.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver, Signal
+
+from . import aggregati, grafo, modifiche
+from .caching import invalida_entita, invalida_collegamenti
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, Modifica
+
+# inviato dopo un bulk_create di ristoranti, ricette o ingredienti; argomenti: sender (modello), ids
+entita_create = Signal()
+
+# inviato dopo un bulk_update; argomenti: sender (modello), ids
+entita_aggiornate = Signal()
+
+# inviato dopo un bulk_create di collegamenti; argomenti: sender (tabella di
+# collegamento), coppie di id nell'ordine dei campi del modello
+collegamenti_creati = Signal()
+
+# inviato prima di eliminare (o dopo aver marcato come eliminati) ristoranti,
+# ricette o ingredienti, quando i loro collegamenti esistono ancora;
+# argomenti: sender (modello), ids
+entita_eliminate = Signal()
+
+# inviato dopo l'eliminazione di collegamenti in SQL; argomenti come
+# collegamenti_creati, più ricalcola (falso se le righe di RistoranteIngrediente
+# interessate sono eliminate dal chiamante)
+collegamenti_eliminati = Signal()
+
+
+def _collegamenti_modificati(sender, coppie, ricalcola=True):
+    """
+    Aggiorna cache, tabella RistoranteIngrediente e indice della dispensa per
+    collegamenti creati, spostati o eliminati.
+    """
+    coppie = set(coppie)
+    if not coppie:
+        return
+    invalida_collegamenti(sender, coppie)
+    if ricalcola:
+        # la tabella materializzata è aggiornata subito, nella stessa transazione della modifica
+        aggregati.aggiorna_collegamenti(sender, coppie)
+    if sender is RistoranteToRicetta:
+        ristoranti = {ristorante for ristorante, _ in coppie}
+        transaction.on_commit(lambda: grafo.segna_ristoranti_modificati(ristoranti))
+    else:
+        ricette = {ricetta for ricetta, _ in coppie}
+        transaction.on_commit(lambda: grafo.segna_ricette_modificate(ricette))
+
+
+def _coppia(instance):
+    if isinstance(instance, RistoranteToRicetta):
+        return (instance.ristorante_id, instance.ricetta_id)
+    return (instance.ricetta_id, instance.ingrediente_id)
+
+
+@receiver(post_save, sender=Ristorante)
+@receiver(post_save, sender=Ricetta)
+@receiver(post_save, sender=Ingrediente)
+def entita_salvata(sender, instance, created, **kwargs):
+    if created:
+        # un elemento appena creato non ha ancora collegamenti né risposte in cache
+        modifiche.registra(sender, [instance.id], Modifica.INSERIMENTO)
+        return
+    invalida_entita(sender, [instance.id])
+    modifiche.registra(sender, [instance.id], Modifica.AGGIORNAMENTO)
+
+
+@receiver(entita_create)
+def entita_create_in_blocco(sender, ids, **kwargs):
+    modifiche.registra(sender, ids, Modifica.INSERIMENTO)
+
+
+@receiver(entita_aggiornate)
+def entita_aggiornate_in_blocco(sender, ids, **kwargs):
+    invalida_entita(sender, ids)
+    modifiche.registra(sender, ids, Modifica.AGGIORNAMENTO)
+
+
+@receiver(entita_eliminate)
+def entita_eliminate_in_blocco(sender, ids, **kwargs):
+    invalida_entita(sender, ids, eliminati=True)
+    modifiche.registra(sender, ids, Modifica.ELIMINAZIONE)
+
+
+@receiver(pre_delete, sender=Ricetta)
+def ricetta_in_eliminazione(sender, instance, **kwargs):
+    # i collegamenti della ricetta vengono eliminati in cascata prima di essa:
+    # le righe di RistoranteIngrediente da ricalcolare si leggono adesso
+    instance._ristoranti_ingredienti = aggregati.coppie_della_ricetta(instance.id)
+
+
+@receiver(post_delete, sender=Ristorante)
+@receiver(post_delete, sender=Ricetta)
+@receiver(post_delete, sender=Ingrediente)
+def entita_eliminata(sender, instance, **kwargs):
+    invalida_entita(sender, [instance.id], eliminati=True)
+    modifiche.registra(sender, [instance.id], Modifica.ELIMINAZIONE)
+    if sender is Ricetta:
+        aggregati.aggiorna(*getattr(instance, '_ristoranti_ingredienti', ((), ())))
+
+
+@receiver(pre_save, sender=RistoranteToRicetta)
+@receiver(pre_save, sender=RicettaToIngrediente)
+def collegamento_modificato(sender, instance, **kwargs):
+    # se un collegamento esistente viene spostato, anche la coppia precedente va
+    # aggiornata: viene letta qui e gestita in post_save, dopo la modifica
+    instance._coppia_precedente = None
+    if instance.pk is None:
+        return
+    instance._coppia_precedente = sender.objects.filter(pk=instance.pk).values_list(*(f.attname for f in sender._meta.concrete_fields[1:])).first()
+
+
+@receiver(post_save, sender=RistoranteToRicetta)
+@receiver(post_save, sender=RicettaToIngrediente)
+def collegamento_salvato(sender, instance, **kwargs):
+    coppie = [_coppia(instance)]
+    precedente = getattr(instance, '_coppia_precedente', None)
+    if precedente is not None and precedente != coppie[0]:
+        # per i client un collegamento spostato è eliminato e ricreato
+        modifiche.registra_collegamenti(sender, [precedente], Modifica.ELIMINAZIONE)
+        coppie.append(precedente)
+    modifiche.registra_collegamenti(sender, coppie[:1], Modifica.INSERIMENTO)
+    _collegamenti_modificati(sender, coppie)
+
+
+@receiver(post_delete, sender=RistoranteToRicetta)
+@receiver(post_delete, sender=RicettaToIngrediente)
+def collegamento_eliminato(sender, instance, origin=None, **kwargs):
+    # nell'eliminazione in cascata di un'entità il ricalcolo avviene una volta sola:
+    # le righe di un ristorante o di un ingrediente eliminato sono eliminate in
+    # cascata anch'esse, quelle di una ricetta sono ricalcolate da entita_eliminata
+    if isinstance(origin, QuerySet):
+        origin = origin.model
+    a_cascata = isinstance(origin, (Ristorante, Ricetta, Ingrediente)) or origin in (Ristorante, Ricetta, Ingrediente)
+    _collegamenti_modificati(sender, [_coppia(instance)], ricalcola=not a_cascata)
+    modifiche.registra_collegamenti(sender, [_coppia(instance)], Modifica.ELIMINAZIONE)
+
+
+@receiver(collegamenti_creati)
+@receiver(collegamenti_eliminati)
+def collegamenti_modificati_in_blocco(sender, signal, coppie, ricalcola=True, **kwargs):
+    op = Modifica.INSERIMENTO if signal is collegamenti_creati else Modifica.ELIMINAZIONE
+    modifiche.registra_collegamenti(sender, coppie, op)
+    _collegamenti_modificati(sender, coppie, ricalcola)
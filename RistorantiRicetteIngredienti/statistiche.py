@@ -0,0 +1,128 @@
+"""
+Classifiche aggregate sul catalogo (api/stats/...):
+
+- ingredienti: per ogni ingrediente il numero di ristoranti che lo usano e
+  il numero di ricette dei loro menu che lo contengono;
+- ricette: per ogni ricetta il numero di ristoranti che la cucinano;
+- ristoranti: per ogni ristorante il numero di ingredienti distinti usati.
+
+Ogni classifica è una sola GROUP BY, sulla tabella materializzata
+RistoranteIngrediente (aggregati.py) o su RistoranteToRicetta, ordinata in
+SQL. Il risultato è tenuto in memoria come array NumPy (una riga per
+elemento) e ricalcolato dopo STATS_MAX_AGE secondi, quindi i numeri possono
+essere indietro di al più STATS_MAX_AGE secondi rispetto ai collegamenti.
+Ogni processo ha la propria copia, come l'indice di grafo.py.
+
+Le righe eliminate in modo logico e i loro collegamenti non contano, come nelle
+viste: la tabella materializzata li esclude già e la classifica delle ricette
+li filtra nella join, quindi totale e pagine sono coerenti tra loro.
+Gli elementi eliminati dopo il calcolo sono tolti dalla classifica quando una
+pagina li incontra (vedi pagina), senza aspettare il ricalcolo.
+"""
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import settings as app_settings
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RistoranteIngrediente
+
+
+def _ingredienti():
+    return RistoranteIngrediente.objects.values('ingrediente_id').annotate(
+        ristoranti=Count('ristorante_id'), ricette=Sum('recipe_count'),
+    ).order_by('-ristoranti', '-ricette', 'ingrediente_id').values_list('ingrediente_id', 'ristoranti', 'ricette')
+
+
+def _ricette():
+    return RistoranteToRicetta.objects.filter(
+        ristorante__deleted_at__isnull=True, ricetta__deleted_at__isnull=True,
+    ).values('ricetta_id').annotate(
+        ristoranti=Count('ristorante_id'),
+    ).order_by('-ristoranti', 'ricetta_id').values_list('ricetta_id', 'ristoranti')
+
+
+def _ristoranti():
+    return RistoranteIngrediente.objects.values('ristorante_id').annotate(
+        ingredienti=Count('ingrediente_id'),
+    ).order_by('-ingredienti', 'ristorante_id').values_list('ristorante_id', 'ingredienti')
+
+
+# nome -> (queryset della classifica, modello degli elementi, campo del nome, campi dei conteggi)
+CLASSIFICHE = {
+    'ingredienti': (_ingredienti, Ingrediente, 'ingrediente_text', ('ristoranti', 'ricette')),
+    'ricette': (_ricette, Ricetta, 'ricetta_text', ('ristoranti',)),
+    'ristoranti': (_ristoranti, Ristorante, 'ristorante_text', ('ingredienti',)),
+}
+
+
+class Classifica:
+    """Righe (id, conteggi...) di una classifica, già ordinate, con l'istante del calcolo."""
+
+    def __init__(self, righe, calcolata_il):
+        self.righe = righe
+        self.calcolata_il = calcolata_il
+        self.caricata_il = time.monotonic()
+
+    @classmethod
+    def calcola(cls, queryset, colonne):
+        valori = np.fromiter(
+            chain.from_iterable(queryset.iterator(chunk_size=app_settings.STREAM_CHUNK_SIZE)),
+            dtype=np.int64,
+        ).reshape(-1, colonne)
+        return cls(valori, timezone.now())
+
+
+_lock = threading.Lock()
+_classifiche = {}
+
+
+def classifica(nome):
+    """Restituisce la classifica `nome`, calcolandola se manca o è più vecchia di STATS_MAX_AGE."""
+    with _lock:
+        attuale = _classifiche.get(nome)
+        if attuale is None or time.monotonic() - attuale.caricata_il > app_settings.STATS_MAX_AGE:
+            queryset, _, _, conteggi = CLASSIFICHE[nome]
+            attuale = _classifiche[nome] = Classifica.calcola(queryset(), 1 + len(conteggi))
+        return attuale
+
+
+def invalida():
+    """Scarta le classifiche del processo corrente, che saranno ricalcolate alla prossima richiesta."""
+    with _lock:
+        _classifiche.clear()
+
+
+def _scarta(attuale, ids):
+    """Toglie dalla classifica gli elementi eliminati dopo il calcolo."""
+    with _lock:
+        attuale.righe = attuale.righe[~np.isin(attuale.righe[:, 0], ids)]
+
+
+def pagina(nome, limite, offset=0):
+    """
+    Restituisce {nome: [elementi], 'totale', 'aggiornato'}: `limite` elementi
+    della classifica a partire dalla posizione `offset`, con il loro nome
+    (una query). totale è il numero di elementi in classifica, aggiornato
+    l'istante del calcolo.
+    Se alcuni id della pagina non esistono più vengono tolti dalla classifica
+    e la pagina è riletta, completandola con gli elementi successivi: totale
+    e posizioni delle pagine seguenti restano coerenti.
+    """
+    _, modello, campo, conteggi = CLASSIFICHE[nome]
+    attuale = classifica(nome)
+    while True:
+        righe = attuale.righe[offset:offset + limite].tolist()
+        nomi = dict(modello.objects.filter(id__in=[riga[0] for riga in righe]).values_list('id', campo))
+        mancanti = [riga[0] for riga in righe if riga[0] not in nomi]
+        if not mancanti:
+            break
+        _scarta(attuale, mancanti)
+    return {
+        nome: [{'id': riga[0], campo: nomi[riga[0]], **dict(zip(conteggi, riga[1:]))} for riga in righe],
+        'totale': len(attuale.righe),
+        'aggiornato': attuale.calcolata_il.isoformat(),
+    }
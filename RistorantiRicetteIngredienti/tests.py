@@ -1,3 +1,1402 @@
-from django.test import TestCase
+import json
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+
+from django.core.cache import caches
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    aggregati, benchmark, caching, catalogo, database, grafo, lavori, limiti, metrics, modifiche, replica, serialization,
+    statistiche, views, views_async,
+)
+from . import settings as app_settings
+from .management.commands import catalog_import
+from .eliminazione import elimina, elimina_logicamente, purge
+from .models import (
+    Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, Modifica, Lavoro,
+    RistoranteIngrediente,
+)
+from .ricerca import cerca, ricostruisci_indice
+from .urls import urlpatterns
+
+_patch = []
+
+
+def setUpModule():
+    # i bucket dei test stanno in un database temporaneo, e le richieste dei
+    # test (tutte dallo stesso client) non hanno limiti, tranne in LimitiTests
+    cartella = tempfile.TemporaryDirectory()
+    _patch.extend([
+        cartella,
+        mock.patch.object(app_settings, 'RATE_LIMIT_DB', str(Path(cartella.name) / 'rate_limit.sqlite3')),
+        mock.patch.object(app_settings, 'RATE_LIMITS', {}),
+        # la cache condivisa delle versioni in una cartella temporanea
+        override_settings(CACHES={**settings.CACHES, app_settings.CACHE_VERSION_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': str(Path(cartella.name) / 'versioni'),
+        }}),
+    ])
+    for patch in _patch[1:]:
+        patch.enable() if isinstance(patch, override_settings) else patch.start()
+
+
+def _svuota_cache():
+    # le risposte in cache sopravvivono al rollback dei test, mentre gli id si ripetono
+    caches[app_settings.CACHE_ALIAS].clear()
+    caches[app_settings.CACHE_VERSION_ALIAS].clear()
+
+
+def tearDownModule():
+    for patch in reversed(_patch[1:]):
+        patch.disable() if isinstance(patch, override_settings) else patch.stop()
+    _patch[0].cleanup()
+    _patch.clear()
+
+
+class SeedCatalogTests(TestCase):
+
+    def _catalogo(self):
+        """Nomi e collegamenti del catalogo, con gli id ridotti a posizioni."""
+        posizioni = {
+            modello: {id_: i for i, id_ in enumerate(modello.objects.order_by('id').values_list('id', flat=True))}
+            for modello in (Ristorante, Ricetta, Ingrediente)
+        }
+        return (
+            list(Ricetta.objects.order_by('id').values_list('ricetta_text', flat=True)),
+            [(posizioni[Ristorante][a], posizioni[Ricetta][b])
+             for a, b in RistoranteToRicetta.objects.order_by('id').values_list('ristorante_id', 'ricetta_id')],
+            [(posizioni[Ricetta][a], posizioni[Ingrediente][b])
+             for a, b in RicettaToIngrediente.objects.order_by('id').values_list('ricetta_id', 'ingrediente_id')],
+        )
+
+    def test_catalogo_deterministico(self):
+        call_command('seed_catalog', ristoranti=5, ricette=20, ingredienti=10, seed=7, stdout=StringIO())
+        self.assertEqual(Ristorante.objects.count(), 5)
+        self.assertEqual(Ricetta.objects.count(), 20)
+        self.assertEqual(Ingrediente.objects.count(), 10)
+        primo = self._catalogo()
+        call_command('seed_catalog', ristoranti=5, ricette=20, ingredienti=10, seed=7, clear=True, stdout=StringIO())
+        self.assertEqual(self._catalogo(), primo)
+
+    def test_catalogo_non_vuoto(self):
+        Ristorante.objects.create(ristorante_text='Da Mario')
+        with self.assertRaises(CommandError):
+            call_command('seed_catalog', scale=0.001, stdout=StringIO())
+
+
+class CatalogoTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=6, ricette=30, ingredienti=20, seed=37, stdout=StringIO())
+        self.cartella = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cartella.cleanup)
+
+    def _catalogo(self):
+        """Nomi delle entità e coppie di nomi dei collegamenti, con i duplicati."""
+        return {
+            **{nome: sorted(modello.objects.values_list(campo, flat=True)) for nome, modello, campo in catalogo.ENTITA},
+            **{
+                nome: sorted(modello.objects.values_list(*(
+                    f'{campo_id[:-3]}__{catalogo.CAMPO_NOME[collegato]}' for _, campo_id, collegato in campi
+                )))
+                for nome, modello, campi in catalogo.COLLEGAMENTI
+            },
+        }
+
+    def _svuota(self):
+        for _, modello, _ in catalogo.ENTITA:
+            modello.tutti.all().delete()
+
+    def test_esporta_interrompi_riprendi(self):
+        atteso = self._catalogo()
+        for formato in catalogo.FORMATI:
+            directory = Path(self.cartella.name) / formato
+            call_command('catalog_export', str(directory), format=formato, chunk_size=4, stdout=StringIO())
+        for formato in catalogo.FORMATI:
+            with self.subTest(formato=formato):
+                directory = Path(self.cartella.name) / formato
+                self._svuota()
+
+                # interruzione durante il secondo blocco delle ricette: il primo resta nel checkpoint
+                originale = catalog_import.Command._entita
+                blocchi = []
+
+                def entita(comando, modello, campo, righe):
+                    if modello is Ricetta:
+                        blocchi.append(len(righe))
+                        if len(blocchi) == 2:
+                            raise KeyboardInterrupt
+                    return originale(comando, modello, campo, righe)
+
+                with mock.patch.object(catalog_import.Command, '_entita', entita), self.assertRaises(KeyboardInterrupt):
+                    call_command('catalog_import', str(directory), chunk_size=7, stdout=StringIO())
+                checkpoint = json.loads((directory / catalog_import.CHECKPOINT).read_text(encoding='utf-8'))
+                self.assertTrue(checkpoint['ristoranti']['completo'])
+                self.assertEqual(checkpoint['ricette'], {'righe': 7, 'inserite': 7, 'scartate': 0, 'completo': False})
+                self.assertEqual(Ricetta.objects.count(), 7)
+
+                uscita = StringIO()
+                call_command('catalog_import', str(directory), chunk_size=7, resume=True, stdout=uscita)
+                self.assertIn('ristoranti.', uscita.getvalue())
+                self.assertIn('già importato', uscita.getvalue())
+                self.assertFalse((directory / catalog_import.CHECKPOINT).exists())
+                self.assertEqual(self._catalogo(), atteso)
+
+                # un secondo import completo non duplica nulla
+                call_command('catalog_import', str(directory), stdout=StringIO())
+                self.assertEqual(self._catalogo(), atteso)
+
+
+class BenchmarkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_catalog', **benchmark.CATALOGO_BASELINE, stdout=StringIO())
+
+    def test_ogni_url_ha_un_caso(self):
+        nomi = {url_name for _, url_name, *_ in benchmark.casi()}
+        self.assertEqual(nomi, {pattern.name for pattern in urlpatterns})
+
+    def test_nessuna_regressione_rispetto_alla_baseline(self):
+        # la latenza dipende dalla macchina: qui si confrontano status, query e byte
+        risultati = benchmark.esegui(self.client, ripetizioni=1)
+        regressioni = benchmark.confronta(risultati, benchmark.carica_baseline(), latenza=False)
+        self.assertEqual(regressioni, [])
+
+
+class MenuTests(TestCase):
+
+    def _menu(self, url, **parametri):
+        """Risposta JSON di una vista dei menu e numero di query eseguite."""
+        with CaptureQueriesContext(connection) as contesto:
+            risposta = self.client.get(url, parametri)
+        self.assertEqual(risposta.status_code, 200)
+        return risposta.json(), len(contesto.captured_queries)
+
+    def _query(self):
+        ristorante = Ristorante.objects.order_by('id').values_list('id', flat=True).first()
+        url = reverse('menu_ristorante', kwargs={'ristorante_id': ristorante})
+        return (
+            self._menu(url)[1],
+            self._menu(url, depth=1)[1],
+            self._menu(reverse('menu_ristoranti'), limit=5)[1],
+        )
+
+    def test_query_costanti_al_crescere_del_catalogo(self):
+        call_command('seed_catalog', ristoranti=10, ricette=20, ingredienti=10, seed=3, stdout=StringIO())
+        piccolo = self._query()
+        call_command('seed_catalog', ristoranti=10, ricette=400, ingredienti=200, seed=3, clear=True, stdout=StringIO())
+        self.assertEqual(self._query(), piccolo)
+        self.assertEqual(piccolo, (3, 2, 3))
+
+    def test_menu_annidato(self):
+        call_command('seed_catalog', ristoranti=4, ricette=15, ingredienti=10, seed=5, stdout=StringIO())
+        ricette = {}
+        for ristorante, ricetta in RistoranteToRicetta.objects.values_list('ristorante_id', 'ricetta_id'):
+            ricette.setdefault(ristorante, set()).add(ricetta)
+        ingredienti = {}
+        for ricetta, ingrediente in RicettaToIngrediente.objects.values_list('ricetta_id', 'ingrediente_id'):
+            ingredienti.setdefault(ricetta, set()).add(ingrediente)
+
+        pagine, dopo = [], None
+        while True:
+            parametri = {'limit': 3} if dopo is None else {'limit': 3, 'after': dopo}
+            pagina, _ = self._menu(reverse('menu_ristoranti'), **parametri)
+            pagine += pagina['results']
+            dopo = pagina['next']
+            if dopo is None:
+                break
+        self.assertEqual([r['id'] for r in pagine], list(Ristorante.objects.order_by('id').values_list('id', flat=True)))
+        for ristorante in pagine:
+            self.assertEqual({r['id'] for r in ristorante['ricette']}, ricette.get(ristorante['id'], set()))
+            for ricetta in ristorante['ricette']:
+                self.assertEqual({i['id'] for i in ricetta['ingredienti']}, ingredienti.get(ricetta['id'], set()))
+
+        risposta = self.client.get(reverse('menu_ristorante', kwargs={'ristorante_id': 0}))
+        self.assertEqual(risposta.status_code, 404)
+
+
+class PaginazioneTests(TestCase):
+
+    def setUp(self):
+        _svuota_cache()
+        call_command('seed_catalog', ristoranti=25, ricette=30, ingredienti=15, seed=9, stdout=StringIO())
+        self.ids = list(Ristorante.objects.order_by('id').values_list('id', flat=True))
+
+    def _lista(self, **parametri):
+        return self.client.get(reverse('lista_ristoranti'), parametri)
+
+    def test_limit_after_next(self):
+        pagine = []
+        parametri = {'limit': 10}
+        while True:
+            pagina = self._lista(**parametri).json()
+            pagine.append([riga['id'] for riga in pagina['results']])
+            if pagina['next'] is None:
+                break
+            parametri['after'] = pagina['next']
+        self.assertEqual([len(p) for p in pagine], [10, 10, 5])
+        self.assertEqual(sum(pagine, []), self.ids)
+        # after senza limit usa la dimensione di pagina predefinita
+        pagina = self._lista(after=self.ids[-3]).json()
+        self.assertEqual(([riga['id'] for riga in pagina['results']], pagina['next']), (self.ids[-2:], None))
+
+    def test_limite_massimo(self):
+        with mock.patch.object(app_settings, 'PAGE_SIZE_MAX', 4):
+            pagina = self._lista(limit=1000).json()
+        self.assertEqual(len(pagina['results']), 4)
+        self.assertEqual(pagina['next'], str(self.ids[3]))
+        pagina = self._lista(limit=0).json()
+        self.assertEqual(len(pagina['results']), 1)
+
+    def test_parametri_non_validi(self):
+        for parametri in ({'limit': 'x'}, {'limit': -1}, {'after': 'x'}, {'after': -5}, {'fields': 'inesistente'}):
+            risposta = self._lista(**parametri)
+            self.assertEqual(risposta.status_code, 400, parametri)
+        ristorante = RistoranteToRicetta.objects.values_list('ristorante_id', flat=True).first()
+        risposta = self.client.get(reverse('ricette_per_ristorante'), {'ristorante_id': ristorante, 'limit': 'x'})
+        self.assertEqual(risposta.status_code, 400)
+
+    def test_stream_uguale_alla_lista(self):
+        ristorante = RistoranteToRicetta.objects.values_list('ristorante_id', flat=True).first()
+        casi = [
+            ('lista_ristoranti', {}),
+            ('lista_ristoranti', {'fields': 'ristorante_text'}),
+            ('ricette_per_ristorante', {'ristorante_id': ristorante}),
+        ]
+        with mock.patch.object(app_settings, 'STREAM_CHUNK_SIZE', 3):
+            for nome, parametri in casi:
+                attesa = self.client.get(reverse(nome), parametri).json()
+                risposta = self.client.get(reverse(nome), {**parametri, 'stream': '1'})
+                self.assertTrue(risposta.streaming)
+                self.assertEqual(json.loads(b''.join(risposta.streaming_content)), attesa, nome)
+        # lista vuota in streaming
+        risposta = self._lista(stream='1', after=self.ids[-1])
+        self.assertEqual(json.loads(b''.join(risposta.streaming_content)), [])
+
+    def test_stream_con_limit(self):
+        def stream(**parametri):
+            risposta = self._lista(stream='1', **parametri)
+            self.assertTrue(risposta.streaming)
+            return [riga['id'] for riga in json.loads(b''.join(risposta.streaming_content))]
+
+        self.assertEqual(stream(limit=4), self.ids[:4])
+        self.assertEqual(stream(limit=4, after=self.ids[5]), self.ids[6:10])
+        # after da solo non limita lo streaming
+        self.assertEqual(stream(after=self.ids[2]), self.ids[3:])
+        with mock.patch.object(app_settings, 'PAGE_SIZE_MAX', 3):
+            self.assertEqual(stream(limit=1000), self.ids[:3])
+        self.assertEqual(self._lista(stream='1', limit='x').status_code, 400)
+
+
+class BatchTests(TestCase):
+
+    def setUp(self):
+        _svuota_cache()
+        call_command('seed_catalog', ristoranti=6, ricette=30, ingredienti=15, seed=17, stdout=StringIO())
+        self.ristoranti = list(Ristorante.objects.order_by('id').values_list('id', flat=True)[:3])
+        # un ristorante senza ricette compare con una lista vuota
+        self.vuoto = Ristorante.objects.create(ristorante_text='Senza ricette').id
+
+    def _singola(self, nome, parametro, id_oggetto):
+        return self.client.get(reverse(nome), {parametro: id_oggetto}).json()
+
+    def test_virgole_e_post(self):
+        ids = [*self.ristoranti, self.vuoto]
+        attesa = {str(i): self._singola('ricette_per_ristorante', 'ristorante_id', i) for i in ids}
+        attesa[str(self.vuoto)] = []
+        url = reverse('ricette_per_ristorante')
+        risposta = self.client.get(url, {'ristorante_id': ','.join(map(str, ids))})
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(risposta.json(), attesa)
+        for corpo in (ids, {'ristorante_id': ids}):
+            self.assertEqual(self.client.post(url, data=corpo, content_type='application/json').json(), attesa)
+
+        # ingredienti distinti dalla tabella materializzata, come nella vista singola
+        url = reverse('ingredienti_per_ristorante')
+        risposta = self.client.post(url, data=self.ristoranti, content_type='application/json').json()
+        for i in self.ristoranti:
+            self.assertEqual(
+                sorted(riga['id'] for riga in risposta[str(i)]),
+                sorted(riga['id'] for riga in self._singola('ingredienti_per_ristorante', 'ristorante_id', i)),
+            )
+
+    def test_fields(self):
+        ricetta = RistoranteToRicetta.objects.values_list('ricetta_id', flat=True).first()
+        risposta = self.client.get(
+            reverse('ristoranti_per_ricetta'), {'ricetta_id': f'{ricetta},{ricetta}', 'fields': 'ristorante_text'},
+        ).json()
+        self.assertEqual(list(risposta), [str(ricetta)])
+        self.assertTrue(risposta[str(ricetta)])
+        self.assertTrue(all(set(riga) == {'id', 'ristorante_text'} for riga in risposta[str(ricetta)]))
+
+    def test_id_inesistenti_e_errori(self):
+        url = reverse('ricette_per_ristorante')
+        # nella vista singola un id inesistente dà 404, nella modalità batch manca dalla mappa
+        self.assertEqual(self.client.get(url, {'ristorante_id': 999999}).status_code, 404)
+        risposta = self.client.get(url, {'ristorante_id': f'{self.ristoranti[0]},999999'})
+        self.assertEqual(risposta.status_code, 200)
+        self.assertEqual(list(risposta.json()), [str(self.ristoranti[0])])
+        self.assertEqual(self.client.post(url, data=[999999], content_type='application/json').json(), {})
+
+        errati = [
+            ('get', {'ristorante_id': '1,x'}),
+            ('get', {'ristorante_id': ','}),
+            ('get', {'ristorante_id': '1,2', 'fields': 'inesistente'}),
+            ('post', 'non json'),
+            ('post', {'altro': [1]}),
+            ('post', []),
+            ('post', [1, 'x']),
+        ]
+        for metodo, dati in errati:
+            if metodo == 'get':
+                risposta = self.client.get(url, dati)
+            else:
+                risposta = self.client.post(url, data=dati, content_type='application/json')
+            self.assertEqual(risposta.status_code, 400, dati)
+        with mock.patch.object(app_settings, 'BATCH_SIZE_MAX', 2):
+            self.assertEqual(self.client.get(url, {'ristorante_id': '1,2,3'}).status_code, 400)
+
+
+class BulkTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=5, ricette=30, ingredienti=40, seed=13, stdout=StringIO())
+        self.ristorante, self.ricetta = RistoranteToRicetta.objects.order_by('id').values_list(
+            'ristorante_id', 'ricetta_id',
+        ).first()
+        self.altro = Ricetta.objects.exclude(ristorantetoricetta__ristorante_id=self.ristorante).values_list(
+            'id', flat=True,
+        ).first()
+
+    def _bulk(self, nome, elementi):
+        risposta = self.client.post(reverse(nome), data=elementi, content_type='application/json')
+        self.assertEqual(risposta.status_code, 200)
+        return risposta.json()['results']
+
+    def _collegati(self, ricetta):
+        return RistoranteToRicetta.objects.filter(ristorante_id=self.ristorante, ricetta_id=ricetta).count()
+
+    def test_entita_con_errori_e_collegamenti(self):
+        ingredienti = list(Ingrediente.objects.order_by('id').values_list('id', flat=True)[:3])
+        risultati = self._bulk('bulk_ricette', [
+            {'op': 'create', 'ricetta_text': 'Nuova', 'ristoranti': [self.ristorante], 'ingredienti': ingredienti},
+            {'op': 'create'},
+            {'op': 'update', 'id': 999999, 'ricetta_text': 'Inesistente'},
+            {'op': 'create', 'ricetta_text': 'Collegamento mancante', 'ingredienti': [999999]},
+            {'op': 'update', 'id': self.ricetta, 'ricetta_text': 'Rinominata'},
+            'non un oggetto',
+        ])
+        self.assertEqual([esito['index'] for esito in risultati], list(range(6)))
+        self.assertEqual([esito['status'] for esito in risultati], ['ok', 'error', 'error', 'error', 'ok', 'error'])
+        self.assertIn('999999', risultati[2]['error'])
+        self.assertIn('ingredienti 999999', risultati[3]['error'])
+
+        nuova = risultati[0]['id']
+        self.assertEqual(Ricetta.objects.get(id=nuova).ricetta_text, 'Nuova')
+        self.assertEqual(self._collegati(nuova), 1)
+        self.assertEqual(
+            set(RicettaToIngrediente.objects.filter(ricetta_id=nuova).values_list('ingrediente_id', flat=True)),
+            set(ingredienti),
+        )
+        self.assertEqual(Ricetta.objects.get(id=self.ricetta).ricetta_text, 'Rinominata')
+        self.assertFalse(Ricetta.objects.filter(ricetta_text__in=['Inesistente', 'Collegamento mancante']).exists())
+
+        # i collegamenti già presenti non vengono duplicati; delete elimina a cascata
+        risultati = self._bulk('bulk_ristoranti', [
+            {'op': 'update', 'id': self.ristorante, 'ristorante_text': 'Aggiornato', 'ricette': [nuova, self.altro]},
+            {'op': 'delete', 'id': 999999},
+        ])
+        self.assertEqual([esito['status'] for esito in risultati], ['ok', 'error'])
+        self.assertEqual((self._collegati(nuova), self._collegati(self.altro)), (1, 1))
+        self.assertEqual(self._bulk('bulk_ricette', [{'op': 'delete', 'id': nuova}])[0]['status'], 'ok')
+        self.assertFalse(RicettaToIngrediente.objects.filter(ricetta_id=nuova).exists())
+
+    def test_stesso_id_in_piu_elementi(self):
+        risultati = self._bulk('bulk_ricette', [
+            {'op': 'update', 'id': self.ricetta, 'ricetta_text': 'A'},
+            {'op': 'update', 'id': self.ricetta, 'ricetta_text': 'B'},
+        ])
+        self.assertEqual([esito['status'] for esito in risultati], ['ok', 'error'])
+        self.assertIn(str(self.ricetta), risultati[1]['error'])
+        self.assertEqual(Ricetta.objects.get(id=self.ricetta).ricetta_text, 'A')
+
+        risultati = self._bulk('bulk_ricette', [
+            {'op': 'delete', 'id': self.ricetta},
+            {'op': 'update', 'id': self.ricetta, 'ricetta_text': 'C'},
+        ])
+        self.assertEqual([esito['status'] for esito in risultati], ['ok', 'error'])
+        self.assertFalse(Ricetta.objects.filter(id=self.ricetta).exists())
+
+    def test_collegamenti(self):
+        risultati = self._bulk('bulk_ristoranti_ricette', [
+            {'op': 'create', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+            {'op': 'create', 'ristorante_id': self.ristorante, 'ricetta_id': self.altro},
+            {'op': 'create', 'ristorante_id': self.ristorante, 'ricetta_id': self.altro},
+            {'op': 'delete', 'ristorante_id': self.ristorante, 'ricetta_id': 999999},
+            {'op': 'create', 'ristorante_id': self.ristorante, 'ricetta_id': 999999},
+            {'op': 'update', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+            {'op': 'create', 'ristorante_id': 'x', 'ricetta_id': self.ricetta},
+        ])
+        self.assertEqual(
+            [esito['status'] for esito in risultati],
+            ['exists', 'ok', 'exists', 'not_found', 'error', 'error', 'error'],
+        )
+        self.assertEqual((self._collegati(self.ricetta), self._collegati(self.altro)), (1, 1))
+        self.assertEqual(aggregati.verifica()[:2], (0, 0))
+
+    def test_ordine_delle_operazioni(self):
+        # creazione ed eliminazione della stessa coppia: conta l'ultima
+        risultati = self._bulk('bulk_ristoranti_ricette', [
+            {'op': 'create', 'ristorante_id': self.ristorante, 'ricetta_id': self.altro},
+            {'op': 'delete', 'ristorante_id': self.ristorante, 'ricetta_id': self.altro},
+            {'op': 'delete', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+            {'op': 'create', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+            {'op': 'delete', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+            {'op': 'delete', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+        ])
+        self.assertEqual([esito['status'] for esito in risultati], ['ok', 'ok', 'ok', 'ok', 'ok', 'not_found'])
+        self.assertEqual((self._collegati(self.altro), self._collegati(self.ricetta)), (0, 0))
+
+        risultati = self._bulk('bulk_ristoranti_ricette', [
+            {'op': 'delete', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+            {'op': 'create', 'ristorante_id': self.ristorante, 'ricetta_id': self.ricetta},
+        ])
+        self.assertEqual([esito['status'] for esito in risultati], ['not_found', 'ok'])
+        self.assertEqual(self._collegati(self.ricetta), 1)
+        self.assertEqual(aggregati.verifica()[:2], (0, 0))
+
+
+class VisteAsincroneTests(TestCase):
+
+    def setUp(self):
+        _svuota_cache()
+        call_command('seed_catalog', ristoranti=5, ricette=25, ingredienti=15, seed=23, stdout=StringIO())
+
+    def _confronta(self, nome, parametri=None, metodo='get', corpo=None, **kwargs):
+        """Chiama la vista sincrona e quella asincrona con la stessa richiesta e confronta le risposte."""
+        url = reverse(nome, kwargs=kwargs or None)
+        if parametri:
+            url = f"{url}?{'&'.join(f'{k}={v}' for k, v in parametri.items())}"
+        argomenti = {'data': json.dumps(corpo), 'content_type': 'application/json'} if metodo == 'post' else {}
+
+        def sincrona():
+            risposta = getattr(views, nome)(getattr(RequestFactory(), metodo)(url, **argomenti), **kwargs)
+            contenuto = b''.join(risposta.streaming_content) if risposta.streaming else risposta.content
+            return risposta.status_code, risposta.get('Content-Type'), contenuto
+
+        async def asincrona():
+            # vista e lettura dello streaming nello stesso event loop, come sotto ASGI
+            risposta = await getattr(views_async, nome)(getattr(AsyncRequestFactory(), metodo)(url, **argomenti), **kwargs)
+            if risposta.streaming:
+                contenuto = b''.join([parte async for parte in risposta.streaming_content])
+            else:
+                contenuto = risposta.content
+            return risposta.status_code, risposta.get('Content-Type'), contenuto
+
+        # senza cache, così entrambe le versioni leggono davvero dal database
+        _svuota_cache()
+        attesa = sincrona()
+        _svuota_cache()
+        self.assertEqual(async_to_sync(asincrona)(), attesa, f"{nome} {parametri or ''}")
+        return attesa
+
+    def test_stesse_risposte_delle_viste_sincrone(self):
+        ristorante = Ristorante.objects.order_by('id').first()
+        ricetta = Ricetta.objects.order_by('id').first()
+        ingrediente = Ingrediente.objects.order_by('id').first()
+        ids = ','.join(str(i) for i in Ricetta.objects.order_by('id').values_list('id', flat=True)[:4])
+        ingredienti = list(Ingrediente.objects.order_by('id').values_list('id', flat=True)[:6])
+        casi = [
+            ('lista_ristoranti', {}),
+            ('lista_ristoranti', {'limit': 2, 'fields': 'id,ristorante_text'}),
+            ('lista_ristoranti', {'stream': 1}),
+            ('lista_ristoranti', {'stream': 1, 'limit': 2, 'after': 1}),
+            ('menu_ristoranti', {'limit': 2, 'depth': 1}),
+            ('ristoranti_per_ricetta', {'ricetta_id': ricetta.id}),
+            ('ristoranti_per_ricetta', {'ricetta_id': ids}),
+            ('ricette_per_ristorante', {'ristorante_id': ristorante.id, 'stream': 1}),
+            ('ricette_per_ingrediente', {'ingrediente_id': ingrediente.id}),
+            ('ingredienti_per_ricetta', {'ricetta_id': ricetta.id, 'limit': 3}),
+            ('ingredienti_per_ristorante', {'ristorante_id': ristorante.id}),
+            ('ingredienti_per_ristorante', {'ristorante_id': 999999}),
+            ('ingredienti_per_ristorante', {}),
+            ('ricerca', {'q': ricetta.ricetta_text.split()[0][:3]}),
+            ('statistiche_ingredienti', {'limit': 5}),
+            ('statistiche_ricette', {'limit': 5, 'offset': 2}),
+            ('statistiche_ristoranti', {}),
+            ('match_ricette', {'ingredienti': ','.join(map(str, ingredienti))}),
+            ('dispensa', {'ingredienti': ','.join(map(str, ingredienti)), 'max_mancanti': 2}),
+            ('modifiche_catalogo', {'limit': 5}),
+        ]
+        for nome, parametri in casi:
+            with self.subTest(vista=nome, parametri=parametri):
+                self._confronta(nome, parametri)
+
+        self._confronta('menu_ristorante', {'depth': 1}, ristorante_id=ristorante.id)
+        stato, _, contenuto = self._confronta('ricette_per_ingrediente', metodo='post', corpo=[ingrediente.id])
+        self.assertEqual(stato, 200)
+        self.assertIn(str(ingrediente.id), json.loads(contenuto))
+
+
+class CacheTests(TestCase):
+
+    def setUp(self):
+        _svuota_cache()
+        call_command('seed_catalog', ristoranti=5, ricette=30, ingredienti=40, seed=3, stdout=StringIO())
+        self.ristorante, self.ricetta = RistoranteToRicetta.objects.order_by('id').values_list(
+            'ristorante_id', 'ricetta_id',
+        ).first()
+
+    def _get(self, nome, parametro, id_oggetto, **intestazioni):
+        return self.client.get(reverse(nome), {parametro: id_oggetto}, **intestazioni)
+
+    def _ricette(self):
+        return self._get('ricette_per_ristorante', 'ristorante_id', self.ristorante)
+
+    def test_etag_e_304(self):
+        risposta = self._ricette()
+        self.assertEqual((risposta.status_code, risposta['X-Cache']), (200, 'MISS'))
+        etag = risposta['ETag']
+        with self.assertNumQueries(0):
+            risposta = self._ricette()
+        self.assertEqual((risposta['X-Cache'], risposta['ETag']), ('HIT', etag))
+        with self.assertNumQueries(0):
+            risposta = self._get('ricette_per_ristorante', 'ristorante_id', self.ristorante, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(risposta.status_code, 304)
+        self.assertEqual(risposta['ETag'], etag)
+        risposta = self._get('ricette_per_ristorante', 'ristorante_id', self.ristorante, HTTP_IF_NONE_MATCH='"altro"')
+        self.assertEqual((risposta.status_code, risposta.content), (200, self._ricette().content))
+
+    def test_invalidazione_da_vista(self):
+        etag = self._ricette()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            risposta = self.client.get(reverse('update_ricetta'), {'ricetta_id': self.ricetta, 'ricetta_text': 'Rinominata'})
+        self.assertEqual(risposta.status_code, 200)
+        risposta = self._get('ricette_per_ristorante', 'ristorante_id', self.ristorante, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((risposta.status_code, risposta['X-Cache']), (200, 'MISS'))
+        self.assertIn('Rinominata', [riga['ricetta_text'] for riga in risposta.json()])
+
+    def test_invalidazione_da_bulk(self):
+        self.assertEqual(self._get('ingredienti_per_ristorante', 'ristorante_id', self.ristorante)['X-Cache'], 'MISS')
+        usati = set(RicettaToIngrediente.objects.filter(ricetta_id=self.ricetta).values_list('ingrediente_id', flat=True))
+        intatto = min(usati)
+        self.assertEqual(self._get('ricette_per_ingrediente', 'ingrediente_id', intatto)['X-Cache'], 'MISS')
+        ingrediente = Ingrediente.objects.exclude(id__in=usati).values_list('id', flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('bulk_ricette_ingredienti'),
+                data=[{'op': 'create', 'ricetta_id': self.ricetta, 'ingrediente_id': ingrediente}],
+                content_type='application/json',
+            )
+        risposta = self._get('ingredienti_per_ristorante', 'ristorante_id', self.ristorante)
+        self.assertEqual(risposta['X-Cache'], 'MISS')
+        self.assertIn(ingrediente, [riga['id'] for riga in risposta.json()])
+        risposta = self._get('ricette_per_ingrediente', 'ingrediente_id', ingrediente)
+        self.assertIn(self.ricetta, [riga['id'] for riga in risposta.json()])
+        # le risposte non interessate restano in cache
+        self.assertEqual(self._get('ricette_per_ingrediente', 'ingrediente_id', intatto)['X-Cache'], 'HIT')
+
+    def test_invalidazione_da_lavoro(self):
+        # un lavoro di run_workers invalida le versioni condivise: qui si simula un
+        # altro processo svuotando la cache locale delle risposte
+        self.assertEqual(self._ricette()['X-Cache'], 'MISS')
+        lavori.accoda('elimina', modello='ricetta', ids=[self.ricetta])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(lavori.esegui(lavori.reclama('worker')))
+        caches[app_settings.CACHE_ALIAS].clear()
+        risposta = self._ricette()
+        self.assertEqual(risposta['X-Cache'], 'MISS')
+        self.assertNotIn(self.ricetta, [riga['id'] for riga in risposta.json()])
+
+    def test_worker_rifiutati_con_cache_locale(self):
+        self.assertTrue(caching.versioni_condivise())
+        locale = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={**settings.CACHES, app_settings.CACHE_VERSION_ALIAS: locale}):
+            self.assertFalse(caching.versioni_condivise())
+            with self.assertRaises(CommandError):
+                call_command('run_workers', once=True, stdout=StringIO())
+
+    def test_invalidazione_da_segnale(self):
+        self.assertEqual(self._get('ristoranti_per_ricetta', 'ricetta_id', self.ricetta)['X-Cache'], 'MISS')
+        altro = Ristorante.objects.exclude(ristorantetoricetta__ricetta_id=self.ricetta).values_list('id', flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            RistoranteToRicetta.objects.create(ristorante_id=altro, ricetta_id=self.ricetta)
+        risposta = self._get('ristoranti_per_ricetta', 'ricetta_id', self.ricetta)
+        self.assertEqual(risposta['X-Cache'], 'MISS')
+        self.assertIn(altro, [riga['id'] for riga in risposta.json()])
+
+
+class SerializzazioneTests(TestCase):
+
+    @skipIf(serialization.orjson is None, "orjson non installato")
+    def test_orjson_e_json_uguali(self):
+        dati = {
+            'prezzo': Decimal('12.50'),
+            'quando': datetime(2026, 3, 1, 20, 15, 30, 123456, tzinfo=dt_timezone.utc),
+            'giorno': date(2026, 3, 1),
+            'nome': 'Crème brûlée «della casa» 東京',
+            'righe': [{'id': 1, 'valore': 1.5}, None, True],
+            7: 'chiave intera',
+        }
+        with mock.patch.object(serialization, 'USA_ORJSON', True):
+            con_orjson = serialization.codifica(dati)
+            risposta = serialization.JsonResponse(dati).content
+        with mock.patch.object(serialization, 'USA_ORJSON', False):
+            con_json = serialization.codifica(dati)
+            self.assertEqual(serialization.JsonResponse(dati).content, risposta)
+        self.assertEqual(con_orjson, con_json)
+        self.assertIn('"nome":"Crème brûlée «della casa» 東京"'.encode(), con_json)
+        self.assertEqual(json.loads(con_json), {
+            'prezzo': '12.50', 'quando': '2026-03-01T20:15:30.123Z', 'giorno': '2026-03-01',
+            'nome': 'Crème brûlée «della casa» 東京', 'righe': [{'id': 1, 'valore': 1.5}, None, True],
+            '7': 'chiave intera',
+        })
+
+    def test_proiezione_campi(self):
+        call_command('seed_catalog', ristoranti=4, ricette=5, ingredienti=5, seed=29, stdout=StringIO())
+        attese = list(Ristorante.objects.order_by('id').values_list('id', 'ristorante_text'))
+        for parametri in ({'fields': 'id'}, {'fields': 'id', 'limit': 2}, {'fields': 'ristorante_text'}):
+            with self.subTest(parametri=parametri), CaptureQueriesContext(connection) as contesto:
+                risposta = self.client.get(reverse('lista_ristoranti'), parametri).json()
+                righe = risposta['results'] if 'limit' in parametri else risposta
+                campi = ['id', *(c for c in parametri['fields'].split(',') if c != 'id')]
+                self.assertEqual(righe, [dict(zip(campi, riga)) for riga in attese[:len(righe)]])
+                select = contesto.captured_queries[-1]['sql'].split(' FROM ')[0]
+                self.assertEqual('ristorante_text' in select, 'ristorante_text' in campi)
+                self.assertNotIn('deleted_at', select)
+
+
+class MetricheTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=5, ricette=20, ingredienti=10, seed=31, stdout=StringIO())
+        _svuota_cache()
+        metrics.azzera()
+        self.addCleanup(metrics.azzera)
+
+    def test_server_timing_e_prometheus(self):
+        ristorante = RistoranteToRicetta.objects.values_list('ristorante_id', flat=True).first()
+        with CaptureQueriesContext(connection) as contesto:
+            risposta = self.client.get(reverse('ricette_per_ristorante'), {'ristorante_id': ristorante})
+        self.assertEqual(risposta.status_code, 200)
+        voci = dict(voce.split(';', 1) for voce in risposta['Server-Timing'].split(', '))
+        self.assertEqual(list(voci), ['db', 'json', 'log', 'app', 'total'])
+        query = len(contesto.captured_queries)
+        self.assertGreater(query, 0)
+        self.assertTrue(voci['db'].endswith(f'desc="{query} queries"'))
+        durate = {nome: float(voce.split('dur=')[1].split(';')[0]) for nome, voce in voci.items()}
+        self.assertAlmostEqual(durate['total'], durate['db'] + durate['json'] + durate['log'] + durate['app'], delta=0.05)
+        # la misura esiste solo durante la richiesta
+        self.assertIsNone(metrics.misura_corrente())
+
+        testo = self.client.get(reverse('metrics')).content.decode()
+        righe = set(testo.splitlines())
+        route = '{route="ricette_per_ristorante"}'
+        self.assertIn('# TYPE rri_requests_total counter', righe)
+        self.assertIn('rri_requests_total{route="ricette_per_ristorante",method="GET",status="200"} 1', righe)
+        self.assertIn('# TYPE rri_request_duration_seconds histogram', righe)
+        self.assertIn(f'rri_request_duration_seconds_count{route} 1', righe)
+        self.assertIn(f'rri_db_queries_count{route} 1', righe)
+        self.assertIn(f'rri_db_queries_sum{route} {float(query)}', righe)
+        self.assertIn('rri_db_queries_bucket{route="ricette_per_ristorante",le="+Inf"} 1', righe)
+        # bucket cumulativi: la richiesta compare dal primo limite non inferiore al numero di query
+        for limite in metrics.BUCKET_QUERY:
+            self.assertIn(f'rri_db_queries_bucket{{route="ricette_per_ristorante",le="{limite}"}} {int(query <= limite)}', righe)
+
+
+class RicercaTests(TestCase):
+
+    def setUp(self):
+        self.ristorante = Ristorante.objects.create(ristorante_text='Trattoria Near Porto').id
+        self.ricetta = Ricetta.objects.create(ricetta_text='Spaghetti alla carbonara').id
+        self.ingrediente = Ingrediente.objects.create(ingrediente_text='Caffè macinato').id
+
+    def _cerca(self, q, **parametri):
+        risposta = self.client.get(reverse('ricerca'), {'q': q, **parametri})
+        self.assertEqual(risposta.status_code, 200, q)
+        return [(riga['tipo'], riga['id']) for riga in risposta.json()]
+
+    def test_prefisso_e_tipi(self):
+        self.assertEqual(self._cerca('carbo'), [('ricetta', self.ricetta)])
+        self.assertEqual(self._cerca('carbo', prefix='0'), [])
+        self.assertEqual(self._cerca('spaghetti carbonara', prefix='0'), [('ricetta', self.ricetta)])
+        # diacritici ignorati
+        self.assertEqual(self._cerca('caffe'), [('ingrediente', self.ingrediente)])
+        Ricetta.objects.create(ricetta_text='Trattoria del giorno')
+        self.assertEqual(len(self._cerca('trattoria')), 2)
+        self.assertEqual(self._cerca('trattoria', tipo='ristorante'), [('ristorante', self.ristorante)])
+        self.assertEqual(len(self._cerca('trattoria', tipo='ristorante,ricetta')), 2)
+        self.assertEqual(self._cerca('trattoria', tipo='ingrediente'), [])
+        self.assertEqual(self.client.get(reverse('ricerca'), {'q': 'x', 'tipo': 'piatto'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('ricerca')).status_code, 400)
+
+    def test_testo_ostile(self):
+        # gli operatori FTS5 nel testo dell'utente sono cercati come parole
+        self.assertEqual(self._cerca('near'), [('ristorante', self.ristorante)])
+        self.assertEqual(self._cerca('NEAR(trattoria porto)'), [('ristorante', self.ristorante)])
+        self.assertEqual(self._cerca('trattoria OR carbonara'), [])
+        self.assertEqual(self._cerca('trattoria" OR "carbonara'), [])
+        self.assertEqual(self._cerca('testo:carbonara'), [])
+        for q in ('"', '*', '"*', '^', '-carbonara', 'carbonara*', '(', 'AND', 'NOT porto', "'; DROP TABLE x; --"):
+            self._cerca(q)
+        self.assertEqual(self._cerca('-carbonara'), [('ricetta', self.ricetta)])
+
+    def test_aggiornamento_ed_eliminazione(self):
+        self.client.get(reverse('update_ricetta'), {'ricetta_id': self.ricetta, 'ricetta_text': 'Bucatini amatriciana'})
+        self.assertEqual(self._cerca('carbonara'), [])
+        self.assertEqual(self._cerca('amatri'), [('ricetta', self.ricetta)])
+        self.client.get(reverse('delete_ricetta'), {'ricetta_id': self.ricetta})
+        self.assertEqual(self._cerca('amatriciana'), [])
+        self.client.get(reverse('delete_ingrediente'), {'ingrediente_id': self.ingrediente, 'soft': '1'})
+        self.assertEqual(self._cerca('caffe'), [])
+        self.assertEqual(self._cerca('trattoria'), [('ristorante', self.ristorante)])
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=30, ricette=12, ingredienti=10, seed=41, stdout=StringIO())
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def _elenco(self, modello, **parametri):
+        url = reverse(f'admin:RistorantiRicetteIngredienti_{modello._meta.model_name}_changelist')
+        risposta = self.client.get(url, parametri)
+        self.assertEqual(risposta.status_code, 200)
+        return risposta.context['cl']
+
+    def test_conteggio_stimato(self):
+        ultimo = Ristorante.objects.order_by('-id').values_list('id', flat=True).first()
+        elimina_logicamente(Ristorante, list(Ristorante.objects.order_by('id').values_list('id', flat=True)[:3]))
+        with mock.patch.object(app_settings, 'ADMIN_COUNT_ESTIMATE_THRESHOLD', 10):
+            # senza filtri: MAX(id), che conta anche le righe eliminate
+            self.assertEqual(self._elenco(Ristorante).result_count, ultimo)
+            # con la ricerca attiva il conteggio è esatto
+            nome = Ristorante.objects.order_by('id').last().ristorante_text
+            cl = self._elenco(Ristorante, q=nome)
+            self.assertEqual(cl.result_count, len(cl.result_list))
+        self.assertEqual(self._elenco(Ristorante).result_count, 27)
+
+    def test_ricerca_full_text(self):
+        parola = Ricetta.objects.order_by('id').first().ricetta_text.split()[0]
+        cl = self._elenco(Ricetta, q=parola)
+        attesi = {risultato['id'] for risultato in cerca(parola, tipi=['ricetta'], limite=app_settings.ADMIN_SEARCH_LIMIT)}
+        self.assertTrue(attesi)
+        self.assertEqual({ricetta.id for ricetta in cl.result_list}, attesi)
+        self.assertEqual(self._elenco(Ricetta, q='inesistentexyz').result_count, 0)
+
+    def test_inline_paginato(self):
+        ricetta = Ricetta.objects.annotate(n=Count('ristorantetoricetta')).filter(n__gte=5).order_by('id').first()
+        url = reverse('admin:RistorantiRicetteIngredienti_ricetta_change', args=[ricetta.id])
+        with mock.patch.object(app_settings, 'ADMIN_INLINE_PER_PAGE', 2):
+            risposta = self.client.get(url, {
+                'ristorantetoricetta-pagina': 2, 'ricettatoingrediente_set-pagina': 1, '_changelist_filters': 'q=x',
+            })
+            self.assertEqual(risposta.status_code, 200)
+            formset = next(
+                inline.formset for inline in risposta.context['inline_admin_formsets']
+                if inline.formset.prefix == 'ristorantetoricetta'
+            )
+            self.assertEqual((formset.pagina, len(formset.forms)), (2, 2))
+            # i link cambiano solo la pagina del proprio inline
+            self.assertContains(
+                risposta, 'href="?ristorantetoricetta-pagina=3&amp;ricettatoingrediente_set-pagina=1&amp;_changelist_filters=q%3Dx"'
+            )
+            self.assertContains(
+                risposta, 'href="?ristorantetoricetta-pagina=1&amp;ricettatoingrediente_set-pagina=1&amp;_changelist_filters=q%3Dx"'
+            )
+
+            # il modulo inviato contiene solo le righe della pagina mostrata
+            dati = {'ricetta_text': ricetta.ricetta_text}
+            for inline in risposta.context['inline_admin_formsets']:
+                gruppo = inline.formset
+                for campo, valore in gruppo.management_form.initial.items():
+                    dati[f'{gruppo.prefix}-{campo}'] = valore
+                for form in gruppo.forms:
+                    for campo in form.fields:
+                        valore = form[campo].value()
+                        if valore is not None:
+                            dati[form.add_prefix(campo)] = valore
+            prima = set(RistoranteToRicetta.objects.filter(ricetta=ricetta).values_list('id', 'ristorante_id'))
+            mostrati = [form.instance for form in formset.forms]
+            libero = Ristorante.objects.exclude(ristorantetoricetta__ricetta=ricetta).order_by('id').first()
+            dati[formset.forms[0].add_prefix('ristorante')] = libero.id
+            dati[formset.forms[1].add_prefix('DELETE')] = 'on'
+            risposta = self.client.post(f'{url}?ristorantetoricetta-pagina=2', dati)
+        self.assertEqual(risposta.status_code, 302)
+        dopo = set(RistoranteToRicetta.objects.filter(ricetta=ricetta).values_list('id', 'ristorante_id'))
+        attesi = prima - {(collegamento.id, collegamento.ristorante_id) for collegamento in mostrati}
+        attesi.add((mostrati[0].id, libero.id))
+        self.assertEqual(dopo, attesi)
+
+
+class LimitiTests(TestCase):
+
+    def setUp(self):
+        # bucket nuovi per ogni test
+        cartella = tempfile.TemporaryDirectory()
+        self.addCleanup(cartella.cleanup)
+        for patch in (
+            mock.patch.object(app_settings, 'RATE_LIMIT_DB', str(Path(cartella.name) / 'rate_limit.sqlite3')),
+            mock.patch.object(app_settings, 'RATE_LIMITS', {'*': (3, 0.01)}),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.url = reverse('lista_ristoranti')
+
+    def test_429_con_retry_after(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        risposta = self.client.get(self.url)
+        self.assertEqual(risposta.status_code, 429)
+        # un gettone ogni 100 secondi
+        self.assertEqual(int(risposta['Retry-After']), 100)
+        # un altro client ha il proprio bucket
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='192.0.2.1').status_code, 200)
+
+    def test_client_esente(self):
+        with mock.patch.object(app_settings, 'RATE_LIMIT_EXEMPT', ('192.0.2.1',)):
+            for _ in range(5):
+                self.assertEqual(self.client.get(self.url, REMOTE_ADDR='192.0.2.1').status_code, 200)
+        # di default nessun client è esente, nemmeno quelli locali
+        self.assertEqual(app_settings.RATE_LIMIT_EXEMPT, ())
+
+    def test_header_ignorato_senza_proxy_fidati(self):
+        # senza RATE_LIMIT_TRUSTED_PROXIES l'header non cambia il client
+        for i in range(3):
+            self.assertEqual(self.client.get(self.url, HTTP_X_FORWARDED_FOR=f'198.51.100.{i}').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_X_FORWARDED_FOR='198.51.100.9').status_code, 429)
+
+    def test_header_falsificato_dietro_proxy(self):
+        with mock.patch.object(app_settings, 'RATE_LIMIT_TRUSTED_PROXIES', 1), \
+                mock.patch.object(app_settings, 'RATE_LIMIT_EXEMPT', ('127.0.0.1',)):
+            # il proxy (REMOTE_ADDR) aggiunge a destra l'indirizzo del client:
+            # le voci a sinistra, scritte dal client, non contano
+            richieste = [f'{falso}, 203.0.113.5' for falso in ('127.0.0.1', '10.0.0.1', '192.0.2.7')]
+            for valore in richieste:
+                self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR=valore).status_code, 200)
+            risposta = self.client.get(self.url, REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='127.0.0.1, 203.0.113.5')
+            self.assertEqual(risposta.status_code, 429)
+            # un altro client dietro lo stesso proxy ha il proprio bucket
+            risposta = self.client.get(self.url, REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='203.0.113.6')
+            self.assertEqual(risposta.status_code, 200)
+
+    def test_503_oltre_max_in_flight(self):
+        with mock.patch.object(app_settings, 'MAX_IN_FLIGHT', 1):
+            self.assertTrue(limiti.concorrenza.entra())
+            try:
+                risposta = self.client.get(self.url)
+            finally:
+                limiti.concorrenza.esci()
+            self.assertEqual(risposta.status_code, 503)
+            self.assertEqual(risposta['Retry-After'], str(app_settings.OVERLOAD_RETRY_AFTER))
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+class EliminazioneTests(TestCase):
+
+    def setUp(self):
+        _svuota_cache()
+        call_command('seed_catalog', ristoranti=5, ricette=30, ingredienti=15, seed=11, stdout=StringIO())
+        grafo.invalida_indice()
+        self.ristorante, self.ricetta = RistoranteToRicetta.objects.order_by('id').values_list(
+            'ristorante_id', 'ricetta_id',
+        ).first()
+
+    def _senza_differenze(self):
+        self.assertEqual(aggregati.verifica()[:2], (0, 0))
+
+    def test_eliminazione_a_cascata(self):
+        ingrediente = RicettaToIngrediente.objects.values_list('ingrediente_id', flat=True).first()
+        collegamenti = RicettaToIngrediente.objects.filter(ingrediente_id=ingrediente).count()
+        self.assertEqual(elimina(Ingrediente, [ingrediente]), collegamenti)
+        self.assertFalse(Ingrediente.tutti.filter(id=ingrediente).exists())
+        self.assertFalse(RicettaToIngrediente.objects.filter(ingrediente_id=ingrediente).exists())
+        self._senza_differenze()
+
+        elimina(Ricetta, [self.ricetta])
+        self.assertFalse(RistoranteToRicetta.objects.filter(ricetta_id=self.ricetta).exists())
+        self.assertFalse(RicettaToIngrediente.objects.filter(ricetta_id=self.ricetta).exists())
+        self._senza_differenze()
+
+        elimina(Ristorante, [self.ristorante])
+        self.assertFalse(RistoranteToRicetta.objects.filter(ristorante_id=self.ristorante).exists())
+        self._senza_differenze()
+
+    def test_eliminazione_logica_nasconde_subito(self):
+        testo = Ricetta.objects.get(id=self.ricetta).ricetta_text
+        self.assertIn(self.ricetta, grafo.indice_dispensa().ricette.righe.tolist())
+        with self.captureOnCommitCallbacks(execute=True):
+            risposta = self.client.get(reverse('delete_ricetta'), {'ricetta_id': self.ricetta, 'soft': '1'})
+        self.assertEqual(risposta.status_code, 200)
+        self.assertFalse(Ricetta.objects.filter(id=self.ricetta).exists())
+        self.assertTrue(Ricetta.tutti.filter(id=self.ricetta).exists())
+        # i collegamenti restano fino a purge(), ma non contano più
+        self.assertTrue(RicettaToIngrediente.objects.filter(ricetta_id=self.ricetta).exists())
+        altre = RistoranteToRicetta.objects.filter(ristorante_id=self.ristorante).exclude(ricetta_id=self.ricetta)
+        attesi = set(RicettaToIngrediente.objects.filter(
+            ricetta_id__in=altre.values('ricetta_id'),
+        ).values_list('ingrediente_id', flat=True))
+        risposta = self.client.get(reverse('ingredienti_per_ristorante'), {'ristorante_id': self.ristorante})
+        self.assertEqual({riga['id'] for riga in risposta.json()}, attesi)
+        self._senza_differenze()
+
+        # l'indice già caricato viene aggiornato in modo incrementale
+        indice = grafo.indice_dispensa()
+        self.assertNotIn(self.ricetta, indice.ricette.righe.tolist())
+        self.assertNotIn(self.ricetta, indice.ristoranti.vicini.tolist())
+
+        # anche dopo la ricostruzione dell'indice full-text
+        ricostruisci_indice()
+        self.assertNotIn(self.ricetta, [r['id'] for r in cerca(testo, tipi=['ricetta'], prefisso=False)])
+
+    def test_purge(self):
+        elimina_logicamente(Ricetta, [self.ricetta])
+        collegamenti = (
+            RistoranteToRicetta.objects.filter(ricetta_id=self.ricetta).count()
+            + RicettaToIngrediente.objects.filter(ricetta_id=self.ricetta).count()
+        )
+        passi = []
+        while any(passo := purge(limite=2)):
+            passi.append(passo)
+        self.assertEqual(sum(c for c, _ in passi), collegamenti)
+        self.assertEqual(sum(r for _, r in passi), 1)
+        self.assertFalse(Ricetta.tutti.filter(id=self.ricetta).exists())
+        self._senza_differenze()
+        # una sola eliminazione nel registro delle modifiche
+        eliminazioni = Modifica.objects.filter(model='ricetta', object_id=self.ricetta, op=Modifica.ELIMINAZIONE)
+        self.assertEqual(eliminazioni.count(), 1)
+
+    def test_purge_a_blocchi_di_righe(self):
+        ricette = list(Ricetta.objects.order_by('id').values_list('id', flat=True)[:5])
+        elimina_logicamente(Ricetta, ricette)
+        passi = []
+        while any(passo := purge(limite=2)):
+            passi.append(passo)
+        self.assertTrue(all(righe <= 2 and collegamenti <= 2 for collegamenti, righe in passi), passi)
+        self.assertEqual(sum(r for _, r in passi), 5)
+        self.assertFalse(Ricetta.tutti.filter(id__in=ricette).exists())
+        self._senza_differenze()
+
+
+class AggregatiTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=6, ricette=40, ingredienti=60, seed=7, stdout=StringIO())
+        self.ristoranti = list(Ristorante.objects.order_by('id').values_list('id', flat=True))
+        self.ricette = list(Ricetta.objects.order_by('id').values_list('id', flat=True))
+        self.ingredienti = list(Ingrediente.objects.order_by('id').values_list('id', flat=True))
+
+    def _senza_differenze(self):
+        errate, in_eccesso, differenze = aggregati.verifica()
+        self.assertEqual((errate, in_eccesso), (0, 0), differenze)
+
+    def _bulk(self, nome, elementi):
+        risposta = self.client.post(reverse(nome), data=elementi, content_type='application/json')
+        self.assertEqual(risposta.status_code, 200)
+        return risposta.json()['results']
+
+    def _nuova_coppia(self, modello, campo_a, ids_a, campo_b, ids_b):
+        esistenti = set(modello.objects.values_list(campo_a, campo_b))
+        return next((a, b) for a in ids_a for b in ids_b if (a, b) not in esistenti)
+
+    def test_nessuna_differenza_dopo_le_scritture(self):
+        self._senza_differenze()
+
+        # collegamenti singoli: creazione, modifica ed eliminazione con i segnali dei modelli
+        r, c = self._nuova_coppia(RistoranteToRicetta, 'ristorante_id', self.ristoranti, 'ricetta_id', self.ricette)
+        RistoranteToRicetta.objects.create(ristorante_id=r, ricetta_id=c)
+        c, i = self._nuova_coppia(RicettaToIngrediente, 'ricetta_id', self.ricette, 'ingrediente_id', self.ingredienti)
+        collegamento = RicettaToIngrediente.objects.create(ricetta_id=c, ingrediente_id=i)
+        self._senza_differenze()
+        _, collegamento.ingrediente_id = self._nuova_coppia(
+            RicettaToIngrediente, 'ricetta_id', [c], 'ingrediente_id', self.ingredienti,
+        )
+        collegamento.save()
+        self._senza_differenze()
+        collegamento.delete()
+        RistoranteToRicetta.objects.filter(ristorante_id=self.ristoranti[0])[:1].get().delete()
+        self._senza_differenze()
+
+        # operazioni bulk sui collegamenti e sulle entità
+        r, c = self._nuova_coppia(RistoranteToRicetta, 'ristorante_id', self.ristoranti, 'ricetta_id', self.ricette)
+        esistente = RistoranteToRicetta.objects.values_list('ristorante_id', 'ricetta_id').first()
+        self._bulk('bulk_ristoranti_ricette', [
+            {'op': 'create', 'ristorante_id': r, 'ricetta_id': c},
+            {'op': 'delete', 'ristorante_id': esistente[0], 'ricetta_id': esistente[1]},
+        ])
+        self._senza_differenze()
+        ricetta = self._bulk('bulk_ricette', [{
+            'op': 'create', 'ricetta_text': 'Nuova ricetta',
+            'ristoranti': self.ristoranti[:3], 'ingredienti': self.ingredienti[:4],
+        }])[0]['id']
+        self._bulk('bulk_ingredienti', [
+            {'op': 'create', 'ingrediente_text': 'Nuovo ingrediente', 'ricette': [ricetta, self.ricette[0]]},
+            {'op': 'delete', 'id': self.ingredienti[0]},
+        ])
+        self._senza_differenze()
+
+        # eliminazioni di entità, a cascata e logiche
+        self.assertEqual(self.client.get(reverse('delete_ristorante'), {'ristorante_id': self.ristoranti[1]}).status_code, 200)
+        elimina(Ricetta, [self.ricette[1]])
+        self._senza_differenze()
+        elimina_logicamente(Ingrediente, [self.ingredienti[1]])
+        elimina_logicamente(Ricetta, [ricetta])
+        elimina_logicamente(Ristorante, [self.ristoranti[2]])
+        self._senza_differenze()
+        while any(purge(limite=5)):
+            pass
+        self._senza_differenze()
+
+        # lo stato finale coincide con una ricostruzione completa
+        righe = set(RistoranteIngrediente.objects.values_list('ristorante_id', 'ingrediente_id', 'recipe_count'))
+        aggregati.ricostruisci()
+        self.assertEqual(
+            set(RistoranteIngrediente.objects.values_list('ristorante_id', 'ingrediente_id', 'recipe_count')), righe,
+        )
+
+
+class GrafoTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=6, ricette=40, ingredienti=30, seed=23, stdout=StringIO())
+        grafo.invalida_indice()
+        self.addCleanup(grafo.invalida_indice)
+
+    def _uguali(self, a, b):
+        for campo in ('righe', 'offsets', 'vicini'):
+            self.assertEqual(getattr(a, campo).tolist(), getattr(b, campo).tolist(), campo)
+
+    def test_aggiornamento_incrementale(self):
+        indice = grafo.indice_dispensa()
+        ingredienti = list(Ingrediente.objects.order_by('id').values_list('id', flat=True)[:5])
+        self.assertTrue(indice.abbina(ingredienti))
+
+        ricetta, ingrediente = RicettaToIngrediente.objects.values_list('ricetta_id', 'ingrediente_id').first()
+        nuovo = Ingrediente.objects.create(ingrediente_text='Nuovo').id
+        ristorante = Ristorante.objects.exclude(ristorantetoricetta__ricetta_id=ricetta).values_list('id', flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            RicettaToIngrediente.objects.filter(ricetta_id=ricetta, ingrediente_id=ingrediente).delete()
+            RicettaToIngrediente.objects.create(ricetta_id=ricetta, ingrediente_id=nuovo)
+            RistoranteToRicetta.objects.create(ristorante_id=ristorante, ricetta_id=ricetta)
+            elimina_logicamente(Ricetta, [RicettaToIngrediente.objects.exclude(ricetta_id=ricetta).values_list(
+                'ricetta_id', flat=True,
+            ).first()])
+
+        # l'indice invertito già costruito è aggiornato senza trasporre di nuovo l'adiacenza
+        with mock.patch.object(grafo.AdiacenzaCSR, 'trasposta', side_effect=AssertionError):
+            aggiornato = grafo.indice_dispensa()
+            inverso = aggiornato.ricette_per_ingrediente
+            abbinate = aggiornato.abbina([nuovo, *ingredienti])
+        self.assertIn(ricetta, [riga['id'] for riga in abbinate])
+
+        grafo.invalida_indice()
+        ricaricato = grafo.indice_dispensa()
+        self._uguali(aggiornato.ricette, ricaricato.ricette)
+        self._uguali(aggiornato.ristoranti, ricaricato.ristoranti)
+        self._uguali(inverso, ricaricato.ricette_per_ingrediente)
+        self.assertEqual(abbinate, ricaricato.abbina([nuovo, *ingredienti]))
+
+
+class DatabaseTests(TestCase):
+
+    def test_pragma_di_una_nuova_connessione(self):
+        cartella = tempfile.TemporaryDirectory()
+        self.addCleanup(cartella.cleanup)
+        impostazioni = {**connections['default'].settings_dict, 'NAME': str(Path(cartella.name) / 'prova.sqlite3')}
+        nuova = connections['default'].__class__(impostazioni, alias='prova')
+        self.addCleanup(nuova.close)
+        # i PRAGMA sono applicati da configura_sqlite al segnale connection_created
+        with nuova.cursor() as cursor:
+            letti = {}
+            for nome in app_settings.SQLITE_PRAGMAS:
+                cursor.execute(f'PRAGMA {nome}')
+                letti[nome] = cursor.fetchone()[0]
+        self.assertEqual(letti, {
+            'journal_mode': 'wal', 'synchronous': 1, 'mmap_size': 268435456, 'cache_size': -65536,
+            'busy_timeout': 5000, 'temp_store': 2,
+        })
+        # transaction_mode è letto dalle OPTIONS all'apertura della connessione
+        self.assertEqual((nuova.settings_dict['CONN_MAX_AGE'], nuova.transaction_mode), (600, 'IMMEDIATE'))
+
+    def test_pragma_non_validi(self):
+        self.assertEqual(database.istruzioni_pragma({'cache_size': -2000}), ['PRAGMA cache_size = -2000'])
+        for pragmi in ({'journal_mode': 'WAL; DROP TABLE x'}, {'cache size': 1}):
+            with self.assertRaises(ValueError):
+                database.istruzioni_pragma(pragmi)
+
+
+class ReplicaTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=5, ricette=10, ingredienti=10, seed=29, stdout=StringIO())
+        # la replica usa la connessione del database di test: qui conta solo l'instradamento
+        originale = connections['replica']
+        connections['replica'] = connections['default']
+        self.addCleanup(connections.__setitem__, 'replica', originale)
+        cartella = tempfile.TemporaryDirectory()
+        self.addCleanup(cartella.cleanup)
+        marcatura = mock.patch.object(replica, '_marcatura', lambda alias: Path(cartella.name) / f'{alias}.sync')
+        marcatura.start()
+        self.addCleanup(marcatura.stop)
+
+    def _replica_usata(self, nome='lista_ristoranti', **parametri):
+        risposta = self.client.get(reverse(nome), parametri)
+        self.assertEqual(risposta.status_code, 200)
+        return risposta.wsgi_request.stato_replica.replica
+
+    def test_replica_aggiornata(self):
+        replica._segna('replica', time.time())
+        self.assertEqual(self._replica_usata(), 'replica')
+        # le viste fuori da REPLICA_VIEWS leggono sempre dal primario
+        self.assertIsNone(self._replica_usata('statistiche_ricette'))
+
+    def test_replica_indietro_o_mai_copiata(self):
+        self.assertEqual(replica.sincronizzata('replica'), 0.0)
+        self.assertIsNone(self._replica_usata())
+        replica._segna('replica', time.time() - app_settings.REPLICA_MAX_STALENESS - 1)
+        self.assertIsNone(self._replica_usata())
+
+    def test_lettura_dopo_scrittura(self):
+        replica._segna('replica', time.time())
+        risposta = self.client.get(reverse('create_ristorante'), {'ristorante_text': 'Nuovo'})
+        self.assertIn(replica.PIN_COOKIE, risposta.cookies)
+        self.assertTrue(risposta.wsgi_request.stato_replica.scrittura)
+        # la replica è stata copiata prima della scrittura: il client resta sul primario
+        self.assertIsNone(self._replica_usata())
+        self.assertIn('Nuovo', [r['ristorante_text'] for r in self.client.get(reverse('lista_ristoranti')).json()])
+        # una copia successiva alla scrittura può servire di nuovo le letture
+        replica._segna('replica', float(risposta.cookies[replica.PIN_COOKIE].value) + 1)
+        self.assertEqual(self._replica_usata(), 'replica')
+        # un cookie non valido vale come assente
+        self.client.cookies[replica.PIN_COOKIE] = 'x'
+        self.assertEqual(self._replica_usata(), 'replica')
+
+
+class StatisticheTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=5, ricette=30, ingredienti=15, seed=19, stdout=StringIO())
+        statistiche.invalida()
+        self.addCleanup(statistiche.invalida)
+
+    def _classifica(self, nome):
+        pagina = self.client.get(reverse(f'statistiche_{nome}'), {'limit': 1000}).json()
+        self.assertEqual(pagina['totale'], len(pagina[nome]))
+        return {riga['id']: riga for riga in pagina[nome]}
+
+    def test_eliminazione_logica(self):
+        ristorante, ricetta = RistoranteToRicetta.objects.values_list('ristorante_id', 'ricetta_id').first()
+        ingrediente = RicettaToIngrediente.objects.exclude(ricetta_id=ricetta).values_list('ingrediente_id', flat=True).first()
+        elimina_logicamente(Ricetta, [ricetta])
+        elimina_logicamente(Ingrediente, [ingrediente])
+        elimina_logicamente(Ristorante, [ristorante])
+
+        ricette = self._classifica('ricette')
+        self.assertNotIn(ricetta, ricette)
+        attese = RistoranteToRicetta.objects.exclude(ristorante_id=ristorante).exclude(ricetta_id=ricetta)
+        for r, ristoranti in attese.values('ricetta_id').annotate(n=Count('id')).values_list('ricetta_id', 'n'):
+            self.assertEqual(ricette[r]['ristoranti'], ristoranti)
+        self.assertNotIn(ingrediente, self._classifica('ingredienti'))
+        self.assertNotIn(ristorante, self._classifica('ristoranti'))
+
+    def test_eliminati_dopo_il_calcolo(self):
+        url = reverse('statistiche_ricette')
+        prima = self.client.get(url, {'limit': 1000}).json()
+        ordine = [riga['id'] for riga in prima['ricette']]
+        # classifica già in memoria: le ricette eliminate ora ci sono ancora
+        elimina_logicamente(Ricetta, [ordine[1], ordine[3]])
+        elimina(Ricetta, [ordine[4]])
+        pagina = self.client.get(url, {'limit': 4}).json()
+        self.assertEqual([riga['id'] for riga in pagina['ricette']], [ordine[0], ordine[2], *ordine[5:7]])
+        self.assertEqual(pagina['totale'], len(ordine) - 3)
+        self.assertEqual(pagina['aggiornato'], prima['aggiornato'])
+        pagina = self.client.get(url, {'limit': 2, 'offset': 2}).json()
+        self.assertEqual([riga['id'] for riga in pagina['ricette']], ordine[5:7])
+
+
+class ModificheTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_catalog', ristoranti=5, ricette=30, ingredienti=15, seed=5, stdout=StringIO())
+        self.inizio = self._modifiche().json()['next']
+
+    def _modifiche(self, **parametri):
+        return self.client.get(reverse('modifiche_catalogo'), parametri)
+
+    def _tutte(self, since, limit=100):
+        """Segue next fino all'ultima pagina; restituisce le voci e la sequenza finale."""
+        voci = []
+        while True:
+            pagina = self._modifiche(since=since, limit=limit).json()
+            voci += pagina['results']
+            since = pagina['next']
+            if not pagina['more']:
+                return voci, since
+
+    def _voce(self, voci, modello, **chiave):
+        trovate = [v for v in voci if v['model'] == modello and all(
+            v.get('id') == valore if campo == 'id' else v['data'][campo] == valore for campo, valore in chiave.items()
+        )]
+        self.assertEqual(len(trovate), 1, voci)
+        return trovate[0]
+
+    def test_cursore_e_continuazione(self):
+        self.assertEqual(self._modifiche(since=self.inizio).json(), {'results': [], 'next': self.inizio, 'more': False})
+        ids = [self.client.get(reverse('create_ristorante'), {'ristorante_text': f'R{n}'}).json()['id'] for n in range(3)]
+        self.client.get(reverse('update_ristorante'), {'ristorante_id': ids[0], 'ristorante_text': 'R0 bis'})
+
+        pagina = self._modifiche(since=self.inizio, limit=2).json()
+        self.assertTrue(pagina['more'])
+        self.assertEqual([v['id'] for v in pagina['results']], ids[:2])
+        pagina = self._modifiche(since=pagina['next'], limit=2).json()
+        self.assertFalse(pagina['more'])
+        self.assertEqual([(v['id'], v['op']) for v in pagina['results']], [(ids[2], 'insert'), (ids[0], 'update')])
+        self.assertEqual(pagina['results'][1]['data']['ristorante_text'], 'R0 bis')
+
+        # in una sola pagina resta solo la voce più recente di ogni oggetto, con la riga attuale
+        voci, fine = self._tutte(self.inizio)
+        self.assertEqual(fine, pagina['next'])
+        self.assertEqual([v['id'] for v in voci], [ids[1], ids[2], ids[0]])
+        self.assertEqual(self._modifiche(since=fine).json()['results'], [])
+
+    def test_operazioni_bulk_ed_eliminazioni(self):
+        ristorante = Ristorante.objects.values_list('id', flat=True).first()
+        ricetta = self.client.post(
+            reverse('bulk_ricette'),
+            data=[{'op': 'create', 'ricetta_text': 'Nuova', 'ristoranti': [ristorante]}],
+            content_type='application/json',
+        ).json()['results'][0]['id']
+        ingrediente = Ingrediente.objects.values_list('id', flat=True).first()
+        ricette = list(RicettaToIngrediente.objects.filter(ingrediente_id=ingrediente).values_list('ricetta_id', flat=True))
+        self.client.get(reverse('delete_ingrediente'), {'ingrediente_id': ingrediente})
+        elimina_logicamente(Ristorante, [ristorante])
+
+        voci, _ = self._tutte(self.inizio, limit=3)
+        voce = self._voce(voci, 'ricetta', id=ricetta)
+        self.assertEqual((voce['op'], voce['data']['ricetta_text']), ('insert', 'Nuova'))
+        self._voce(voci, 'ristorantetoricetta', ristorante_id=ristorante, ricetta_id=ricetta)
+        self.assertEqual(self._voce(voci, 'ingrediente', id=ingrediente)['op'], 'delete')
+        for r in ricette:
+            voce = self._voce(voci, 'ricettatoingrediente', ricetta_id=r, ingrediente_id=ingrediente)
+            self.assertEqual(voce['op'], 'delete')
+        # un oggetto eliminato in modo logico è restituito come eliminazione, senza riga
+        voce = self._voce(voci, 'ristorante', id=ristorante)
+        self.assertEqual(voce['op'], 'delete')
+        self.assertNotIn('data', voce)
+
+    def test_compattazione(self):
+        ristorante = self.client.get(reverse('create_ristorante'), {'ristorante_text': 'Temporaneo'}).json()['id']
+        self.client.get(reverse('delete_ristorante'), {'ristorante_id': ristorante})
+        corrente = self._modifiche().json()['next']
+        superate, eliminate = modifiche.compatta(conservazione=0)
+        self.assertEqual((superate, eliminate), (1, 1))
+
+        # un client fermo prima dell'orizzonte deve riscaricare il catalogo
+        risposta = self._modifiche(since=self.inizio)
+        self.assertEqual(risposta.status_code, 410)
+        self.assertEqual(risposta.json()['next'], corrente)
+        risposta = self._modifiche(since=corrente)
+        self.assertEqual(risposta.json(), {'results': [], 'next': corrente, 'more': False})
+        self.assertEqual(self._modifiche().json()['next'], corrente)
+
+    def test_parametri_non_validi(self):
+        for parametri in ({'since': 'x'}, {'since': -1}, {'since': 0, 'limit': 'x'}):
+            self.assertEqual(self._modifiche(**parametri).status_code, 400)
+
+
+def _fallisce(**argomenti):
+    raise RuntimeError('errore di prova')
+
+
+class LavoriTests(TestCase):
+
+    def setUp(self):
+        self.eseguiti = []
+        compiti = mock.patch.dict(lavori.COMPITI, {
+            'prova': lambda **argomenti: self.eseguiti.append(argomenti),
+            'fallisce': _fallisce,
+        })
+        compiti.start()
+        self.addCleanup(compiti.stop)
+
+    def test_reclama_lavori_diversi(self):
+        primo = lavori.accoda('prova', n=1)
+        secondo = lavori.accoda('prova', n=2)
+        lavori.accoda('prova', ritardo=60, n=3)
+        a = lavori.reclama('a')
+        b = lavori.reclama('b')
+        self.assertEqual((a.id, b.id), (primo.id, secondo.id))
+        self.assertEqual((a.status, a.attempts, a.locked_by), (Lavoro.IN_CORSO, 1, 'a'))
+        # gli altri lavori sono in corso o non ancora pronti
+        self.assertIsNone(lavori.reclama('c'))
+        self.assertTrue(lavori.esegui(a))
+        a.refresh_from_db()
+        self.assertEqual((a.status, a.locked_by, a.locked_until), (Lavoro.COMPLETATO, '', None))
+        self.assertEqual(self.eseguiti, [{'n': 1}])
+
+    def test_unico(self):
+        primo = lavori.accoda('prova', unico=True, n=1)
+        self.assertEqual(lavori.accoda('prova', unico=True, n=1).id, primo.id)
+        self.assertNotEqual(lavori.accoda('prova', unico=True, n=2).id, primo.id)
+        # un lavoro già iniziato non conta
+        lavori.reclama('a')
+        self.assertNotEqual(lavori.accoda('prova', unico=True, n=1).id, primo.id)
+        with self.assertRaises(ValueError):
+            lavori.accoda('sconosciuto')
+
+    def test_nuovi_tentativi(self):
+        with mock.patch.object(app_settings, 'JOB_MAX_ATTEMPTS', 3), \
+                mock.patch.object(app_settings, 'JOB_RETRY_DELAY', 10):
+            lavoro = lavori.accoda('fallisce')
+            for tentativo in (1, 2):
+                prima = timezone.now()
+                self.assertFalse(lavori.esegui(lavori.reclama('a')))
+                lavoro.refresh_from_db()
+                self.assertEqual((lavoro.status, lavoro.attempts), (Lavoro.IN_CODA, tentativo))
+                self.assertIn('errore di prova', lavoro.last_error)
+                attesa = (lavoro.run_after - prima).total_seconds()
+                self.assertAlmostEqual(attesa, 10 * 2 ** (tentativo - 1), delta=1)
+                self.assertIsNone(lavori.reclama('a'))
+                Lavoro.objects.filter(id=lavoro.id).update(run_after=timezone.now())
+            self.assertFalse(lavori.esegui(lavori.reclama('a')))
+        lavoro.refresh_from_db()
+        self.assertEqual((lavoro.status, lavoro.attempts), (Lavoro.FALLITO, 3))
+        self.assertIsNotNone(lavoro.finished_at)
+        self.assertIsNone(lavori.reclama('a'))
+
+    def test_lock_scaduto(self):
+        lavoro = lavori.accoda('prova', n=1)
+        a = lavori.reclama('a')
+        self.assertTrue(lavori.rinnova(a))
+        self.assertEqual(lavori.recupera_scaduti(), 0)
+        Lavoro.objects.filter(id=lavoro.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(lavori.recupera_scaduti(), 1)
+        b = lavori.reclama('b')
+        self.assertEqual((b.id, b.attempts), (lavoro.id, 2))
+
+        # il worker che ha perso il lock non lo rinnova e non registra l'esito
+        self.assertFalse(lavori.rinnova(a))
+        self.assertFalse(lavori.esegui(a))
+        lavoro.refresh_from_db()
+        self.assertEqual((lavoro.status, lavoro.locked_by), (Lavoro.IN_CORSO, 'b'))
+
+        self.assertTrue(lavori.esegui(b))
+        lavoro.refresh_from_db()
+        self.assertEqual(lavoro.status, Lavoro.COMPLETATO)
+        self.assertEqual(lavori.recupera_scaduti(), 0)
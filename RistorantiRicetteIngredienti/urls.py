@@ -1,28 +1,59 @@
 from django.urls import path
-from . import views
+from . import views, views_async
+from . import settings as app_settings
+
+# viste di lettura: asincrone nel profilo ASGI (ASYNC_VIEWS), sincrone altrimenti
+lettura = views_async if app_settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # Endpoint per la pagina di indice
     path("", views.index, name="index"),
     
     # Endpoint per ottenere la lista di tutti i ristoranti
-    path("api/ristoranti/", views.lista_ristoranti, name="lista_ristoranti"),
+    path("api/ristoranti/", lettura.lista_ristoranti, name="lista_ristoranti"),
     
+    # Endpoint per ottenere i ristoranti con ricette e ingredienti annidati, una pagina alla volta
+    path("api/ristoranti/menu/", lettura.menu_ristoranti, name="menu_ristoranti"),
+
+    # Endpoint per ottenere il menu di un ristorante con ricette e ingredienti annidati
+    path("api/ristoranti/<int:ristorante_id>/menu/", lettura.menu_ristorante, name="menu_ristorante"),
+
     # Endpoint per ottenere i ristoranti che cucinano la ricetta specificata
-    path("api/ristoranti/ricetta/", views.ristoranti_per_ricetta, name="ristoranti_per_ricetta"),
+    path("api/ristoranti/ricetta/", lettura.ristoranti_per_ricetta, name="ristoranti_per_ricetta"),
 
     # Endpoint per ottenere le ricette relative ad un ristorante specificato
-    path("api/ricette/ristorante/", views.ricette_per_ristorante, name="ricette_per_ristorante"),
+    path("api/ricette/ristorante/", lettura.ricette_per_ristorante, name="ricette_per_ristorante"),
 
     # Endpoint per ottenere le ricette che contengono un ingrediente specificato
-    path("api/ricette/ingrediente/", views.ricette_per_ingrediente, name="ricette_per_ingrediente"),
+    path("api/ricette/ingrediente/", lettura.ricette_per_ingrediente, name="ricette_per_ingrediente"),
 
     # Endpoint per ottenere gli ingredienti relativi ad una ricetta specificata
-    path("api/ingredienti/ricetta/", views.ingredienti_per_ricetta, name="ingredienti_per_ricetta"),
+    path("api/ingredienti/ricetta/", lettura.ingredienti_per_ricetta, name="ingredienti_per_ricetta"),
 
     # Endpoint per ottenere gli ingredienti utilizzati da un ristorante specificato
-    path("api/ingredienti/ristorante/", views.ingredienti_per_ristorante, name="ingredienti_per_ristorante"),
+    path("api/ingredienti/ristorante/", lettura.ingredienti_per_ristorante, name="ingredienti_per_ristorante"),
     
+    # Endpoint per la ricerca full-text su ristoranti, ricette e ingredienti
+    path("api/search/", lettura.ricerca, name="ricerca"),
+
+    # Endpoint per ottenere ricette e ristoranti cucinabili con gli ingredienti di una dispensa
+    path("api/pantry/", lettura.dispensa, name="dispensa"),
+
+    # Endpoint per ordinare le ricette in base agli ingredienti in comune con quelli indicati
+    path("api/ricette/match/", lettura.match_ricette, name="match_ricette"),
+
+    # Endpoint per la classifica degli ingredienti più usati dai ristoranti
+    path("api/stats/ingredienti/", lettura.statistiche_ingredienti, name="statistiche_ingredienti"),
+
+    # Endpoint per la classifica delle ricette cucinate da più ristoranti
+    path("api/stats/ricette/", lettura.statistiche_ricette, name="statistiche_ricette"),
+
+    # Endpoint per la classifica dei ristoranti per numero di ingredienti diversi
+    path("api/stats/ristoranti/", lettura.statistiche_ristoranti, name="statistiche_ristoranti"),
+
+    # Endpoint per ottenere le modifiche del catalogo successive a una sequenza
+    path("api/changes/", lettura.modifiche_catalogo, name="modifiche_catalogo"),
+
     # Endpoint per creare un nuovo ristorante
     path("api/ristoranti/create/", views.create_ristorante, name="create_ristorante"),
     
@@ -49,4 +80,19 @@ urlpatterns = [
     
     # Endpoint per eliminare un ingrediente esistente
     path("api/ingredienti/delete/", views.delete_ingrediente, name="delete_ingrediente"),
+
+    # Endpoint per creare, aggiornare ed eliminare più ristoranti in una sola richiesta
+    path("api/ristoranti/bulk/", views.bulk_ristoranti, name="bulk_ristoranti"),
+
+    # Endpoint per creare, aggiornare ed eliminare più ricette in una sola richiesta
+    path("api/ricette/bulk/", views.bulk_ricette, name="bulk_ricette"),
+
+    # Endpoint per creare, aggiornare ed eliminare più ingredienti in una sola richiesta
+    path("api/ingredienti/bulk/", views.bulk_ingredienti, name="bulk_ingredienti"),
+
+    # Endpoint per creare ed eliminare più collegamenti ristorante-ricetta in una sola richiesta
+    path("api/ristoranti-ricette/bulk/", views.bulk_ristoranti_ricette, name="bulk_ristoranti_ricette"),
+
+    # Endpoint per creare ed eliminare più collegamenti ricetta-ingrediente in una sola richiesta
+    path("api/ricette-ingredienti/bulk/", views.bulk_ricette_ingredienti, name="bulk_ricette_ingredienti"),
 ]
\ No newline at end of file
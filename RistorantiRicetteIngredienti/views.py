@@ -1,35 +1,91 @@
 import logging
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
-from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente
+from django.http import HttpResponseBadRequest, HttpResponse
+from django.db.models import F
+from django.views.decorators.csrf import csrf_exempt
+from .models import Ristorante, Ricetta, Ingrediente, RistoranteToRicetta, RicettaToIngrediente, campi_pubblici
+from .serialization import JsonResponse
+from . import metrics
+from .pagination import risposta_lista, campi_richiesti, _parametro_intero
+from .bulk import applica_entita, applica_collegamenti
+from .caching import risposta_in_cache
+from .ricerca import cerca, TIPI
+from .grafo import indice_dispensa, PUNTEGGI
+from .eliminazione import elimina, elimina_logicamente
+from . import menu, modifiche, statistiche
+from . import settings as app_settings
 import json
 
-logger = logging.getLogger('my_logger')
-logger.setLevel(logging.DEBUG)
+# gli handler (file e console, scritti da un thread in background) sono
+# configurati tramite LOGGING nel settings del progetto
+logger = logging.getLogger(__name__)
 
-# crea un formatter per definire il formato dei log
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-# crea un handler per scrivere i log su file
-file_handler = logging.FileHandler('app.log')
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(formatter)
+def _is_batch(request, nome):
+    """
+    Indica se la richiesta chiede più id insieme: POST con corpo JSON
+    oppure GET con una lista di id separati da virgola (es. ricetta_id=1,2,3).
+    """
+    return request.method == 'POST' or ',' in request.GET.get(nome, '')
 
-# crea uno stream handler per stampare i log sulla console
-console_handler = logging.StreamHandler()
-# il livello di logging può essere settato su uno dei seguenti valori:
-# - NOTSET
-# - DEBUG
-# - INFO
-# - WARNING
-# - ERROR
-# - CRITICAL
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(formatter)
+def _ids_batch(request, nome):
+    """
+    Legge la lista di id di una richiesta batch, senza duplicati.
+    Il corpo JSON può essere una lista di id oppure un oggetto {nome: [id, ...]}.
+    Solleva ValueError con il messaggio da restituire al client.
+    """
+    if request.method == 'POST':
+        try:
+            valori = json.loads(request.body)
+        except ValueError:
+            raise ValueError("Invalid JSON body")
+        if isinstance(valori, dict):
+            valori = valori.get(nome)
+        if not isinstance(valori, list):
+            raise ValueError(f"Missing '{nome}' list")
+    else:
+        valori = [v for v in request.GET.get(nome, '').split(',') if v.strip()]
+    try:
+        ids = list(dict.fromkeys(int(v) for v in valori))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid '{nome}' parameter")
+    if not ids:
+        raise ValueError(f"Missing '{nome}' parameter")
+    if len(ids) > app_settings.BATCH_SIZE_MAX:
+        raise ValueError(f"Too many ids in '{nome}' (max {app_settings.BATCH_SIZE_MAX})")
+    return ids
 
-# aggiunge gli handler al logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+def _risposta_batch(request, nome, modello, percorso, modello_collegato, distinct=False):
+    """
+    Modalità batch delle viste *_per_*: per ogni id di `modello` restituisce le righe
+    di `modello_collegato` raggiungibili tramite `percorso`, come {id: [righe]}.
+    Viene eseguita una sola query (LEFT JOIN sulle tabelle di collegamento);
+    gli id che non esistono non compaiono nella mappa.
+    """
+    try:
+        ids = _ids_batch(request, nome)
+    except ValueError as e:
+        logger.warning("Richiesta batch non valida: %s", e)
+        return HttpResponseBadRequest(str(e))
+    try:
+        campi = campi_richiesti(request, modello_collegato)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if campi is None:
+        campi = campi_pubblici(modello_collegato)
+    righe = modello.objects.filter(id__in=ids).values(
+        'id', f'{percorso}__deleted_at', *(f'{percorso}__{campo}' for campo in campi)
+    ).order_by('id', f'{percorso}__id')
+    if distinct:
+        righe = righe.distinct()
+    risultato = {}
+    for riga in righe:
+        collegati = risultato.setdefault(str(riga['id']), [])
+        # la join non passa dal manager: i collegati eliminati in modo logico si scartano qui
+        if riga[f'{percorso}__id'] is not None and riga[f'{percorso}__deleted_at'] is None:
+            collegati.append({campo: riga[f'{percorso}__{campo}'] for campo in campi})
+    logger.info("Richiesta batch per %s: %d id richiesti, %d trovati", nome, len(ids), len(risultato))
+    return JsonResponse(risultato)
 
 
 def index(request):
@@ -39,23 +95,123 @@ def index(request):
     logger.info("Accesso alla pagina di indice")
     return HttpResponse("Hello, world. You're at the restaurants/recipes/ingredients index.")
 
+def metriche(request):
+    """
+    Vista per le metriche delle richieste (istogrammi per route) nel formato
+    testuale di Prometheus. I valori sono quelli del processo che risponde.
+    Metodo: GET
+    """
+    if request.method == 'GET':
+        return HttpResponse(metrics.testo_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
 def lista_ristoranti(request):
     """
     Vista per ottenere la lista di tutti i ristoranti.
     Metodo: GET
+    Parametri opzionali:
+        - limit, after: paginazione a cursore sulla chiave primaria
+        - stream: se '1' la lista viene scritta in streaming
+        - fields: campi da restituire separati da virgola, oltre a 'id'
+          (es. fields=ristorante_text); vale anche per la modalità batch delle viste *_per_*
     """
     logger.info("Richiesta per ottenere la lista di tutti i ristoranti")
     ristoranti = Ristorante.objects.all().values()
-    return JsonResponse(list(ristoranti), safe=False)
+    return risposta_lista(request, ristoranti)
+
+def _profondita(request):
+    """Legge il parametro depth dei menu; solleva ValueError con il messaggio da restituire al client."""
+    try:
+        profondita = int(request.GET.get('depth', 2))
+    except ValueError:
+        profondita = None
+    if profondita not in menu.PROFONDITA:
+        raise ValueError("Invalid 'depth' parameter")
+    return profondita
+
+def _parametri_menu(request):
+    """
+    Legge depth, limit e after di menu_ristoranti.
+    Solleva ValueError con il messaggio da restituire al client.
+    """
+    profondita = _profondita(request)
+    try:
+        limite = _parametro_intero(request, 'limit')
+        dopo = _parametro_intero(request, 'after')
+    except ValueError:
+        raise ValueError("Invalid 'limit' or 'after' parameter")
+    if limite is None:
+        limite = app_settings.MENU_PAGE_SIZE_DEFAULT
+    return profondita, max(1, min(limite, app_settings.MENU_PAGE_SIZE_MAX)), dopo
+
+def menu_ristoranti(request):
+    """
+    Vista per ottenere i ristoranti con il loro menu: per ogni ristorante le
+    ricette e, per ogni ricetta, gli ingredienti. Il numero di query non
+    dipende dalla dimensione dei menu (vedi menu.py).
+    Metodo: GET
+    Parametri opzionali:
+        - depth: 1 per le sole ricette, 2 anche per gli ingredienti (default 2)
+        - limit: ristoranti per pagina (default MENU_PAGE_SIZE_DEFAULT, al più MENU_PAGE_SIZE_MAX)
+        - after: cursore ('next' della pagina precedente)
+    Risposta: {"results": [{"id", "ristorante_text", "ricette": [{"id", "ricetta_text",
+    "ingredienti": [{"id", "ingrediente_text"}]}]}], "next": cursore}
+    """
+    logger.info("Richiesta per ottenere i menu dei ristoranti")
+    if request.method == 'GET':
+        try:
+            profondita, limite, dopo = _parametri_menu(request)
+        except ValueError as e:
+            logger.warning("Parametri del menu non validi: %s", e)
+            return HttpResponseBadRequest(str(e))
+        risultati, successivo = menu.menu_ristoranti(limite, dopo, profondita)
+        return JsonResponse({'results': risultati, 'next': successivo})
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+def menu_ristorante(request, ristorante_id):
+    """
+    Vista per ottenere il menu di un ristorante, con ricette e ingredienti annidati.
+    Metodo: GET
+    Parametri:
+        - ristorante_id: ID del ristorante (nel percorso)
+        - depth: vedi menu_ristoranti
+    """
+    logger.info("Richiesta per ottenere il menu del ristorante %s", ristorante_id)
+    if request.method == 'GET':
+        try:
+            profondita = _profondita(request)
+        except ValueError as e:
+            logger.warning("Parametri del menu non validi: %s", e)
+            return HttpResponseBadRequest(str(e))
+        risultato = menu.menu_ristorante(ristorante_id, profondita)
+        if risultato is None:
+            logger.error("Ristorante con id %s non trovato", ristorante_id)
+            return JsonResponse({'error': 'Ristorante non trovato'}, status=404)
+        return JsonResponse(risultato)
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
 
+@csrf_exempt
+@risposta_in_cache('ricetta_id')
 def ristoranti_per_ricetta(request):
     """
     Vista per ottenere i ristoranti che cucinano una specifica ricetta.
-    Metodo: GET
+    Metodo: GET (POST per la modalità batch)
     Parametri:
         - ricetta_id: ID della ricetta
+        - limit, after, stream, fields: vedi lista_ristoranti
+    Modalità batch: più id separati da virgola (es. ricetta_id=1,2,3) oppure in POST
+    un corpo JSON [1, 2, 3] o {"ricetta_id": [1, 2, 3]}; la risposta è {id: [righe]}
+    e gli id inesistenti non compaiono nella mappa.
     """
     logger.info("Richiesta per ottenere i ristoranti che cucinano una specifica ricetta")
+    if _is_batch(request, 'ricetta_id'):
+        return _risposta_batch(request, 'ricetta_id', Ricetta, 'ristorantetoricetta__ristorante', Ristorante)
     if request.method == 'GET':
         ricetta_id = request.GET.get('ricetta_id')
         if not ricetta_id:
@@ -64,23 +220,31 @@ def ristoranti_per_ricetta(request):
         try:
             ricetta = Ricetta.objects.get(id=ricetta_id)
             ristoranti = Ristorante.objects.filter(ristorantetoricetta__ricetta=ricetta).values()
-            logger.info(f"Ristoranti trovati per la ricetta {ricetta_id}: {list(ristoranti)}")
-            return JsonResponse(list(ristoranti), safe=False)
+            logger.info("Richiesta ristoranti per la ricetta %s", ricetta_id)
+            return risposta_lista(request, ristoranti)
         except Ricetta.DoesNotExist:
-            logger.error(f"Ricetta con id {ricetta_id} non trovata")
+            logger.error("Ricetta con id %s non trovata", ricetta_id)
             return JsonResponse({'error': 'Ricetta non trovata'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
         return HttpResponseBadRequest("Invalid request method")
 
+@csrf_exempt
+@risposta_in_cache('ristorante_id')
 def ricette_per_ristorante(request):
     """
     Vista per ottenere le ricette relative ad un ristorante specificato.
-    Metodo: GET
+    Metodo: GET (POST per la modalità batch)
     Parametri:
         - ristorante_id: ID del ristorante
+        - limit, after, stream, fields: vedi lista_ristoranti
+    Modalità batch: più id separati da virgola (es. ristorante_id=1,2,3) oppure in POST
+    un corpo JSON [1, 2, 3] o {"ristorante_id": [1, 2, 3]}; la risposta è {id: [righe]}
+    e gli id inesistenti non compaiono nella mappa.
     """
     logger.info("Richiesta per ottenere le ricette relative ad un ristorante specificato")
+    if _is_batch(request, 'ristorante_id'):
+        return _risposta_batch(request, 'ristorante_id', Ristorante, 'ristorantetoricetta__ricetta', Ricetta)
     if request.method == 'GET':
         ristorante_id = request.GET.get('ristorante_id')
         if not ristorante_id:
@@ -89,23 +253,31 @@ def ricette_per_ristorante(request):
         try:
             ristorante = Ristorante.objects.get(id=ristorante_id)
             ricette = Ricetta.objects.filter(ristorantetoricetta__ristorante=ristorante).values()
-            logger.info(f"Ricette trovate per il ristorante {ristorante_id}: {list(ricette)}")
-            return JsonResponse(list(ricette), safe=False)
+            logger.info("Richiesta ricette per il ristorante %s", ristorante_id)
+            return risposta_lista(request, ricette)
         except Ristorante.DoesNotExist:
-            logger.error(f"Ristorante con id {ristorante_id} non trovato")
+            logger.error("Ristorante con id %s non trovato", ristorante_id)
             return JsonResponse({'error': 'Ristorante non trovato'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
         return HttpResponseBadRequest("Invalid request method")
 
+@csrf_exempt
+@risposta_in_cache('ingrediente_id')
 def ricette_per_ingrediente(request):
     """
     Vista per ottenere le ricette che contengono un ingrediente specificato.
-    Metodo: GET
+    Metodo: GET (POST per la modalità batch)
     Parametri:
         - ingrediente_id: ID dell'ingrediente
+        - limit, after, stream, fields: vedi lista_ristoranti
+    Modalità batch: più id separati da virgola (es. ingrediente_id=1,2,3) oppure in POST
+    un corpo JSON [1, 2, 3] o {"ingrediente_id": [1, 2, 3]}; la risposta è {id: [righe]}
+    e gli id inesistenti non compaiono nella mappa.
     """
     logger.info("Richiesta per ottenere le ricette che contengono un ingrediente specificato")
+    if _is_batch(request, 'ingrediente_id'):
+        return _risposta_batch(request, 'ingrediente_id', Ingrediente, 'ricettatoingrediente__ricetta', Ricetta)
     if request.method == 'GET':
         ingrediente_id = request.GET.get('ingrediente_id')
         if not ingrediente_id:
@@ -114,23 +286,31 @@ def ricette_per_ingrediente(request):
         try:
             ingrediente = Ingrediente.objects.get(id=ingrediente_id)
             ricette = Ricetta.objects.filter(ricettatoingrediente__ingrediente=ingrediente).values()
-            logger.info(f"Ricette trovate per l'ingrediente {ingrediente_id}: {list(ricette)}")
-            return JsonResponse(list(ricette), safe=False)
+            logger.info("Richiesta ricette per l'ingrediente %s", ingrediente_id)
+            return risposta_lista(request, ricette)
         except Ingrediente.DoesNotExist:
-            logger.error(f"Ingrediente con id {ingrediente_id} non trovato")
+            logger.error("Ingrediente con id %s non trovato", ingrediente_id)
             return JsonResponse({'error': 'Ingrediente non trovato'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
         return HttpResponseBadRequest("Invalid request method")
     
+@csrf_exempt
+@risposta_in_cache('ricetta_id')
 def ingredienti_per_ricetta(request):
     """
     Vista per ottenere gli ingredienti relativi ad una ricetta specificata.
-    Metodo: GET
+    Metodo: GET (POST per la modalità batch)
     Parametri:
         - ricetta_id: ID della ricetta
+        - limit, after, stream, fields: vedi lista_ristoranti
+    Modalità batch: più id separati da virgola (es. ricetta_id=1,2,3) oppure in POST
+    un corpo JSON [1, 2, 3] o {"ricetta_id": [1, 2, 3]}; la risposta è {id: [righe]}
+    e gli id inesistenti non compaiono nella mappa.
     """
     logger.info("Richiesta per ottenere gli ingredienti relativi ad una ricetta specificata")
+    if _is_batch(request, 'ricetta_id'):
+        return _risposta_batch(request, 'ricetta_id', Ricetta, 'ricettatoingrediente__ingrediente', Ingrediente)
     if request.method == 'GET':
         ricetta_id = request.GET.get('ricetta_id')
         if not ricetta_id:
@@ -139,38 +319,285 @@ def ingredienti_per_ricetta(request):
         try:
             ricetta = Ricetta.objects.get(id=ricetta_id)
             ingredienti = Ingrediente.objects.filter(ricettatoingrediente__ricetta=ricetta).values()
-            logger.info(f"Ingredienti trovati per la ricetta {ricetta_id}: {list(ingredienti)}")
-            return JsonResponse(list(ingredienti), safe=False)
+            logger.info("Richiesta ingredienti per la ricetta %s", ricetta_id)
+            return risposta_lista(request, ingredienti)
         except Ricetta.DoesNotExist:
-            logger.error(f"Ricetta con id {ricetta_id} non trovata")
+            logger.error("Ricetta con id %s non trovata", ricetta_id)
             return JsonResponse({'error': 'Ricetta non trovata'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
         return HttpResponseBadRequest("Invalid request method")
 
+@csrf_exempt
+@risposta_in_cache('ristorante_id')
 def ingredienti_per_ristorante(request):
     """
-    Vista per ottenere gli ingredienti utilizzati in uno specifico ristorante
-    Metodo: GET
+    Vista per ottenere gli ingredienti utilizzati in uno specifico ristorante.
+    Ogni ingrediente compare una sola volta, anche se usato da più ricette.
+    Metodo: GET (POST per la modalità batch)
     Parametri:
         - ristorante_id: ID del ristorante
+        - recipe_count: se '1' aggiunge ad ogni ingrediente il numero di ricette
+          del ristorante che lo utilizzano
+        - limit, after, stream, fields: vedi lista_ristoranti
+    Modalità batch: più id separati da virgola (es. ristorante_id=1,2,3) oppure in POST
+    un corpo JSON [1, 2, 3] o {"ristorante_id": [1, 2, 3]}; la risposta è {id: [righe]}
+    e gli id inesistenti non compaiono nella mappa.
     """
     logger.info("Richiesta per ottenere gli ingredienti utilizzati in uno specifico ristorante")
+    if _is_batch(request, 'ristorante_id'):
+        return _risposta_batch(request, 'ristorante_id', Ristorante, 'ristoranteingrediente__ingrediente', Ingrediente)
     if request.method == 'GET':
         ristorante_id = request.GET.get('ristorante_id')
         if not ristorante_id:
             logger.warning("Parametro 'ristorante_id' mancante")
             return HttpResponseBadRequest("Missing 'ristorante_id' parameter")
-        try:
-            ristorante = Ristorante.objects.get(id=ristorante_id)
-            ricette = Ricetta.objects.filter(ristorantetoricetta__ristorante=ristorante)
-            logger.info(f"Ricette trovate per il ristorante {ristorante_id}: {list(ricette)}")
-            ingredienti = Ingrediente.objects.filter(ricettatoingrediente__ricetta__in=ricette).values()
-            logger.info(f"Ingredienti trovati per il ristorante {ristorante_id}: {list(ingredienti)}")
-            return JsonResponse(list(ingredienti), safe=False)
-        except Ristorante.DoesNotExist:
-            logger.error(f"Ristorante con id {ristorante_id} non trovato")
+        # scansione dell'indice (ristorante, ingrediente) della tabella materializzata;
+        # la join sul ristorante esclude quelli eliminati in modo logico
+        ingredienti = Ingrediente.objects.filter(
+            ristoranteingrediente__ristorante_id=ristorante_id,
+            ristoranteingrediente__ristorante__deleted_at__isnull=True,
+        ).values('id', 'ingrediente_text')
+        if request.GET.get('recipe_count') == '1':
+            ingredienti = ingredienti.annotate(recipe_count=F('ristoranteingrediente__recipe_count'))
+
+        def ristorante_mancante():
+            # un risultato non vuoto implica che il ristorante esiste:
+            # la verifica serve solo quando la join non restituisce righe
+            if Ristorante.objects.filter(id=ristorante_id).exists():
+                return None
+            logger.error("Ristorante con id %s non trovato", ristorante_id)
             return JsonResponse({'error': 'Ristorante non trovato'}, status=404)
+
+        logger.info("Richiesta ingredienti per il ristorante %s", ristorante_id)
+        return risposta_lista(request, ingredienti, se_vuoto=ristorante_mancante)
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+def ricerca(request):
+    """
+    Vista per la ricerca full-text su ristoranti, ricette e ingredienti,
+    con risultati ordinati per rilevanza.
+    Metodo: GET
+    Parametri:
+        - q: testo da cercare; l'ultima parola è cercata come prefisso
+        - tipo: facoltativo, uno o più tra ristorante, ricetta, ingrediente separati da virgola
+        - prefix: '0' per cercare anche l'ultima parola per intero
+        - limit: numero massimo di risultati (default SEARCH_LIMIT_DEFAULT)
+    """
+    logger.info("Richiesta di ricerca full-text")
+    if request.method == 'GET':
+        testo = request.GET.get('q', '').strip()
+        if not testo:
+            logger.warning("Parametro 'q' mancante")
+            return HttpResponseBadRequest("Missing 'q' parameter")
+        tipi = [tipo for tipo in request.GET.get('tipo', '').split(',') if tipo]
+        if any(tipo not in TIPI for tipo in tipi):
+            logger.warning("Parametro 'tipo' non valido: %s", tipi)
+            return HttpResponseBadRequest("Invalid 'tipo' parameter")
+        try:
+            limite = int(request.GET.get('limit', app_settings.SEARCH_LIMIT_DEFAULT))
+        except ValueError:
+            logger.warning("Parametro 'limit' non valido")
+            return HttpResponseBadRequest("Invalid 'limit' parameter")
+        limite = max(1, min(limite, app_settings.SEARCH_LIMIT_MAX))
+        risultati = cerca(testo, tipi, limite, prefisso=request.GET.get('prefix') != '0')
+        logger.info("Ricerca '%s': %d risultati", testo, len(risultati))
+        return JsonResponse(risultati, safe=False)
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+@csrf_exempt
+def dispensa(request):
+    """
+    Vista per sapere cosa si può cucinare con gli ingredienti di una dispensa:
+    ricette e ristoranti (tutto il menu) cucinabili per intero, e quelli a cui
+    mancano pochi ingredienti, con l'elenco degli ingredienti mancanti.
+    Metodo: GET (oppure POST per dispense grandi)
+    Parametri:
+        - ingredienti: ID degli ingredienti separati da virgola, oppure in POST
+          un corpo JSON [1, 2, 3] o {"ingredienti": [1, 2, 3]}
+        - max_mancanti: numero massimo di ingredienti mancanti (default 1)
+        - limit: numero massimo di elementi per ogni lista (default PANTRY_LIMIT_DEFAULT)
+    """
+    logger.info("Richiesta per le ricette cucinabili con una dispensa")
+    if request.method not in ('GET', 'POST'):
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        ingredienti = _ids_batch(request, 'ingredienti')
+    except ValueError as e:
+        logger.warning("Dispensa non valida: %s", e)
+        return HttpResponseBadRequest(str(e))
+    try:
+        max_mancanti = int(request.GET.get('max_mancanti', 1))
+        limite = int(request.GET.get('limit', app_settings.PANTRY_LIMIT_DEFAULT))
+    except ValueError:
+        logger.warning("Parametri 'max_mancanti' o 'limit' non validi")
+        return HttpResponseBadRequest("Invalid 'max_mancanti' or 'limit' parameter")
+    max_mancanti = max(0, min(max_mancanti, app_settings.PANTRY_MAX_MISSING))
+    limite = max(1, min(limite, app_settings.PAGE_SIZE_MAX))
+    risultato = indice_dispensa().interroga(ingredienti, max_mancanti, limite)
+    logger.info("Dispensa di %d ingredienti: %d ricette cucinabili", len(ingredienti), len(risultato['ricette']))
+    return JsonResponse(risultato)
+
+def _parametri_match(request):
+    """
+    Legge punteggio e limit di match_ricette.
+    Solleva ValueError con il messaggio da restituire al client.
+    """
+    punteggio = request.GET.get('punteggio', 'comuni')
+    if punteggio not in PUNTEGGI:
+        raise ValueError(f"Invalid 'punteggio' parameter (expected {', '.join(PUNTEGGI)})")
+    try:
+        limite = int(request.GET.get('limit', app_settings.MATCH_LIMIT_DEFAULT))
+    except ValueError:
+        raise ValueError("Invalid 'limit' parameter")
+    return punteggio, max(1, min(limite, app_settings.PAGE_SIZE_MAX))
+
+def _con_nomi(abbinate):
+    """Aggiunge ricetta_text alle ricette abbinate, con una sola query."""
+    nomi = dict(Ricetta.objects.filter(id__in=[r['id'] for r in abbinate]).values_list('id', 'ricetta_text'))
+    # le ricette eliminate in modo logico restano nell'indice fino all'eliminazione dei collegamenti
+    return [{'id': r['id'], 'ricetta_text': nomi[r['id']], **r} for r in abbinate if r['id'] in nomi]
+
+@csrf_exempt
+def match_ricette(request):
+    """
+    Vista per ordinare le ricette in base agli ingredienti in comune con quelli
+    indicati, tramite l'indice invertito ingrediente -> ricette.
+    Metodo: GET (oppure POST per liste grandi)
+    Parametri:
+        - ingredienti: ID degli ingredienti separati da virgola, oppure in POST
+          un corpo JSON [1, 2, 3] o {"ingredienti": [1, 2, 3]}
+        - punteggio: 'comuni' (numero di ingredienti in comune, default),
+          'jaccard' (comuni / ingredienti distinti tra ricetta e richiesta) o
+          'copertura' (comuni / ingredienti della ricetta)
+        - limit: numero massimo di ricette (default MATCH_LIMIT_DEFAULT)
+    Risposta: {"ricette": [{"id", "ricetta_text", "comuni", "jaccard", "copertura"}, ...]}
+    """
+    logger.info("Richiesta per le ricette con più ingredienti in comune")
+    if request.method not in ('GET', 'POST'):
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        ingredienti = _ids_batch(request, 'ingredienti')
+        punteggio, limite = _parametri_match(request)
+    except ValueError as e:
+        logger.warning("Richiesta di abbinamento non valida: %s", e)
+        return HttpResponseBadRequest(str(e))
+    abbinate = indice_dispensa().abbina(ingredienti, punteggio, limite)
+    logger.info("Abbinamento di %d ingredienti: %d ricette", len(ingredienti), len(abbinate))
+    return JsonResponse({'ricette': _con_nomi(abbinate)})
+
+def _parametri_statistiche(request):
+    """
+    Legge limit e offset delle classifiche di api/stats/.
+    Solleva ValueError con il messaggio da restituire al client.
+    """
+    try:
+        limite = int(request.GET.get('limit', app_settings.STATS_LIMIT_DEFAULT))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        raise ValueError("Invalid 'limit' or 'offset' parameter")
+    if offset < 0:
+        raise ValueError("Invalid 'limit' or 'offset' parameter")
+    return max(1, min(limite, app_settings.PAGE_SIZE_MAX)), offset
+
+def _risposta_statistiche(request, nome):
+    if request.method != 'GET':
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        limite, offset = _parametri_statistiche(request)
+    except ValueError as e:
+        logger.warning("Parametri della classifica non validi: %s", e)
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse(statistiche.pagina(nome, limite, offset))
+
+def statistiche_ingredienti(request):
+    """
+    Vista per la classifica degli ingredienti più usati: per ogni ingrediente
+    il numero di ristoranti che lo usano e di ricette dei loro menu che lo
+    contengono, in ordine decrescente. I numeri sono ricalcolati ogni
+    STATS_MAX_AGE secondi (vedi statistiche.py).
+    Metodo: GET
+    Parametri:
+        - limit: numero di elementi (default STATS_LIMIT_DEFAULT)
+        - offset: posizione del primo elemento in classifica (default 0)
+    Risposta: {"ingredienti": [{"id", "ingrediente_text", "ristoranti", "ricette"}, ...],
+    "totale", "aggiornato"}
+    """
+    logger.info("Richiesta per la classifica degli ingredienti")
+    return _risposta_statistiche(request, 'ingredienti')
+
+def statistiche_ricette(request):
+    """
+    Vista per la classifica delle ricette per numero di ristoranti che le cucinano.
+    Metodo: GET
+    Parametri: vedi statistiche_ingredienti
+    Risposta: {"ricette": [{"id", "ricetta_text", "ristoranti"}, ...], "totale", "aggiornato"}
+    """
+    logger.info("Richiesta per la classifica delle ricette")
+    return _risposta_statistiche(request, 'ricette')
+
+def statistiche_ristoranti(request):
+    """
+    Vista per la classifica dei ristoranti per numero di ingredienti diversi usati.
+    Metodo: GET
+    Parametri: vedi statistiche_ingredienti
+    Risposta: {"ristoranti": [{"id", "ristorante_text", "ingredienti"}, ...], "totale", "aggiornato"}
+    """
+    logger.info("Richiesta per la classifica dei ristoranti")
+    return _risposta_statistiche(request, 'ristoranti')
+
+def _parametri_modifiche(request):
+    """
+    Legge since e limit di api/changes/.
+    Solleva ValueError con il messaggio da restituire al client.
+    """
+    try:
+        dopo = _parametro_intero(request, 'since')
+        limite = _parametro_intero(request, 'limit')
+    except ValueError:
+        raise ValueError("Invalid 'since' or 'limit' parameter")
+    if limite is None:
+        limite = app_settings.PAGE_SIZE_DEFAULT
+    return dopo, max(1, min(limite, app_settings.PAGE_SIZE_MAX))
+
+def _sequenza_scaduta(e):
+    logger.warning("Sequenza %s precedente all'orizzonte del registro delle modifiche", e.sequenza)
+    return JsonResponse({'error': 'Sequenza non più disponibile: riscaricare il catalogo', 'next': e.corrente}, status=410)
+
+def modifiche_catalogo(request):
+    """
+    Vista per ottenere le modifiche del catalogo successive a una sequenza, per
+    aggiornare una copia locale senza riscaricarlo (vedi modifiche.py). Per
+    ogni oggetto modificato restituisce solo la modifica più recente, con la
+    riga attuale per inserimenti e aggiornamenti.
+    Metodo: GET
+    Parametri opzionali:
+        - since: sequenza dell'ultima modifica applicata ('next' della risposta
+          precedente); senza since restituisce solo la sequenza corrente, da
+          leggere prima di scaricare il catalogo
+        - limit: modifiche per pagina (default PAGE_SIZE_DEFAULT, al più PAGE_SIZE_MAX)
+    Risposta: {"results": [{"seq", "model", "op", "id", "data"}], "next": sequenza, "more": bool};
+    per i collegamenti data contiene i due id e manca id. 410 se since precede
+    l'orizzonte della compattazione.
+    """
+    logger.info("Richiesta per ottenere le modifiche del catalogo")
+    if request.method == 'GET':
+        try:
+            dopo, limite = _parametri_modifiche(request)
+        except ValueError as e:
+            logger.warning("Parametri delle modifiche non validi: %s", e)
+            return HttpResponseBadRequest(str(e))
+        try:
+            return JsonResponse(modifiche.pagina(dopo, limite))
+        except modifiche.SequenzaScaduta as e:
+            return _sequenza_scaduta(e)
     else:
         logger.warning("Metodo di richiesta non valido")
         return HttpResponseBadRequest("Invalid request method")
@@ -189,7 +616,7 @@ def create_ristorante(request):
             logger.warning("Parametro 'ristorante_text' mancante")
             return HttpResponseBadRequest("Missing 'ristorante_text' parameter")
         ristorante = Ristorante.objects.create(ristorante_text=ristorante_text)
-        logger.info(f"Ristorante creato: {ristorante.id}, {ristorante.ristorante_text}")
+        logger.info("Ristorante creato: %s, %s", ristorante.id, ristorante.ristorante_text)
         return JsonResponse({'id': ristorante.id, 'ristorante_text': ristorante.ristorante_text})
     else:
         logger.warning("Metodo di richiesta non valido")
@@ -220,21 +647,34 @@ def update_ristorante(request):
             ristorante = Ristorante.objects.get(id=ristorante_id)
             ristorante.ristorante_text = ristorante_text
             ristorante.save()
-            logger.info(f"Ristorante aggiornato: {ristorante.id}, {ristorante.ristorante_text}")
+            logger.info("Ristorante aggiornato: %s, %s", ristorante.id, ristorante.ristorante_text)
             return JsonResponse({'id': ristorante.id, 'ristorante_text': ristorante.ristorante_text})
         except Ristorante.DoesNotExist:
-            logger.error(f"Ristorante con id {ristorante_id} non trovato")
+            logger.error("Ristorante con id %s non trovato", ristorante_id)
             return JsonResponse({'error': 'Ristorante non trovato'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
         return HttpResponseBadRequest("Invalid request method")
 
+def _elimina(request, modello, id_oggetto):
+    """
+    Elimina l'oggetto con i suoi collegamenti tramite DELETE sugli insiemi di id,
+    in un'unica transazione; con soft=1 lo marca soltanto come eliminato, e i
+    collegamenti vengono eliminati in seguito a blocchi (comando purge_deleted).
+    """
+    if request.GET.get('soft') == '1':
+        elimina_logicamente(modello, [id_oggetto])
+    else:
+        elimina(modello, [id_oggetto])
+
 def delete_ristorante(request):
     """
     Vista per eliminare un ristorante esistente.
     Metodo: GET
     Parametri:
         - ristorante_id: ID del ristorante
+        - soft: se '1' il ristorante sparisce subito dalle letture, ma viene
+          eliminato con i suoi collegamenti in seguito (comando purge_deleted)
     """
     logger.info("Richiesta per eliminare un ristorante esistente")
     if request.method == 'GET':
@@ -244,15 +684,15 @@ def delete_ristorante(request):
             return HttpResponseBadRequest("Missing 'ristorante_id' parameter")
         try:
             ristorante = Ristorante.objects.get(id=ristorante_id)
-            ristorante.delete()
-            logger.info(f"Ristorante eliminato: {ristorante.id}, {ristorante.ristorante_text}")
+            _elimina(request, Ristorante, ristorante.id)
+            logger.info("Ristorante eliminato: %s, %s", ristorante.id, ristorante.ristorante_text)
             return JsonResponse({
                 'message': 'Ristorante deleted',
                 'id': ristorante_id,
                 'ristorante_text': ristorante.ristorante_text
             })
         except Ristorante.DoesNotExist:
-            logger.error(f"Ristorante con id {ristorante_id} non trovato")
+            logger.error("Ristorante con id %s non trovato", ristorante_id)
             return JsonResponse({'error': 'Ristorante non trovato'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
@@ -272,7 +712,7 @@ def create_ricetta(request):
             logger.warning("Parametro 'ricetta_text' mancante")
             return HttpResponseBadRequest("Missing 'ricetta_text' parameter")
         ricetta = Ricetta.objects.create(ricetta_text=ricetta_text)
-        logger.info(f"Ricetta creata: {ricetta.id}, {ricetta.ricetta_text}")
+        logger.info("Ricetta creata: %s, %s", ricetta.id, ricetta.ricetta_text)
         return JsonResponse({'id': ricetta.id, 'ricetta_text': ricetta.ricetta_text})
     else:
         logger.warning("Metodo di richiesta non valido")
@@ -303,10 +743,10 @@ def update_ricetta(request):
             ricetta = Ricetta.objects.get(id=ricetta_id)
             ricetta.ricetta_text = ricetta_text
             ricetta.save()
-            logger.info(f"Ricetta aggiornata: {ricetta.id}, {ricetta.ricetta_text}")
+            logger.info("Ricetta aggiornata: %s, %s", ricetta.id, ricetta.ricetta_text)
             return JsonResponse({'id': ricetta.id, 'ricetta_text': ricetta.ricetta_text})
         except Ricetta.DoesNotExist:
-            logger.error(f"Ricetta con id {ricetta_id} non trovata")
+            logger.error("Ricetta con id %s non trovata", ricetta_id)
             return JsonResponse({'error': 'Ricetta non trovata'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
@@ -318,6 +758,7 @@ def delete_ricetta(request):
     Metodo: GET
     Parametri:
         - ricetta_id: ID della ricetta
+        - soft: vedi delete_ristorante
     """
     logger.info("Richiesta per eliminare una ricetta esistente")
     if request.method == 'GET':
@@ -327,11 +768,11 @@ def delete_ricetta(request):
             return HttpResponseBadRequest("Missing 'ricetta_id' parameter")
         try:
             ricetta = Ricetta.objects.get(id=ricetta_id)
-            ricetta.delete()
-            logger.info(f"Ricetta eliminata: {ricetta.id}, {ricetta.ricetta_text}")
+            _elimina(request, Ricetta, ricetta.id)
+            logger.info("Ricetta eliminata: %s, %s", ricetta.id, ricetta.ricetta_text)
             return JsonResponse({'message': 'Ricetta deleted', 'id': ricetta_id, 'ricetta_text': ricetta.ricetta_text})
         except Ricetta.DoesNotExist:
-            logger.error(f"Ricetta con id {ricetta_id} non trovata")
+            logger.error("Ricetta con id %s non trovata", ricetta_id)
             return JsonResponse({'error': 'Ricetta non trovata'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
@@ -351,7 +792,7 @@ def create_ingrediente(request):
             logger.warning("Parametro 'ingrediente_text' mancante")
             return HttpResponseBadRequest("Missing 'ingrediente_text' parameter")
         ingrediente = Ingrediente.objects.create(ingrediente_text=ingrediente_text)
-        logger.info(f"Ingrediente creato: {ingrediente.id}, {ingrediente.ingrediente_text}")
+        logger.info("Ingrediente creato: %s, %s", ingrediente.id, ingrediente.ingrediente_text)
         return JsonResponse({'id': ingrediente.id, 'ingrediente_text': ingrediente.ingrediente_text})
     else:
         logger.warning("Metodo di richiesta non valido")
@@ -382,10 +823,10 @@ def update_ingrediente(request):
             ingrediente = Ingrediente.objects.get(id=ingrediente_id)
             ingrediente.ingrediente_text = ingrediente_text
             ingrediente.save()
-            logger.info(f"Ingrediente aggiornato: {ingrediente.id}, {ingrediente.ingrediente_text}")
+            logger.info("Ingrediente aggiornato: %s, %s", ingrediente.id, ingrediente.ingrediente_text)
             return JsonResponse({'id': ingrediente.id, 'ingrediente_text': ingrediente.ingrediente_text})
         except Ingrediente.DoesNotExist:
-            logger.error(f"Ingrediente con id {ingrediente_id} non trovato")
+            logger.error("Ingrediente con id %s non trovato", ingrediente_id)
             return JsonResponse({'error': 'Ingrediente non trovato'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
@@ -397,6 +838,7 @@ def delete_ingrediente(request):
     Metodo: GET
     Parametri:
         - ingrediente_id: ID dell'ingrediente
+        - soft: vedi delete_ristorante
     """
     logger.info("Richiesta per eliminare un ingrediente esistente")
     if request.method == 'GET':
@@ -406,12 +848,94 @@ def delete_ingrediente(request):
             return HttpResponseBadRequest("Missing 'ingrediente_id' parameter")
         try:
             ingrediente = Ingrediente.objects.get(id=ingrediente_id)
-            ingrediente.delete()
-            logger.info(f"Ingrediente eliminato: {ingrediente.id}, {ingrediente.ingrediente_text}")
+            _elimina(request, Ingrediente, ingrediente.id)
+            logger.info("Ingrediente eliminato: %s, %s", ingrediente.id, ingrediente.ingrediente_text)
             return JsonResponse({'message': 'Ingrediente deleted', 'id': ingrediente_id, 'ingrediente_text': ingrediente.ingrediente_text})
         except Ingrediente.DoesNotExist:
-            logger.error(f"Ingrediente con id {ingrediente_id} non trovato")
+            logger.error("Ingrediente con id %s non trovato", ingrediente_id)
             return JsonResponse({'error': 'Ingrediente non trovato'}, status=404)
     else:
         logger.warning("Metodo di richiesta non valido")
-        return HttpResponseBadRequest("Invalid request method")
\ No newline at end of file
+        return HttpResponseBadRequest("Invalid request method")
+
+def _risposta_bulk(request, funzione, modello):
+    """
+    Gestisce una richiesta bulk: legge dal corpo JSON la lista di operazioni,
+    le applica in un'unica transazione e restituisce l'esito di ognuna.
+    """
+    if request.method != 'POST':
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        elementi = json.loads(request.body)
+    except ValueError:
+        logger.warning("Corpo JSON non valido")
+        return HttpResponseBadRequest("Invalid JSON body")
+    if not isinstance(elementi, list):
+        logger.warning("Il corpo della richiesta bulk non è una lista")
+        return HttpResponseBadRequest("Expected a JSON array")
+    if len(elementi) > app_settings.BULK_SIZE_MAX:
+        logger.warning("Richiesta bulk troppo grande: %d elementi", len(elementi))
+        return HttpResponseBadRequest(f"Too many items (max {app_settings.BULK_SIZE_MAX})")
+    risultati = funzione(modello, elementi)
+    errori = sum(1 for esito in risultati if esito['status'] == 'error')
+    logger.info("Operazioni bulk su %s: %d elementi, %d errori", modello.__name__, len(risultati), errori)
+    return JsonResponse({'results': risultati})
+
+@csrf_exempt
+def bulk_ristoranti(request):
+    """
+    Vista per creare, aggiornare ed eliminare più ristoranti in una sola transazione.
+    Metodo: POST
+    Corpo JSON: lista di operazioni, ad esempio
+        [{"op": "create", "ristorante_text": "Da Mario", "ricette": [1, 2]},
+         {"op": "update", "id": 3, "ristorante_text": "Da Luigi"},
+         {"op": "delete", "id": 4}]
+    'ricette' (facoltativo) collega le ricette indicate al ristorante.
+    """
+    logger.info("Richiesta bulk sui ristoranti")
+    return _risposta_bulk(request, applica_entita, Ristorante)
+
+@csrf_exempt
+def bulk_ricette(request):
+    """
+    Vista per creare, aggiornare ed eliminare più ricette in una sola transazione.
+    Metodo: POST
+    Corpo JSON: lista di operazioni come per bulk_ristoranti, con 'ricetta_text';
+    'ristoranti' e 'ingredienti' (facoltativi) collegano la ricetta agli id indicati.
+    """
+    logger.info("Richiesta bulk sulle ricette")
+    return _risposta_bulk(request, applica_entita, Ricetta)
+
+@csrf_exempt
+def bulk_ingredienti(request):
+    """
+    Vista per creare, aggiornare ed eliminare più ingredienti in una sola transazione.
+    Metodo: POST
+    Corpo JSON: lista di operazioni come per bulk_ristoranti, con 'ingrediente_text';
+    'ricette' (facoltativo) collega l'ingrediente alle ricette indicate.
+    """
+    logger.info("Richiesta bulk sugli ingredienti")
+    return _risposta_bulk(request, applica_entita, Ingrediente)
+
+@csrf_exempt
+def bulk_ristoranti_ricette(request):
+    """
+    Vista per creare ed eliminare più collegamenti ristorante-ricetta in una sola transazione.
+    Metodo: POST
+    Corpo JSON: [{"op": "create", "ristorante_id": 1, "ricetta_id": 2},
+                 {"op": "delete", "ristorante_id": 1, "ricetta_id": 3}]
+    """
+    logger.info("Richiesta bulk sui collegamenti ristorante-ricetta")
+    return _risposta_bulk(request, applica_collegamenti, RistoranteToRicetta)
+
+@csrf_exempt
+def bulk_ricette_ingredienti(request):
+    """
+    Vista per creare ed eliminare più collegamenti ricetta-ingrediente in una sola transazione.
+    Metodo: POST
+    Corpo JSON: [{"op": "create", "ricetta_id": 1, "ingrediente_id": 2},
+                 {"op": "delete", "ricetta_id": 1, "ingrediente_id": 3}]
+    """
+    logger.info("Richiesta bulk sui collegamenti ricetta-ingrediente")
+    return _risposta_bulk(request, applica_collegamenti, RicettaToIngrediente)
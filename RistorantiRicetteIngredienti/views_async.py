@@ -0,0 +1,394 @@
+"""
+Varianti asincrone delle viste di lettura, usate al posto di quelle di views.py
+quando ASYNC_VIEWS è attivo (profilo ASGI, vedi PyDjango/settings_asgi.py).
+
+Parametri, risposte e messaggi sono gli stessi delle viste sincrone: cambia solo
+l'accesso al database, fatto con l'ORM asincrono (aget, aexists, async for), così
+sotto un server ASGI l'event loop resta libero mentre le query sono in corso.
+Le viste mantengono i nomi di quelle sincrone, che sono anche i nomi usati
+dalle chiavi della cache: l'invalidazione vale per entrambe le versioni.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.http import HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+
+from .models import Ristorante, Ricetta, Ingrediente, campi_pubblici
+from .serialization import JsonResponse
+from .pagination import risposta_lista_async, campi_richiesti
+from .caching import risposta_in_cache
+from .ricerca import cerca, TIPI
+from .grafo import indice_dispensa
+from .views import (
+    _is_batch, _ids_batch, _parametri_match, _con_nomi, _parametri_statistiche, _profondita, _parametri_menu,
+    _parametri_modifiche, _sequenza_scaduta,
+)
+from . import menu, modifiche, statistiche
+from . import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+
+async def _risposta_batch(request, nome, modello, percorso, modello_collegato, distinct=False):
+    """Versione asincrona di views._risposta_batch: una sola query, risposta {id: [righe]}."""
+    try:
+        ids = _ids_batch(request, nome)
+    except ValueError as e:
+        logger.warning("Richiesta batch non valida: %s", e)
+        return HttpResponseBadRequest(str(e))
+    try:
+        campi = campi_richiesti(request, modello_collegato)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if campi is None:
+        campi = campi_pubblici(modello_collegato)
+    righe = modello.objects.filter(id__in=ids).values(
+        'id', f'{percorso}__deleted_at', *(f'{percorso}__{campo}' for campo in campi)
+    ).order_by('id', f'{percorso}__id')
+    if distinct:
+        righe = righe.distinct()
+    risultato = {}
+    async for riga in righe:
+        collegati = risultato.setdefault(str(riga['id']), [])
+        # la join non passa dal manager: i collegati eliminati in modo logico si scartano qui
+        if riga[f'{percorso}__id'] is not None and riga[f'{percorso}__deleted_at'] is None:
+            collegati.append({campo: riga[f'{percorso}__{campo}'] for campo in campi})
+    logger.info("Richiesta batch per %s: %d id richiesti, %d trovati", nome, len(ids), len(risultato))
+    return JsonResponse(risultato)
+
+
+async def _collegati(request, nome, modello, queryset_collegati, messaggio_404):
+    """
+    Parte comune delle viste *_per_* con un solo id: verifica che l'oggetto
+    esista e restituisce la lista (paginata o in streaming) dei collegati.
+    """
+    valore = request.GET.get(nome)
+    if not valore:
+        logger.warning("Parametro '%s' mancante", nome)
+        return HttpResponseBadRequest(f"Missing '{nome}' parameter")
+    try:
+        oggetto = await modello.objects.aget(id=valore)
+    except modello.DoesNotExist:
+        logger.error("%s (id %s)", messaggio_404, valore)
+        return JsonResponse({'error': messaggio_404}, status=404)
+    logger.info("Richiesta %s per l'id %s", nome, valore)
+    return await risposta_lista_async(request, queryset_collegati(oggetto))
+
+
+async def lista_ristoranti(request):
+    """
+    Vista asincrona per ottenere la lista di tutti i ristoranti.
+    Metodo: GET
+    Parametri opzionali: vedi views.lista_ristoranti
+    """
+    logger.info("Richiesta per ottenere la lista di tutti i ristoranti")
+    return await risposta_lista_async(request, Ristorante.objects.all().values())
+
+async def menu_ristoranti(request):
+    """
+    Vista asincrona per ottenere i ristoranti con il loro menu.
+    Metodo: GET
+    Parametri: vedi views.menu_ristoranti
+    """
+    logger.info("Richiesta per ottenere i menu dei ristoranti")
+    if request.method != 'GET':
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        profondita, limite, dopo = _parametri_menu(request)
+    except ValueError as e:
+        logger.warning("Parametri del menu non validi: %s", e)
+        return HttpResponseBadRequest(str(e))
+    # prefetch_related e costruzione dell'albero fuori dall'event loop
+    risultati, successivo = await sync_to_async(menu.menu_ristoranti)(limite, dopo, profondita)
+    return JsonResponse({'results': risultati, 'next': successivo})
+
+async def menu_ristorante(request, ristorante_id):
+    """
+    Vista asincrona per ottenere il menu di un ristorante.
+    Metodo: GET
+    Parametri: vedi views.menu_ristorante
+    """
+    logger.info("Richiesta per ottenere il menu del ristorante %s", ristorante_id)
+    if request.method != 'GET':
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        profondita = _profondita(request)
+    except ValueError as e:
+        logger.warning("Parametri del menu non validi: %s", e)
+        return HttpResponseBadRequest(str(e))
+    risultato = await sync_to_async(menu.menu_ristorante)(ristorante_id, profondita)
+    if risultato is None:
+        logger.error("Ristorante con id %s non trovato", ristorante_id)
+        return JsonResponse({'error': 'Ristorante non trovato'}, status=404)
+    return JsonResponse(risultato)
+
+@csrf_exempt
+@risposta_in_cache('ricetta_id')
+async def ristoranti_per_ricetta(request):
+    """
+    Vista asincrona per ottenere i ristoranti che cucinano una specifica ricetta.
+    Metodo: GET (POST per la modalità batch)
+    Parametri: vedi views.ristoranti_per_ricetta
+    """
+    logger.info("Richiesta per ottenere i ristoranti che cucinano una specifica ricetta")
+    if _is_batch(request, 'ricetta_id'):
+        return await _risposta_batch(request, 'ricetta_id', Ricetta, 'ristorantetoricetta__ristorante', Ristorante)
+    if request.method == 'GET':
+        return await _collegati(
+            request, 'ricetta_id', Ricetta,
+            lambda ricetta: Ristorante.objects.filter(ristorantetoricetta__ricetta=ricetta).values(),
+            'Ricetta non trovata',
+        )
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+@csrf_exempt
+@risposta_in_cache('ristorante_id')
+async def ricette_per_ristorante(request):
+    """
+    Vista asincrona per ottenere le ricette relative ad un ristorante specificato.
+    Metodo: GET (POST per la modalità batch)
+    Parametri: vedi views.ricette_per_ristorante
+    """
+    logger.info("Richiesta per ottenere le ricette relative ad un ristorante specificato")
+    if _is_batch(request, 'ristorante_id'):
+        return await _risposta_batch(request, 'ristorante_id', Ristorante, 'ristorantetoricetta__ricetta', Ricetta)
+    if request.method == 'GET':
+        return await _collegati(
+            request, 'ristorante_id', Ristorante,
+            lambda ristorante: Ricetta.objects.filter(ristorantetoricetta__ristorante=ristorante).values(),
+            'Ristorante non trovato',
+        )
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+@csrf_exempt
+@risposta_in_cache('ingrediente_id')
+async def ricette_per_ingrediente(request):
+    """
+    Vista asincrona per ottenere le ricette che contengono un ingrediente specificato.
+    Metodo: GET (POST per la modalità batch)
+    Parametri: vedi views.ricette_per_ingrediente
+    """
+    logger.info("Richiesta per ottenere le ricette che contengono un ingrediente specificato")
+    if _is_batch(request, 'ingrediente_id'):
+        return await _risposta_batch(request, 'ingrediente_id', Ingrediente, 'ricettatoingrediente__ricetta', Ricetta)
+    if request.method == 'GET':
+        return await _collegati(
+            request, 'ingrediente_id', Ingrediente,
+            lambda ingrediente: Ricetta.objects.filter(ricettatoingrediente__ingrediente=ingrediente).values(),
+            'Ingrediente non trovato',
+        )
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+@csrf_exempt
+@risposta_in_cache('ricetta_id')
+async def ingredienti_per_ricetta(request):
+    """
+    Vista asincrona per ottenere gli ingredienti relativi ad una ricetta specificata.
+    Metodo: GET (POST per la modalità batch)
+    Parametri: vedi views.ingredienti_per_ricetta
+    """
+    logger.info("Richiesta per ottenere gli ingredienti relativi ad una ricetta specificata")
+    if _is_batch(request, 'ricetta_id'):
+        return await _risposta_batch(request, 'ricetta_id', Ricetta, 'ricettatoingrediente__ingrediente', Ingrediente)
+    if request.method == 'GET':
+        return await _collegati(
+            request, 'ricetta_id', Ricetta,
+            lambda ricetta: Ingrediente.objects.filter(ricettatoingrediente__ricetta=ricetta).values(),
+            'Ricetta non trovata',
+        )
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+@csrf_exempt
+@risposta_in_cache('ristorante_id')
+async def ingredienti_per_ristorante(request):
+    """
+    Vista asincrona per ottenere gli ingredienti utilizzati in uno specifico ristorante.
+    Metodo: GET (POST per la modalità batch)
+    Parametri: vedi views.ingredienti_per_ristorante
+    """
+    logger.info("Richiesta per ottenere gli ingredienti utilizzati in uno specifico ristorante")
+    if _is_batch(request, 'ristorante_id'):
+        return await _risposta_batch(request, 'ristorante_id', Ristorante, 'ristoranteingrediente__ingrediente', Ingrediente)
+    if request.method == 'GET':
+        ristorante_id = request.GET.get('ristorante_id')
+        if not ristorante_id:
+            logger.warning("Parametro 'ristorante_id' mancante")
+            return HttpResponseBadRequest("Missing 'ristorante_id' parameter")
+        # scansione dell'indice (ristorante, ingrediente) della tabella materializzata;
+        # la join sul ristorante esclude quelli eliminati in modo logico
+        ingredienti = Ingrediente.objects.filter(
+            ristoranteingrediente__ristorante_id=ristorante_id,
+            ristoranteingrediente__ristorante__deleted_at__isnull=True,
+        ).values('id', 'ingrediente_text')
+        if request.GET.get('recipe_count') == '1':
+            ingredienti = ingredienti.annotate(recipe_count=F('ristoranteingrediente__recipe_count'))
+
+        async def ristorante_mancante():
+            if await Ristorante.objects.filter(id=ristorante_id).aexists():
+                return None
+            logger.error("Ristorante con id %s non trovato", ristorante_id)
+            return JsonResponse({'error': 'Ristorante non trovato'}, status=404)
+
+        logger.info("Richiesta ingredienti per il ristorante %s", ristorante_id)
+        return await risposta_lista_async(request, ingredienti, se_vuoto=ristorante_mancante)
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+async def ricerca(request):
+    """
+    Vista asincrona per la ricerca full-text.
+    Metodo: GET
+    Parametri: vedi views.ricerca
+    """
+    logger.info("Richiesta di ricerca full-text")
+    if request.method == 'GET':
+        testo = request.GET.get('q', '').strip()
+        if not testo:
+            logger.warning("Parametro 'q' mancante")
+            return HttpResponseBadRequest("Missing 'q' parameter")
+        tipi = [tipo for tipo in request.GET.get('tipo', '').split(',') if tipo]
+        if any(tipo not in TIPI for tipo in tipi):
+            logger.warning("Parametro 'tipo' non valido: %s", tipi)
+            return HttpResponseBadRequest("Invalid 'tipo' parameter")
+        try:
+            limite = int(request.GET.get('limit', app_settings.SEARCH_LIMIT_DEFAULT))
+        except ValueError:
+            logger.warning("Parametro 'limit' non valido")
+            return HttpResponseBadRequest("Invalid 'limit' parameter")
+        limite = max(1, min(limite, app_settings.SEARCH_LIMIT_MAX))
+        # la ricerca usa SQL diretto (FTS5), che l'ORM asincrono non copre
+        risultati = await sync_to_async(cerca)(testo, tipi, limite, prefisso=request.GET.get('prefix') != '0')
+        logger.info("Ricerca '%s': %d risultati", testo, len(risultati))
+        return JsonResponse(risultati, safe=False)
+    else:
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+
+def _interroga_dispensa(ingredienti, max_mancanti, limite):
+    return indice_dispensa().interroga(ingredienti, max_mancanti, limite)
+
+@csrf_exempt
+async def dispensa(request):
+    """
+    Vista asincrona per le ricette e i ristoranti cucinabili con una dispensa.
+    Metodo: GET (oppure POST per dispense grandi)
+    Parametri: vedi views.dispensa
+    """
+    logger.info("Richiesta per le ricette cucinabili con una dispensa")
+    if request.method not in ('GET', 'POST'):
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        ingredienti = _ids_batch(request, 'ingredienti')
+    except ValueError as e:
+        logger.warning("Dispensa non valida: %s", e)
+        return HttpResponseBadRequest(str(e))
+    try:
+        max_mancanti = int(request.GET.get('max_mancanti', 1))
+        limite = int(request.GET.get('limit', app_settings.PANTRY_LIMIT_DEFAULT))
+    except ValueError:
+        logger.warning("Parametri 'max_mancanti' o 'limit' non validi")
+        return HttpResponseBadRequest("Invalid 'max_mancanti' or 'limit' parameter")
+    max_mancanti = max(0, min(max_mancanti, app_settings.PANTRY_MAX_MISSING))
+    limite = max(1, min(limite, app_settings.PAGE_SIZE_MAX))
+    # caricamento dell'indice e calcolo (NumPy) fuori dall'event loop
+    risultato = await sync_to_async(_interroga_dispensa)(ingredienti, max_mancanti, limite)
+    logger.info("Dispensa di %d ingredienti: %d ricette cucinabili", len(ingredienti), len(risultato['ricette']))
+    return JsonResponse(risultato)
+
+def _abbina(ingredienti, punteggio, limite):
+    return _con_nomi(indice_dispensa().abbina(ingredienti, punteggio, limite))
+
+@csrf_exempt
+async def match_ricette(request):
+    """
+    Vista asincrona per ordinare le ricette in base agli ingredienti in comune.
+    Metodo: GET (oppure POST per liste grandi)
+    Parametri: vedi views.match_ricette
+    """
+    logger.info("Richiesta per le ricette con più ingredienti in comune")
+    if request.method not in ('GET', 'POST'):
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        ingredienti = _ids_batch(request, 'ingredienti')
+        punteggio, limite = _parametri_match(request)
+    except ValueError as e:
+        logger.warning("Richiesta di abbinamento non valida: %s", e)
+        return HttpResponseBadRequest(str(e))
+    # caricamento dell'indice e calcolo (NumPy) fuori dall'event loop
+    ricette = await sync_to_async(_abbina)(ingredienti, punteggio, limite)
+    logger.info("Abbinamento di %d ingredienti: %d ricette", len(ingredienti), len(ricette))
+    return JsonResponse({'ricette': ricette})
+
+async def _risposta_statistiche(request, nome):
+    if request.method != 'GET':
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        limite, offset = _parametri_statistiche(request)
+    except ValueError as e:
+        logger.warning("Parametri della classifica non validi: %s", e)
+        return HttpResponseBadRequest(str(e))
+    # calcolo della classifica (GROUP BY e NumPy) fuori dall'event loop
+    return JsonResponse(await sync_to_async(statistiche.pagina)(nome, limite, offset))
+
+async def statistiche_ingredienti(request):
+    """
+    Vista asincrona per la classifica degli ingredienti più usati.
+    Metodo: GET
+    Parametri: vedi views.statistiche_ingredienti
+    """
+    logger.info("Richiesta per la classifica degli ingredienti")
+    return await _risposta_statistiche(request, 'ingredienti')
+
+async def statistiche_ricette(request):
+    """
+    Vista asincrona per la classifica delle ricette per numero di ristoranti.
+    Metodo: GET
+    Parametri: vedi views.statistiche_ingredienti
+    """
+    logger.info("Richiesta per la classifica delle ricette")
+    return await _risposta_statistiche(request, 'ricette')
+
+async def statistiche_ristoranti(request):
+    """
+    Vista asincrona per la classifica dei ristoranti per numero di ingredienti diversi.
+    Metodo: GET
+    Parametri: vedi views.statistiche_ingredienti
+    """
+    logger.info("Richiesta per la classifica dei ristoranti")
+    return await _risposta_statistiche(request, 'ristoranti')
+
+async def modifiche_catalogo(request):
+    """
+    Vista asincrona per ottenere le modifiche del catalogo successive a una sequenza.
+    Metodo: GET
+    Parametri: vedi views.modifiche_catalogo
+    """
+    logger.info("Richiesta per ottenere le modifiche del catalogo")
+    if request.method != 'GET':
+        logger.warning("Metodo di richiesta non valido")
+        return HttpResponseBadRequest("Invalid request method")
+    try:
+        dopo, limite = _parametri_modifiche(request)
+    except ValueError as e:
+        logger.warning("Parametri delle modifiche non validi: %s", e)
+        return HttpResponseBadRequest(str(e))
+    try:
+        return JsonResponse(await sync_to_async(modifiche.pagina)(dopo, limite))
+    except modifiche.SequenzaScaduta as e:
+        return _sequenza_scaduta(e)